@@ -4,11 +4,16 @@ __author__ = 'kk'
 import websocket
 import time
 from EDGE import printer
+from EDGE.web.remote import command_stats
 import configparser
 import re
 import logger
 import json
 import monitor
+import metrics
+import report_codec
+import crash_ring
+import log_upload
 
 __version__ = '210827-1'
 __config_version__ = '210819'
@@ -23,6 +28,10 @@ __print_flag__ = 'printOrder#//'
 __info_flag__ = 'infoOrder#//'
 __info_pc__ = 'pcinfo'
 __info_report__ = 'report'
+__info_encoding_bin__ = 'encoding_bin'
+__info_encoding_json__ = 'encoding_json'
+__info_logs__ = 'logs'
+__info_logs_get__ = 'logs_get_'
 
 
 __return_flag__ = 'return#//'
@@ -31,6 +40,8 @@ __print_error_base__ = (__return_flag__ + 'PrintError_%s')
 __print_info_pc_base__ = (__return_flag__ + 'infoOrder_{"pcinfo":%s}')
 __print_info_report_base__ = (__return_flag__ + 'infoOrder_{"report":%s}')
 __pong_base__ = __return_flag__ + 'Pong_%s'
+__encoding_base__ = __return_flag__ + 'encoding_%s'
+__alert_base__ = __return_flag__ + 'alert_%s'
 
 __ban_flag__ = 'fuckoff#//'
 
@@ -59,8 +70,17 @@ printer_id = None
 printer_name = None
 hospital_id = None
 hospital_name = None
+current_ws = None
+# report/pcinfo 编码方式，服务端协商后切换为二进制帧
+info_binary = False
+# 告警帧需服务端支持，默认关闭，通过config.ini [alert] enable开启
+alert_enable = False
+alert_config = {}
+metrics_enable = False
+metrics_port = metrics.__metrics_port__
 
 m = monitor.Monitor()
+log_uploader = log_upload.LogUploader(busy=printer.busy)
 
 def flag_clean(msg):
     return msg.split(__base_flag__)[1]
@@ -95,9 +115,41 @@ def send_print_error(ws, code, msg):
         ws.send(__print_error_base__ % '打印iframe内容加载超时:' + str(msg))
         return
 
+    if code == -4:
+        # '浏览器驱动失去响应'
+        ws.send(__print_error_base__ % '浏览器驱动失去响应:' + str(msg))
+        return
+
     ws.send(__print_error_base__ % 'unknown error:' + str(msg))
 
 
+def send_pcinfo(ws):
+    if info_binary:
+        ws.send(report_codec.encode_pcinfo(m.get_base_info()), opcode=websocket.ABNF.OPCODE_BINARY)
+    else:
+        ws.send(__print_info_pc_base__ % json.dumps(m.get_base_info()))
+
+
+def on_alert(name, state, value):
+    print('监控告警:', name, state, value)
+    if name == 'mem_low':
+        # 内存不足时新任务先等待，恢复后解除；
+        # cpu_high不参与：CPU负载主要来自本客户端正在渲染的浏览器，等待只会拖慢下一个任务
+        if state == 'firing':
+            printer.pressure.set()
+        else:
+            printer.pressure.clear()
+    ws = current_ws
+    if ws is None:
+        return
+    try:
+        ws.send(__alert_base__ % json.dumps({'name': name, 'state': state, 'value': value,
+                                             'time': int(round(time.time() * 1000))},
+                                            separators=(',', ':')))
+    except Exception as e:
+        print('告警发送失败：', e)
+
+
 def ws_connection(ws_protocol_addr):
     if banned:
         # 被禁止使用，停止自动重连
@@ -126,7 +178,24 @@ def on_message(ws, msg):
         if len(find_send_id) > 0:
             send_id = find_send_id[0].replace('sendId=', '')
 
-        ret_code = printer.print_report(addr)
+        job_start = time.time()
+        job = {}
+        crash_ring.record(crash_ring.KIND_JOB, 'start sendId=%s' % send_id)
+        printer.busy.set()
+        try:
+            ret_code = printer.print_report(addr, job)
+        except Exception as e:
+            job['error'] = str(e)
+            logger.job_log.record(send_id, addr=addr, result=None, **job)
+            raise
+        finally:
+            printer.busy.clear()
+        job_result = 'success' if ret_code == 1 else 'error'
+        metrics.print_jobs.inc(result=job_result)
+        metrics.print_job_seconds.observe(time.time() - job_start, result=job_result)
+        crash_ring.record(crash_ring.KIND_JOB, 'end sendId=%s result=%s' % (send_id, ret_code))
+        logger.job_log.record(send_id, addr=addr, result=ret_code,
+                              duration=int(round((time.time() - job_start) * 1000)), **job)
         if ret_code == 1:
             # '打印成功'
             send_print_success(ws,send_id)
@@ -158,11 +227,31 @@ def on_message(ws, msg):
         ws_connection(server_host)
 
     if __info_flag__ in msg:
+        global info_binary
         order = flag_clean(msg)
         if order == __info_pc__:
-            ws.send(__print_info_pc_base__ % json.dumps(m.get_base_info()))
+            send_pcinfo(ws)
+            # 主机信息仍在后台采集时先回已有部分，采集完成后补发完整信息
+            m.when_base_info_ready(lambda: send_pcinfo(ws))
         elif order == __info_report__:
-            ws.send(__print_info_report_base__ % json.dumps(m.get_report()))
+            if info_binary:
+                ws.send(report_codec.encode_report(m.get_report()), opcode=websocket.ABNF.OPCODE_BINARY)
+            else:
+                ws.send(__print_info_report_base__ % json.dumps(m.get_report()))
+        elif order == __info_encoding_bin__:
+            info_binary = True
+            ws.send(__encoding_base__ % ('bin_%d' % report_codec.__version__))
+        elif order == __info_encoding_json__:
+            info_binary = False
+            ws.send(__encoding_base__ % 'json')
+        elif order == __info_logs__:
+            log_uploader.send_list(ws)
+        elif order.startswith(__info_logs_get__):
+            try:
+                request = json.loads(order[len(__info_logs_get__):] or '{}')
+            except ValueError:
+                request = None
+            log_uploader.start(ws, request)
         else:
             print('unknown order:', order)
 
@@ -181,6 +270,7 @@ def on_error(ws, error):
             type(error) == BrokenPipeError:
         print('正在尝试第%d次重连' % reconnect_count)
         reconnect_count += 1
+        metrics.ws_reconnects.inc()
         if reconnect_count < 65535:
             if reconnect_count < 5:
                 time.sleep(2)
@@ -192,19 +282,26 @@ def on_error(ws, error):
         print('其他error!，')
         print('正在尝试未知错误重连' % reconnect_count)
         reconnect_count += 1
+        metrics.ws_reconnects.inc()
         if reconnect_count < 10:
             time.sleep(60)
             ws_connection(server_host)
 
 
 def on_close(ws, code, msg):
+    global current_ws
+    current_ws = None
+    log_uploader.cancel()
     print("### closed ###", code, msg)
 
 
 def on_open(ws):
     ws.send('login#//%s' % printer_name)
-    global reconnect_count
+    global reconnect_count, current_ws, info_binary
     reconnect_count = 0
+    # 每次连接都回到json，需服务端重新协商
+    info_binary = False
+    current_ws = ws
 
 
 def load_configur():
@@ -222,6 +319,7 @@ def load_configur():
         raise Exception('请检查./config.ini的protocol字段, 当前服务仅仅支持websocket协议，example：ws 或 websocket')
 
     global server_host, printer_id, printer_name, hospital_id, hospital_name
+    global metrics_enable, metrics_port, alert_enable
 
     try:
         server_host = "ws://"+cf.get("server", "host")+':'+cf.get("server", "port")
@@ -234,6 +332,23 @@ def load_configur():
         print(__ini_example__)
         raise Exception('config.ini error')
 
+    # 可选配置：监控告警阈值
+    alert_enable = cf.getboolean("alert", "enable", fallback=False)
+    if cf.has_section("alert"):
+        for key, value in cf.items("alert"):
+            if key in monitor.__alert_default__:
+                try:
+                    alert_config[key] = float(value)
+                except ValueError:
+                    print('config.ini [alert] %s 取值无效，使用默认值：%s' % (key, value))
+
+    # 可选配置：本地指标服务
+    metrics_enable = cf.getboolean("metrics", "enable", fallback=False)
+    metrics_port = cf.getint("metrics", "port", fallback=metrics.__metrics_port__)
+
+    # 可选配置：打印后保留浏览器复用，客户端重启后接管
+    printer.reuse_browser = cf.getboolean("browser", "reuse", fallback=False)
+
 
 if __name__ == "__main__":
     print('本体版本：', __version__)
@@ -241,10 +356,22 @@ if __name__ == "__main__":
     print('chrome最优版本：', __chrome_version__)
 
     logger.start_log()
+    m.start_sampling()
+    # 先读配置：是否复用浏览器决定了启动检查是接管旧浏览器还是新开一个
+    load_configur()
+    printer.stop_stale_browser()
     if not printer.printer_check():
         raise Exception('启动失败')
 
-    load_configur()
+    if alert_enable:
+        m.set_alert(on_alert, alert_config)
+    if metrics_enable:
+        metrics.REGISTRY.register_collector(m.collect_metrics)
+        metrics.REGISTRY.register_collector(lambda: command_stats.GLOBAL_STATS.collect('drims_webdriver'))
+        metrics.start_server(metrics_port)
 
-    ws_connection(server_host)
+    try:
+        ws_connection(server_host)
+    finally:
+        printer.shutdown()
 
@@ -295,3 +295,12 @@ class UnknownMethodException(WebDriverException):
     The requested command matched a known URL but did not match any methods for that URL.
     """
     pass
+
+
+class DriverUnreachableException(WebDriverException):
+    """
+    The driver service stopped answering: the connection failed, or earlier
+    failures opened the connection's circuit breaker and the command was not sent.
+    The session should be replaced.
+    """
+    pass
@@ -1,8 +1,15 @@
 
 from EDGE import web
+from EDGE.common.exceptions import DriverUnreachableException
+from EDGE.web.chrome.service import Service
+from EDGE.web.remote.script_key import ScriptKey
 import time
 import os.path
 import requests
+import metrics
+import crash_ring
+import logger
+import threading
 
 driver_path = r"./printerDriver.exe"
 options = web.EDGEOptions()
@@ -10,14 +17,157 @@ options.add_argument('--headless')
 options.add_argument('--disable-gpu')
 options.add_argument('--ignore-certificate-errors')
 
-def printer_check():
+# 内存不足时由监控告警置位，新任务先等待内存恢复再启动浏览器
+pressure = threading.Event()
+pressure_wait_max = 30
+# 打印任务进行中，后台的日志上传等低优先级工作据此让路
+busy = threading.Event()
+# 可选（config.ini [browser] reuse）：任务成功后保留浏览器给下个任务，
+# 会话信息写入状态文件，客户端重启后直接接管仍在运行的驱动和浏览器
+reuse_browser = False
+browser_state_file = './browser_state.json'
+kept_driver = None
+
+# 轮询等待日志：先输出3条，之后每5秒最多1条
+wait_complete_log = logger.LogPolicy(rate=0.2, burst=3)
+wait_complete_two_log = logger.LogPolicy(rate=0.2, burst=3)
+
+def on_driver_unreachable(connection):
+    # 驱动连续无响应或进程已退出：后续命令立即失败，本次任务结束后浏览器随之替换
+    print('浏览器驱动失去响应：', connection._url)
+    metrics.driver_unreachable.inc()
+    crash_ring.record(crash_ring.KIND_JOB, 'driver unreachable')
+
+
+# 轮询用的探测脚本：比按名调用还短，pin_script 不会安装它，每次直接发送原文（不产生额外请求）
+wait_probe_key = 'wait_probe'
+wait_probe_js = "return document.getElementById(arguments[0])?false:true"
+
+
+def setup_driver(driver):
+    driver.command_executor.on_unreachable = on_driver_unreachable
+    try:
+        driver.pin_script(wait_probe_js, wait_probe_key)
+    except Exception:
+        # 浏览器已启动但还未计入browsers_active，直接关闭，不经过quit_driver
+        driver.quit()
+        raise
+    metrics.browsers_active.inc()
+    return driver
+
+
+def new_driver():
+    return setup_driver(web.EDGE(driver_path, options=options))
+
+
+def attach_driver():
+    driver = web.EDGE.attach(browser_state_file, Service(driver_path))
+    if driver is None:
+        return None
+    print('已接管运行中的浏览器会话：', driver.session_id)
+    return setup_driver(driver)
+
+
+def driver_alive(driver):
+    try:
+        driver.current_url
+        return True
+    except Exception:
+        return False
+
+
+def acquire_driver():
+    global kept_driver
+    if reuse_browser:
+        driver, kept_driver = kept_driver, None
+        if driver is not None and not driver_alive(driver):
+            quit_driver(driver)
+            driver = None
+        if driver is None:
+            driver = attach_driver()
+        if driver is not None:
+            return driver
+    return new_driver()
+
+
+def release_driver(driver):
+    # 任务成功结束：复用模式下保留浏览器，否则关闭
+    global kept_driver
+    if not reuse_browser:
+        quit_driver(driver)
+        return
+    try:
+        driver.get('about:blank')
+        driver.save_state(browser_state_file)
+    except Exception as e:
+        print('浏览器保留失败：', e)
+        quit_driver(driver)
+        return
+    kept_driver = driver
+
+
+def stop_stale_browser():
+    # 未开启复用时，上次以复用模式运行留下的驱动和浏览器不再接管，直接结束
+    if reuse_browser or not os.path.exists(browser_state_file):
+        return
+    killed = web.EDGE.stop_saved(browser_state_file)
+    if killed:
+        print('已结束上次保留的浏览器进程：', killed)
+
+
+def shutdown():
+    # 客户端退出时关闭保留的浏览器
+    global kept_driver
+    driver, kept_driver = kept_driver, None
+    if driver is not None:
+        quit_driver(driver)
+
+
+def quit_driver(driver):
     try:
-        driver = web.EDGE(driver_path, options=options)
-        driver.maximize_window()
-        driver.set_page_load_timeout(10)
-        driver.set_script_timeout(10)
-        driver.implicitly_wait(10)
         driver.quit()
+    finally:
+        metrics.browsers_active.dec()
+        if reuse_browser:
+            web.EDGE.discard_state(browser_state_file)
+
+
+def wait_pressure():
+    waited = 0
+    while pressure.is_set() and waited < pressure_wait_max:
+        if waited == 0:
+            print('系统资源紧张，延迟启动打印')
+        time.sleep(1)
+        waited += 1
+
+
+def setup_timeouts(driver):
+    driver.maximize_window()
+    driver.set_page_load_timeout(10)
+    driver.set_script_timeout(10)
+    driver.implicitly_wait(10)
+
+
+def printer_check():
+    # 复用模式下先接管上次保留的浏览器，可用即检查通过，不再另起一个浏览器
+    global kept_driver
+    if reuse_browser:
+        try:
+            driver = attach_driver()
+        except Exception as e:
+            print('接管上次的浏览器失败：', e)
+            driver = None
+        if driver is not None:
+            if driver_alive(driver):
+                kept_driver = driver
+                return True
+            quit_driver(driver)
+    try:
+        driver = new_driver()
+        try:
+            setup_timeouts(driver)
+        finally:
+            quit_driver(driver)
     except Exception as e:
         print("驱动检查失败，考虑chrome浏览器未安装，或当前文件夹内驱动程序（printerDriver.exe）丢失")
         print(e)
@@ -25,56 +175,114 @@ def printer_check():
     return True
 
 
-def print_report(report_addr):
+def mark_phase(job, phase, start):
+    # 记录各阶段耗时（毫秒），返回下一阶段的起点
+    now = time.time()
+    if job is not None:
+        job.setdefault('phases', {})[phase] = int(round((now - start) * 1000))
+    crash_ring.record(crash_ring.KIND_JOB, 'phase %s done' % phase)
+    return now
+
+
+def mark_error(job, error):
+    if job is not None:
+        job['error'] = str(error)
+    crash_ring.record(crash_ring.KIND_JOB, 'error %s' % error)
+
+
+def abort_unreachable(driver, job, error):
+    print('浏览器驱动失去响应，打印中止：', error)
+    mark_error(job, error)
+    quit_driver(driver)
+    return -4
+
+
+def print_report(report_addr, job=None):
+    phase_start = time.time()
     try:
         response = requests.get(report_addr)
     except Exception as e:
         print('打印地址访问失败：', e)
+        mark_error(job, e)
         return -1
+    phase_start = mark_phase(job, 'request', phase_start)
 
     if response.status_code != 200:
+        mark_error(job, 'http status %d' % response.status_code)
         return response.status_code * -1
 
+    wait_pressure()
+    phase_start = mark_phase(job, 'pressure_wait', phase_start)
     print("打印进程%d已启动" % os.getpid())
 
-    retry_count = 0
-    driver = web.EDGE(driver_path, options=options)
-    driver.maximize_window()
-
-    driver.set_page_load_timeout(10)
-    driver.set_script_timeout(10)
-    driver.implicitly_wait(10)
+    wait_complete_log.reset()
+    wait_complete_two_log.reset()
+    driver = acquire_driver()
+    try:
+        setup_timeouts(driver)
+    except DriverUnreachableException as e:
+        return abort_unreachable(driver, job, e)
+    except Exception:
+        # 浏览器已启动，异常时也要关闭，否则进程和browsers_active计数都会泄漏
+        quit_driver(driver)
+        raise
+    phase_start = mark_phase(job, 'browser_start', phase_start)
 
     try:
         driver.get(report_addr)
+    except DriverUnreachableException as e:
+        return abort_unreachable(driver, job, e)
     except Exception as e:
         print(e)
-        driver.quit()
+        mark_error(job, e)
+        quit_driver(driver)
         return -1
+    phase_start = mark_phase(job, 'page_load', phase_start)
 
-    while driver.execute_script("return document.getElementById('complete')?false:true"):
-        print('wait complete')
+    try:
+        return wait_and_print(driver, job, phase_start)
+    except DriverUnreachableException as e:
+        return abort_unreachable(driver, job, e)
+    except Exception:
+        # wait_and_print自身的出错分支都已关闭浏览器后返回，这里只兜底意外异常
+        quit_driver(driver)
+        raise
+
+
+def wait_and_print(driver, job, phase_start):
+    wait_probe = ScriptKey(wait_probe_key)
+    retry_count = 0
+    while driver.execute_script(wait_probe, 'complete'):
+        wait_complete_log.print('wait complete')
         time.sleep(0.5)
         retry_count +=1
         if retry_count > 150:
             print('打印页面加载超时')
-            driver.quit()
+            mark_phase(job, 'wait_complete', phase_start)
+            mark_error(job, '打印页面加载超时')
+            quit_driver(driver)
             return -2
+    phase_start = mark_phase(job, 'wait_complete', phase_start)
 
     retry_count = 0
     print(driver.execute_script("printScale()"))
+    phase_start = mark_phase(job, 'print_scale', phase_start)
 
-    while driver.execute_script("return document.getElementById('completeTwo')?false:true"):
-        print('wait completeTwo')
+    while driver.execute_script(wait_probe, 'completeTwo'):
+        wait_complete_two_log.print('wait completeTwo')
         time.sleep(1)
         retry_count += 1
         if retry_count > 150:
             print('打印iframe加载超时')
-            driver.quit()
+            mark_phase(job, 'wait_complete_two', phase_start)
+            mark_error(job, '打印iframe加载超时')
+            quit_driver(driver)
             return -3
+    phase_start = mark_phase(job, 'wait_complete_two', phase_start)
 
     time.sleep(1)
-    driver.quit()
+    release_driver(driver)
+    mark_phase(job, 'finish', phase_start)
     print('打印完成')
     return 1
 
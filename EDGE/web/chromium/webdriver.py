@@ -1,11 +1,17 @@
 
+import json
+import os
 from typing import NoReturn
+from EDGE.common.exceptions import WebDriverException
+from EDGE.web.common import utils
 from EDGE.web.common.options import BaseOptions
-from EDGE.web.common.service import Service
+from EDGE.web.common.service import Service, _AttachedProcess, child_pids, pid_alive, process_started
 from EDGE.web.chrome.options import Options as ChromeOptions
 import warnings
 
 from EDGE.web.chromium.remote_connection import ChromiumRemoteConnection
+from EDGE.web.remote.command import Command
+from EDGE.web.remote.remote_connection import CONNECTION_ERRORS
 from EDGE.web.remote.webdriver import WebDriver as RemoteWebDriver
 
 DEFAULT_PORT = 0
@@ -56,18 +62,113 @@ class ChromiumDriver(RemoteWebDriver):
         self.service.start()
 
         try:
+            executor = ChromiumRemoteConnection(
+                remote_server_addr=self.service.service_url,
+                browser_name=browser_name, vendor_prefix=vendor_prefix,
+                keep_alive=keep_alive, ignore_proxy=_ignore_proxy)
+            # a driver process that has exited opens the circuit breaker on the first failure
+            executor.service_alive = self._service_alive
             RemoteWebDriver.__init__(
                 self,
-                command_executor=ChromiumRemoteConnection(
-                    remote_server_addr=self.service.service_url,
-                    browser_name=browser_name, vendor_prefix=vendor_prefix,
-                    keep_alive=keep_alive, ignore_proxy=_ignore_proxy),
+                command_executor=executor,
                 options=options)
         except Exception:
             self.quit()
             raise
         self._is_remote = False
 
+    def _service_alive(self):
+        process = self.service.process
+        return process is not None and process.poll() is None
+
+    def save_state(self, path) -> None:
+        """Save the session for ``attach`` after a restart; the service keeps running."""
+        pid = self.service.process.pid
+        state = {
+            'service_url': self.service.service_url,
+            'port': self.service.port,
+            'session_id': self.session_id,
+            'browser_name': self.command_executor.browser_name,
+            'vendor_prefix': self.vendor_prefix,
+            'caps': self.caps,
+            # [pid, start time], the service first
+            'pids': [[p, process_started(p)] for p in [pid] + child_pids(pid)],
+            'pinned_scripts': self.pinned_scripts,
+            'installed': self._installed,
+        }
+        temp = '%s.tmp' % path
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(temp, path)
+        self.service.detach()
+
+    @staticmethod
+    def discard_state(path) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    @classmethod
+    def stop_saved(cls, path) -> int:
+        """Kill the processes saved by ``save_state`` whose start time still matches."""
+        try:
+            with open(path, encoding='utf-8') as f:
+                pids = json.load(f)['pids']
+        except (OSError, ValueError, KeyError, TypeError):
+            cls.discard_state(path)
+            return 0
+        killed = 0
+        for pid, started in pids:
+            if started is not None and pid_alive(pid, started):
+                process = _AttachedProcess(pid, started)
+                process.kill()
+                process.wait(5)
+                killed += 1
+        cls.discard_state(path)
+        return killed
+
+    @classmethod
+    def attach(cls, path, service: Service):
+        """Take over the session saved by ``save_state``, None if it is gone."""
+        try:
+            with open(path, encoding='utf-8') as f:
+                state = json.load(f)
+            pids = state['pids']
+            session_id = state['session_id']
+            port = state['port']
+        except (OSError, ValueError, KeyError, TypeError):
+            cls.discard_state(path)
+            return None
+        if not all(pid_alive(pid, started) for pid, started in pids) or not utils.is_connectable(port):
+            cls.discard_state(path)
+            return None
+
+        service.port = port
+        executor = ChromiumRemoteConnection(
+            remote_server_addr=service.service_url,
+            browser_name=state['browser_name'], vendor_prefix=state['vendor_prefix'])
+        try:
+            response = executor.execute(Command.GET_CURRENT_URL, {'sessionId': session_id})
+        except (WebDriverException,) + CONNECTION_ERRORS:
+            response = {'status': -1}
+        if response.get('status', 0) != 0:
+            # the service runs but no longer knows the session
+            executor.close()
+            cls.discard_state(path)
+            return None
+
+        service.attach(*pids[0])
+        driver = cls._attached(executor, session_id, state['caps'])
+        driver.vendor_prefix = state['vendor_prefix']
+        driver.port = port
+        driver.service = service
+        driver.pinned_scripts = state.get('pinned_scripts', {})
+        driver._installed = state.get('installed', {})
+        driver._is_remote = False
+        executor.service_alive = driver._service_alive
+        return driver
+
     def launch_app(self, id):
         
         return self.execute("launchApp", {'id': id})
@@ -114,7 +215,8 @@ class ChromiumDriver(RemoteWebDriver):
             # We don't care about the message because something probably has gone wrong
             pass
         finally:
-            self.service.stop()
+            executor = getattr(self, 'command_executor', None)
+            self.service.stop(remote_shutdown=not getattr(executor, 'breaker_open', False))
 
     def create_options(self) -> BaseOptions:
         if self.vendor_prefix == "ms":
@@ -1,6 +1,7 @@
 
 import errno
 import os
+import signal
 import subprocess
 from platform import system
 from subprocess import PIPE
@@ -15,6 +16,90 @@ except ImportError:
     DEVNULL = -3
     _HAS_NATIVE_DEVNULL = False
 
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def process_started(pid):
+    """Start time of a running process, None if unknown."""
+    if psutil is None:
+        return None
+    try:
+        return psutil.Process(pid).create_time()
+    except psutil.Error:
+        return None
+
+
+def child_pids(pid):
+    """Pids of the direct children of a process."""
+    if psutil is None:
+        return []
+    try:
+        return [child.pid for child in psutil.Process(pid).children()]
+    except psutil.Error:
+        return []
+
+
+def pid_alive(pid, started=None):
+    """Whether ``pid`` runs and, if ``started`` is given, was started then."""
+    if psutil is not None:
+        try:
+            process = psutil.Process(pid)
+            # an exited child that was not reaped yet is a zombie, not a running process
+            return process.is_running() and process.status() != psutil.STATUS_ZOMBIE and \
+                (started is None or process.create_time() == started)
+        except psutil.Error:
+            return False
+    if os.name == 'nt':
+        # os.kill would terminate the process; callers also probe the service port
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class _AttachedProcess(object):
+    """Stands in for the ``Popen`` of a service started by an earlier client."""
+    stdin = stdout = stderr = None
+
+    def __init__(self, pid, started=None):
+        self.pid = pid
+        self.started = started
+        self.returncode = None
+
+    def poll(self):
+        if self.returncode is None and not pid_alive(self.pid, self.started):
+            # not our child, the real exit status is unknown
+            self.returncode = 0
+        return self.returncode
+
+    def _signal(self, signum):
+        if self.poll() is not None:
+            return
+        try:
+            os.kill(self.pid, signum)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def terminate(self):
+        self._signal(signal.SIGTERM)
+
+    def kill(self):
+        self._signal(getattr(signal, 'SIGKILL', signal.SIGTERM))
+
+    def wait(self, timeout=30):
+        for _ in range(int(timeout * 10)):
+            if self.poll() is not None:
+                break
+            sleep(0.1)
+        return self.returncode
+
 
 class Service(object):
 
@@ -39,6 +124,14 @@ class Service(object):
         
         return "http://%s" % utils.join_host_port('localhost', self.port)
 
+    def attach(self, pid, started=None):
+        """Adopt a running service process started by an earlier client."""
+        self.process = _AttachedProcess(pid, started)
+
+    def detach(self):
+        """Keep the service running after this client exits, for a later ``attach``."""
+        self._detached = True
+
     def command_line_args(self):
         raise NotImplementedError("This method needs to be implemented in a sub class")
 
@@ -114,8 +207,11 @@ class Service(object):
             else:
                 sleep(1)
 
-    def stop(self):
-        
+    def stop(self, remote_shutdown=True):
+        """
+        Stops the service. ``remote_shutdown=False`` skips asking an unresponsive
+        service to shut down and terminates the process right away.
+        """
         if self.log_file != PIPE and not (self.log_file == DEVNULL and _HAS_NATIVE_DEVNULL):
             try:
                 self.log_file.close()
@@ -125,10 +221,11 @@ class Service(object):
         if not self.process:
             return
 
-        try:
-            self.send_remote_shutdown_command()
-        except TypeError:
-            pass
+        if remote_shutdown:
+            try:
+                self.send_remote_shutdown_command()
+            except TypeError:
+                pass
 
         try:
             if self.process:
@@ -150,6 +247,8 @@ class Service(object):
         # `subprocess.Popen` doesn't send signal on `__del__`;
         # so we attempt to close the launched process when `__del__`
         # is triggered.
+        if getattr(self, '_detached', False):
+            return
         try:
             self.stop()
         except Exception:
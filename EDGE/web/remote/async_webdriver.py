@@ -0,0 +1,427 @@
+# Licensed to the Software Freedom Conservancy (SFC) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The SFC licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+An asyncio flavour of the WebDriver command API.
+
+Each ``AsyncWebDriver`` holds one keep-alive HTTP/1.1 connection to the driver
+service and no thread, so a single event loop can drive many sessions::
+
+    async with AsyncWebDriver('http://localhost:9515', options=options) as driver:
+        await driver.get(url)
+        pdf = await driver.print_page()
+
+Routes, request bodies and response parsing are shared with ``RemoteConnection``
+and errors are raised by the same ``ErrorHandler`` as the synchronous driver.
+"""
+
+import asyncio
+import logging
+import socket
+import time
+from typing import List, Optional
+from urllib import parse
+
+from .command import Command
+from .errorhandler import ErrorHandler
+from .remote_connection import CONNECTION_ERRORS, LAST_RESPONSE, RemoteConnection
+from .webdriver import WebDriver, _make_w3c_caps
+
+from EDGE.common.exceptions import InvalidArgumentException, WebDriverException
+from EDGE.web.common.by import By
+from EDGE.web.common.print_page_options import PrintOptions
+from EDGE.web.common.utils import keys_to_typing
+
+LOGGER = logging.getLogger(__name__)
+
+_CONNECTION_ERRORS = CONNECTION_ERRORS + (asyncio.TimeoutError, asyncio.IncompleteReadError)
+_IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'DELETE'))
+
+
+class AsyncHTTPConnection(object):
+    """
+    A single keep-alive HTTP/1.1 connection built on asyncio streams.
+
+    Requests on one connection are serialized; a connection closed by the
+    server while idle is reopened. A request is only sent again on a fresh
+    connection when it is safe to repeat, a POST is never sent twice.
+    """
+
+    def __init__(self, host, port, use_ssl=False, timeout=None, host_header=None):
+        self.host = host
+        self.port = port
+        self.host_header = host_header or '{}:{}'.format(host, port)
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self._reader = None
+        self._writer = None
+        # created on first use so it binds to the running loop
+        self._lock = None
+
+    async def _open(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port, ssl=self.use_ssl or None)
+        sock = self._writer.get_extra_info('socket')
+        if sock is not None:
+            try:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except OSError:
+                pass
+
+    async def request(self, method, path, body=None, headers=None):
+        """
+        :Returns:
+          ``(status, headers, data)``; header names are lower case.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._reader is not None and self._reader.at_eof():
+                self.close()
+            reused = self._writer is not None
+            if not reused:
+                await self._open()
+            try:
+                return await self._roundtrip(method, path, body, headers)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self.close()
+                if not reused or method not in _IDEMPOTENT_METHODS:
+                    raise
+            await self._open()
+            return await self._roundtrip(method, path, body, headers)
+
+    async def _roundtrip(self, method, path, body, headers):
+        try:
+            if self.timeout is None:
+                return await self._exchange(method, path, body, headers)
+            return await asyncio.wait_for(self._exchange(method, path, body, headers), self.timeout)
+        except BaseException:
+            # a half read response would corrupt the next one
+            self.close()
+            raise
+
+    async def _exchange(self, method, path, body, headers):
+        lines = ['{} {} HTTP/1.1'.format(method, path), 'Host: ' + self.host_header]
+        for name, value in (headers or {}).items():
+            lines.append('{}: {}'.format(name, value))
+        body = body or b''
+        if body or method in ('POST', 'PUT'):
+            lines.append('Content-Length: {}'.format(len(body)))
+        self._writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await self._writer.drain()
+
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise ConnectionResetError('connection closed by the driver service')
+        status = int(status_line.split(None, 2)[1])
+        response_headers = {}
+        while True:
+            line = await self._reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self._reader.readline()).split(b';', 1)[0], 16)
+                if size == 0:
+                    await self._reader.readline()
+                    break
+                chunks.append(await self._reader.readexactly(size))
+                await self._reader.readexactly(2)
+            data = b''.join(chunks)
+        elif 'content-length' in response_headers:
+            data = await self._reader.readexactly(int(response_headers['content-length']))
+        else:
+            data = await self._reader.read()
+            self.close()
+        if response_headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, response_headers, data
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+
+class AsyncRemoteConnection(RemoteConnection):
+    """
+    ``RemoteConnection`` whose ``execute`` is a coroutine.
+    Without ``timeout`` each request waits at most ``request_timeout()`` seconds.
+    """
+
+    timeout_errors = RemoteConnection.timeout_errors + (asyncio.TimeoutError,)
+
+    def __init__(self, remote_server_addr, timeout=None):
+        RemoteConnection.__init__(self, remote_server_addr, keep_alive=False, ignore_proxy=True)
+        parsed = parse.urlparse(self._url)
+        use_ssl = parsed.scheme == 'https'
+        self._prefix = '{}://{}'.format(parsed.scheme, parsed.netloc)
+        self._http = AsyncHTTPConnection(parsed.hostname, parsed.port or (443 if use_ssl else 80),
+                                         use_ssl=use_ssl, host_header=parsed.netloc,
+                                         timeout=self.request_timeout() if timeout is None else timeout)
+
+    async def execute(self, command, params):
+        method, url, data = self._prepare(command, params)
+        self._check_breaker(command)
+        LAST_RESPONSE.set(None)
+        started = time.perf_counter()
+        try:
+            response = await self._request(method, url, body=data)
+        except _CONNECTION_ERRORS as e:
+            raise self._connection_failed(command, e) from e
+        finally:
+            self._record(command, started, data)
+        self._connection_ok()
+        return response
+
+    async def _request(self, method, url, body=None):
+        LOGGER.debug(f"{method} {url} {body}")
+        if body and method != 'POST' and method != 'PUT':
+            body = None
+        url = parse.urljoin(self._url + '/', url)
+        if not url.startswith(self._prefix + '/'):
+            raise WebDriverException('Redirected away from the driver service: {}'.format(url))
+        statuscode, headers, data = await self._http.request(method, url[len(self._prefix):], body=body,
+                                                             headers=self._headers)
+        LAST_RESPONSE.set((statuscode, len(data)))
+        if 300 <= statuscode < 304:
+            return await self._request('GET', headers.get('location'))
+        return self._parse_response(statuscode, headers.get('content-type'), data)
+
+    async def close(self):
+        self._http.close()
+
+
+class AsyncWebElement(object):
+    """
+    A DOM element of an ``AsyncWebDriver`` session.
+    """
+
+    def __init__(self, parent, id_):
+        self._parent = parent
+        self._id = id_
+
+    def __repr__(self):
+        return '<{0.__module__}.{0.__name__} (session="{1}", element="{2}")>'.format(
+            type(self), self._parent.session_id, self._id)
+
+    @property
+    def parent(self):
+        return self._parent
+
+    @property
+    def id(self) -> str:
+        return self._id
+
+    def __eq__(self, element):
+        return hasattr(element, 'id') and self._id == element.id
+
+    def __ne__(self, element):
+        return not self.__eq__(element)
+
+    def __hash__(self):
+        return hash(self._id)
+
+    async def _execute(self, command, params=None):
+        if not params:
+            params = {}
+        params['id'] = self._id
+        return await self._parent.execute(command, params)
+
+    async def text(self) -> str:
+        return (await self._execute(Command.GET_ELEMENT_TEXT))['value']
+
+    async def click(self) -> None:
+        await self._execute(Command.CLICK_ELEMENT)
+
+    async def send_keys(self, *value) -> None:
+        await self._execute(Command.SEND_KEYS_TO_ELEMENT,
+                            {'text': "".join(keys_to_typing(value)),
+                             'value': keys_to_typing(value)})
+
+    async def get_property(self, name):
+        return (await self._execute(Command.GET_ELEMENT_PROPERTY, {'name': name}))['value']
+
+    async def get_dom_attribute(self, name) -> str:
+        return (await self._execute(Command.GET_ELEMENT_ATTRIBUTE, {'name': name}))['value']
+
+    async def rect(self) -> dict:
+        return (await self._execute(Command.GET_ELEMENT_RECT))['value']
+
+    async def screenshot_as_base64(self) -> str:
+        return (await self._execute(Command.ELEMENT_SCREENSHOT))['value']
+
+    async def find_element(self, by=By.ID, value=None):
+        by, value = _css_locator(by, value)
+        return (await self._execute(Command.FIND_CHILD_ELEMENT, {'using': by, 'value': value}))['value']
+
+    async def find_elements(self, by=By.ID, value=None):
+        by, value = _css_locator(by, value)
+        return (await self._execute(Command.FIND_CHILD_ELEMENTS, {'using': by, 'value': value}))['value'] or []
+
+
+def _css_locator(by, value):
+    # same translation as WebDriver.find_element for W3C endpoints
+    if by == By.ID:
+        return By.CSS_SELECTOR, '[id="%s"]' % value
+    if by == By.TAG_NAME:
+        return By.CSS_SELECTOR, value
+    if by == By.CLASS_NAME:
+        return By.CSS_SELECTOR, ".%s" % value
+    if by == By.NAME:
+        return By.CSS_SELECTOR, '[name="%s"]' % value
+    return by, value
+
+
+class AsyncWebDriver(object):
+    """
+    Drive a WebDriver session from asyncio.
+
+    The driver service is not started here; pass the url of a running one, e.g.
+    ``Service.service_url``. The session is created by ``start_session``, by
+    ``create`` or on entering ``async with``.
+
+    :Args:
+     - command_executor - The service url, or an ``AsyncRemoteConnection``.
+     - options - Browser options whose capabilities are used for the new session.
+     - timeout - Per command timeout in seconds, None for ``RemoteConnection.request_timeout()``.
+    """
+
+    _web_element_cls = AsyncWebElement
+
+    # the synchronous driver's marshalling only depends on _web_element_cls and create_web_element
+    _wrap_value = WebDriver._wrap_value
+    _unwrap_value = WebDriver._unwrap_value
+
+    def __init__(self, command_executor='http://127.0.0.1:4444', options=None, timeout=None):
+        if isinstance(command_executor, (str, bytes)):
+            command_executor = AsyncRemoteConnection(command_executor, timeout=timeout)
+        self.command_executor = command_executor
+        self.options = options
+        self.session_id = None
+        self.caps = {}
+        self.error_handler = ErrorHandler()
+
+    def __repr__(self):
+        return '<{0.__module__}.{0.__name__} (session="{1}")>'.format(
+            type(self), self.session_id)
+
+    @property
+    def command_stats(self):
+        return self.command_executor.stats
+
+    @classmethod
+    async def create(cls, command_executor='http://127.0.0.1:4444', options=None, timeout=None):
+        driver = cls(command_executor, options=options, timeout=timeout)
+        await driver.start_session()
+        return driver
+
+    async def __aenter__(self):
+        if self.session_id is None:
+            await self.start_session()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.quit()
+
+    async def start_session(self, capabilities: dict = None) -> None:
+        if capabilities is None:
+            capabilities = self.options.to_capabilities() if self.options else {}
+        if not isinstance(capabilities, dict):
+            raise InvalidArgumentException("Capabilities must be a dictionary")
+        parameters = {"capabilities": _make_w3c_caps(capabilities),
+                      "desiredCapabilities": capabilities}
+        response = await self.execute(Command.NEW_SESSION, parameters)
+        if 'sessionId' not in response:
+            response = response['value']
+        self.session_id = response['sessionId']
+        self.caps = response.get('value')
+        if not self.caps:
+            self.caps = response.get('capabilities')
+
+    def create_web_element(self, element_id: str) -> AsyncWebElement:
+        return self._web_element_cls(self, element_id)
+
+    async def execute(self, driver_command: str, params: dict = None) -> dict:
+        if self.session_id:
+            if not params:
+                params = {'sessionId': self.session_id}
+            elif 'sessionId' not in params:
+                params['sessionId'] = self.session_id
+
+        params = self._wrap_value(params)
+        response = await self.command_executor.execute(driver_command, params)
+        if response:
+            self.error_handler.check_response(response)
+            response['value'] = self._unwrap_value(
+                response.get('value', None))
+            return response
+        return {'success': 0, 'value': None, 'sessionId': self.session_id}
+
+    async def get(self, url: str) -> None:
+        await self.execute(Command.GET, {'url': url})
+
+    async def title(self) -> str:
+        return (await self.execute(Command.GET_TITLE))['value']
+
+    async def current_url(self) -> str:
+        return (await self.execute(Command.GET_CURRENT_URL))['value']
+
+    async def execute_script(self, script, *args):
+        return (await self.execute(Command.W3C_EXECUTE_SCRIPT, {
+            'script': script,
+            'args': list(args)}))['value']
+
+    async def execute_async_script(self, script: str, *args):
+        return (await self.execute(Command.W3C_EXECUTE_SCRIPT_ASYNC, {
+            'script': script,
+            'args': list(args)}))['value']
+
+    async def find_element(self, by=By.ID, value=None) -> AsyncWebElement:
+        by, value = _css_locator(by, value)
+        return (await self.execute(Command.FIND_ELEMENT, {
+            'using': by,
+            'value': value}))['value']
+
+    async def find_elements(self, by=By.ID, value=None) -> List[AsyncWebElement]:
+        by, value = _css_locator(by, value)
+        return (await self.execute(Command.FIND_ELEMENTS, {
+            'using': by,
+            'value': value}))['value'] or []
+
+    async def print_page(self, print_options: Optional[PrintOptions] = None) -> str:
+        options = {}
+        if print_options:
+            options = print_options.to_dict()
+        return (await self.execute(Command.PRINT_PAGE, options))['value']
+
+    async def get_screenshot_as_base64(self) -> str:
+        return (await self.execute(Command.SCREENSHOT))['value']
+
+    async def close(self) -> None:
+        await self.execute(Command.CLOSE)
+
+    async def quit(self) -> None:
+        try:
+            if self.session_id is not None:
+                await self.execute(Command.QUIT)
+        finally:
+            self.session_id = None
+            await self.command_executor.close()
@@ -0,0 +1,131 @@
+# Licensed to the Software Freedom Conservancy (SFC) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The SFC licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Per command counters for the WebDriver transport.
+
+Every ``RemoteConnection`` records into its own ``CommandStats`` and into the
+process wide ``GLOBAL_STATS``: number of calls, failures, a latency histogram
+and request / response body sizes, keyed by ``Command`` name.
+"""
+
+import bisect
+import threading
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# positions in the per command state list
+_COUNT, _ERRORS, _SECONDS, _REQUEST_BYTES, _RESPONSE_BYTES, _BUCKETS = range(6)
+
+
+class CommandStats(object):
+    """
+    :Args:
+     - parent - Another ``CommandStats`` that receives every record as well.
+     - buckets - Upper bounds in seconds of the latency histogram.
+    """
+
+    def __init__(self, parent=None, buckets=LATENCY_BUCKETS):
+        self.parent = parent
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._commands = {}
+
+    def record(self, command, seconds, request_bytes=0, response_bytes=0, error=False):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            state = self._commands.get(command)
+            if state is None:
+                # each bucket counts only its own range; made cumulative on export
+                state = self._commands[command] = [0, 0, 0.0, 0, 0, [0] * (len(self.buckets) + 1)]
+            state[_COUNT] += 1
+            if error:
+                state[_ERRORS] += 1
+            state[_SECONDS] += seconds
+            state[_REQUEST_BYTES] += request_bytes
+            state[_RESPONSE_BYTES] += response_bytes
+            state[_BUCKETS][index] += 1
+        if self.parent is not None:
+            self.parent.record(command, seconds, request_bytes, response_bytes, error)
+
+    def reset(self):
+        with self._lock:
+            self._commands = {}
+
+    def snapshot(self):
+        """
+        :Returns:
+          ``{command: {'count', 'errors', 'seconds', 'request_bytes', 'response_bytes', 'buckets'}}``
+          where ``buckets`` holds cumulative counts for ``self.buckets`` followed by +Inf.
+        """
+        with self._lock:
+            items = [(command, list(state[:_BUCKETS]), list(state[_BUCKETS]))
+                     for command, state in self._commands.items()]
+        result = {}
+        for command, (count, errors, seconds, request_bytes, response_bytes), counts in items:
+            cumulative = []
+            total = 0
+            for bucket_count in counts:
+                total += bucket_count
+                cumulative.append(total)
+            result[command] = {'count': count, 'errors': errors, 'seconds': seconds,
+                               'request_bytes': request_bytes, 'response_bytes': response_bytes,
+                               'buckets': cumulative}
+        return result
+
+    def summary(self, k=None):
+        """
+        Commands ordered by the time spent in them, with their share of the total.
+        """
+        snapshot = self.snapshot()
+        total = sum(item['seconds'] for item in snapshot.values()) or 1.0
+        rows = []
+        for command, item in snapshot.items():
+            rows.append({'command': command, 'count': item['count'], 'errors': item['errors'],
+                         'seconds': item['seconds'], 'share': item['seconds'] / total,
+                         'mean': item['seconds'] / item['count'] if item['count'] else 0.0})
+        rows.sort(key=lambda row: row['seconds'], reverse=True)
+        return rows if k is None else rows[:k]
+
+    def collect(self, prefix='webdriver'):
+        """
+        Metric families ``[(name, type, help, [(suffix, labels, value), ...]), ...]``.
+        """
+        snapshot = self.snapshot()
+        commands = sorted(snapshot)
+        latency = []
+        for command in commands:
+            item = snapshot[command]
+            for bound, count in zip(self.buckets + ('+Inf',), item['buckets']):
+                le = bound if bound == '+Inf' else '%g' % bound
+                latency.append(('_bucket', {'command': command, 'le': le}, count))
+            latency.append(('_count', {'command': command}, item['count']))
+            latency.append(('_sum', {'command': command}, item['seconds']))
+        return [
+            (prefix + '_commands', 'counter', 'WebDriver commands sent',
+             [('_total', {'command': c}, snapshot[c]['count']) for c in commands]),
+            (prefix + '_command_errors', 'counter', 'WebDriver commands failed',
+             [('_total', {'command': c}, snapshot[c]['errors']) for c in commands]),
+            (prefix + '_command_seconds', 'histogram', 'WebDriver command latency', latency),
+            (prefix + '_command_request_bytes', 'counter', 'WebDriver request body bytes',
+             [('_total', {'command': c}, snapshot[c]['request_bytes']) for c in commands]),
+            (prefix + '_command_response_bytes', 'counter', 'WebDriver response body bytes',
+             [('_total', {'command': c}, snapshot[c]['response_bytes']) for c in commands]),
+        ]
+
+
+GLOBAL_STATS = CommandStats()
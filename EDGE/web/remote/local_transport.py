@@ -0,0 +1,304 @@
+# Licensed to the Software Freedom Conservancy (SFC) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The SFC licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+A small keep-alive HTTP transport for driver services on the loopback interface.
+
+The driver service (chromedriver / msedgedriver) always listens on localhost, so
+proxy detection, TLS setup, retries and redirect bookkeeping of a full
+``urllib3.PoolManager`` are pure overhead. ``LocalConnectionPool`` keeps a few
+persistent ``http.client`` connections with TCP_NODELAY set and exposes the
+subset of the urllib3 interface ``RemoteConnection`` uses.
+"""
+
+import collections
+import http.client
+import select
+import socket
+import threading
+from urllib import parse
+
+LOOPBACK_HOSTS = frozenset(('localhost', '127.0.0.1', '::1'))
+# requests that may be sent again after the service dropped the connection mid-response
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'DELETE'))
+
+
+def is_dropped(conn):
+    """
+    Whether an idle keep-alive connection was closed by the service.
+    An idle connection has nothing to read, so a readable socket means EOF (or garbage).
+    """
+    if conn.sock is None:
+        return True
+    try:
+        return bool(select.select([conn.sock], [], [], 0)[0])
+    except (OSError, ValueError):
+        return True
+
+
+def is_loopback_url(url):
+    """
+    Whether ``url`` is a plain http url on the loopback interface.
+    """
+    parsed = parse.urlparse(url)
+    if parsed.scheme != 'http' or parsed.username:
+        return False
+    host = parsed.hostname or ''
+    return host in LOOPBACK_HOSTS or host.startswith('127.')
+
+
+class LocalResponse(object):
+    """
+    The part of ``urllib3.HTTPResponse`` used by ``RemoteConnection``.
+    The body is always read in full before the connection is reused.
+    """
+
+    def __init__(self, status, headers, data):
+        self.status = status
+        self.headers = headers
+        self.data = data
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
+
+    def close(self):
+        pass
+
+
+class LocalStreamResponse(object):
+    """
+    An unread response, mirroring ``urllib3.HTTPResponse`` with ``preload_content=False``.
+    """
+
+    def __init__(self, pool, conn, response):
+        self._pool = pool
+        self._conn = conn
+        self._response = response
+        self.status = response.status
+        self.headers = response.headers
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
+
+    def stream(self, amt=65536):
+        while True:
+            data = self._response.read(amt)
+            if not data:
+                break
+            yield data
+
+    def read(self):
+        return self._response.read()
+
+    def release_conn(self):
+        if self._conn is None:
+            return
+        if self._response.isclosed():
+            # fully read, the connection can serve the next request
+            self._pool._release(self._conn, self._response)
+        else:
+            self._conn.close()
+        self._conn = None
+
+    def close(self):
+        self.release_conn()
+
+
+class LocalConnectionPool(object):
+    """
+    Persistent ``http.client`` connections to one loopback service.
+
+    :Args:
+     - remote_server_addr - The service url, e.g. ``http://localhost:9515``.
+     - timeout - Socket timeout for connecting and for each read of a response.
+     - maxsize - Number of idle connections kept open.
+    """
+
+    def __init__(self, remote_server_addr, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, maxsize=4):
+        parsed = parse.urlparse(remote_server_addr)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.timeout = timeout
+        self.maxsize = maxsize
+        self._prefix = '{}://{}'.format(parsed.scheme, parsed.netloc)
+        # 'localhost' may resolve to ::1 first while the service only listens on
+        # 127.0.0.1; remember the address that worked instead of resolving per connection
+        self._address = None
+        self._idle = collections.deque()
+        self._lock = threading.Lock()
+        self._fallback = None
+
+    def _connect(self):
+        sock = None
+        if self._address is not None:
+            try:
+                sock = socket.create_connection(self._address, self.timeout)
+            except OSError:
+                self._address = None
+        if sock is None:
+            sock = socket.create_connection((self.host, self.port), self.timeout)
+            self._address = sock.getpeername()[:2]
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError:
+            pass
+        return sock
+
+    def _new_connection(self):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        conn.sock = self._connect()
+        return conn
+
+    def _fallback_manager(self):
+        # only used when the service redirects off the loopback address
+        if self._fallback is None:
+            import urllib3
+            self._fallback = urllib3.PoolManager(timeout=self.timeout)
+        return self._fallback
+
+    def request(self, method, url, body=None, headers=None, preload_content=True):
+        """
+        Send a request. With ``preload_content=False`` the body is left unread and a
+        ``LocalStreamResponse`` is returned; the caller must ``release_conn`` it.
+        """
+        if not url.startswith(self._prefix + '/'):
+            return self._fallback_manager().request(method, url, body=body, headers=headers,
+                                                    preload_content=preload_content)
+        path = url[len(self._prefix):]
+        conn = self._take_idle()
+        if conn is None:
+            return self._send(self._new_connection(), method, path, body, headers, preload_content)
+        return self._send(conn, method, path, body, headers, preload_content, reused=True)
+
+    def _take_idle(self):
+        dropped = []
+        conn = None
+        with self._lock:
+            while self._idle:
+                conn = self._idle.pop()
+                if not is_dropped(conn):
+                    break
+                dropped.append(conn)
+                conn = None
+        for stale in dropped:
+            stale.close()
+        return conn
+
+    def _send(self, conn, method, path, body, headers, preload_content=True, reused=False):
+        """
+        Send one request on ``conn``. A reused connection that fails is replaced once, but
+        only when the request cannot have reached the service (the send itself failed) or
+        when it is safe to repeat; a POST is never sent twice.
+        """
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+        except ConnectionError:
+            conn.close()
+            if not reused:
+                raise
+            return self._send(self._new_connection(), method, path, body, headers, preload_content)
+        except Exception:
+            conn.close()
+            raise
+        try:
+            resp = conn.getresponse()
+            if not preload_content:
+                return LocalStreamResponse(self, conn, resp)
+            data = resp.read()
+        except ConnectionError:
+            conn.close()
+            if not reused or method not in IDEMPOTENT_METHODS:
+                raise
+            return self._send(self._new_connection(), method, path, body, headers, preload_content)
+        except Exception:
+            conn.close()
+            raise
+        self._release(conn, resp)
+        return LocalResponse(resp.status, resp.headers, data)
+
+    def _release(self, conn, resp):
+        if resp.will_close:
+            conn.close()
+            return
+        with self._lock:
+            if len(self._idle) < self.maxsize:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def clear(self):
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+        for conn in idle:
+            conn.close()
+        if self._fallback is not None:
+            self._fallback.clear()
+
+
+def _benchmark(number=3000):
+    """
+    Commands per second against a local keep-alive server, urllib3 vs this transport.
+
+    Run with ``python -m EDGE.web.remote.local_transport``.
+    """
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    import urllib3
+
+    body = b'{"value":{"element-6066-11e4-a52e-4f735466cecf":"0123456789abcdef"}}'
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # like chromedriver, answer without waiting on Nagle / delayed ACK
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://localhost:%d/session/1/element' % server.server_address[1]
+    headers = {'Accept': 'application/json', 'Content-Type': 'application/json;charset=UTF-8',
+               'Connection': 'keep-alive'}
+    payload = b'{"using":"css selector","value":"#content"}'
+    try:
+        for name, conn in (('urllib3', urllib3.PoolManager()), ('local', LocalConnectionPool(url))):
+            conn.request('POST', url, body=payload, headers=headers)
+            started = time.perf_counter()
+            for _ in range(number):
+                conn.request('POST', url, body=payload, headers=headers).close()
+            elapsed = time.perf_counter() - started
+            conn.clear()
+            print('%-8s %8.0f commands/s  %6.1fus/command' % (name, number / elapsed, elapsed / number * 1e6))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    _benchmark()
@@ -0,0 +1,192 @@
+# Licensed to the Software Freedom Conservancy (SFC) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The SFC licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+
+"""
+Conversion between WebElement objects and their W3C JSON references.
+
+Both directions return at once for scalars (including the large base64 strings of
+screenshots and PDFs) and walk containers with an explicit stack, so deeply
+nested script results cannot hit the recursion limit.
+"""
+
+ELEMENT_KEY = 'element-6066-11e4-a52e-4f735466cecf'
+
+_SCALAR_TYPES = frozenset((str, int, float, bool, type(None), bytes))
+
+
+def _contains_element(value, element_cls):
+    stack = [value]
+    while stack:
+        container = stack.pop()
+        for item in (container.values() if isinstance(container, dict) else container):
+            kind = type(item)
+            if kind in _SCALAR_TYPES:
+                continue
+            if kind is dict or kind is list:
+                if item:
+                    stack.append(item)
+            elif isinstance(item, element_cls):
+                return True
+            elif isinstance(item, (dict, list)) and item:
+                stack.append(item)
+    return False
+
+
+def _wrap_copy(value, element_cls):
+    # copy every dict and list, like the recursive version did, replacing elements on the way
+    root = dict(value) if isinstance(value, dict) else list(value)
+    stack = [root]
+    while stack:
+        container = stack.pop()
+        for key, item in (container.items() if isinstance(container, dict) else enumerate(container)):
+            kind = type(item)
+            if kind in _SCALAR_TYPES:
+                continue
+            # assigning to existing keys does not disturb the iteration
+            if isinstance(item, element_cls):
+                container[key] = {ELEMENT_KEY: item.id}
+            elif isinstance(item, dict):
+                container[key] = copy = dict(item)
+                stack.append(copy)
+            elif isinstance(item, list):
+                container[key] = copy = list(item)
+                stack.append(copy)
+    return root
+
+
+def wrap_value(value, element_cls):
+    """
+    Replace ``element_cls`` instances in command parameters by element references.
+
+    A top-level dict is always at least shallow-copied: ``RemoteConnection`` removes
+    ``sessionId`` from it, and the caller's dict must not change. Nested containers
+    are only copied when an element has to be replaced somewhere inside them.
+    """
+    if isinstance(value, dict):
+        if _contains_element(value, element_cls):
+            return _wrap_copy(value, element_cls)
+        return dict(value)
+    if isinstance(value, element_cls):
+        return {ELEMENT_KEY: value.id}
+    if isinstance(value, list) and _contains_element(value, element_cls):
+        return _wrap_copy(value, element_cls)
+    return value
+
+
+def unwrap_value(value, create_element):
+    """
+    Replace element references in a freshly parsed response by ``create_element(id)``.
+
+    The parsed value belongs to the caller alone, so containers are updated in place.
+    """
+    if type(value) is dict:
+        if ELEMENT_KEY in value:
+            return create_element(value[ELEMENT_KEY])
+    elif type(value) is not list:
+        return value
+    stack = [value]
+    while stack:
+        container = stack.pop()
+        for key, item in (container.items() if type(container) is dict else enumerate(container)):
+            kind = type(item)
+            if kind is dict:
+                if ELEMENT_KEY in item:
+                    container[key] = create_element(item[ELEMENT_KEY])
+                elif item:
+                    stack.append(item)
+            elif kind is list and item:
+                stack.append(item)
+    return value
+
+
+def _benchmark(number=20):
+    """
+    Compare with the former recursive implementation.
+
+    Run with ``python -m EDGE.web.remote.marshalling``.
+    """
+    import base64
+    import copy
+    import json
+    import os
+    import time
+
+    class Element(object):
+        def __init__(self, id_):
+            self.id = id_
+
+    def legacy_wrap(value):
+        if isinstance(value, dict):
+            return {key: legacy_wrap(val) for key, val in value.items()}
+        elif isinstance(value, Element):
+            return {ELEMENT_KEY: value.id}
+        elif isinstance(value, list):
+            return list(legacy_wrap(item) for item in value)
+        return value
+
+    def legacy_unwrap(value):
+        if isinstance(value, dict):
+            if ELEMENT_KEY in value:
+                return Element(value[ELEMENT_KEY])
+            for key, val in value.items():
+                value[key] = legacy_unwrap(val)
+            return value
+        elif isinstance(value, list):
+            return list(legacy_unwrap(item) for item in value)
+        return value
+
+    deep = 'leaf'
+    # deeper nesting makes the recursive version hit the recursion limit
+    for _ in range(150):
+        deep = {'child': [deep, 1]}
+    rows = [{'id': i, 'name': 'row%d' % i, 'cells': [i, i * 2, 'x' * 20]} for i in range(10000)]
+    elements = [{ELEMENT_KEY: 'e%d' % i} for i in range(2000)]
+    pdf = base64.b64encode(os.urandom(8 * 1024 * 1024)).decode('ascii')
+    cases = [
+        ('pdf value', pdf, number),
+        ('deep x150', deep, number),
+        ('10k rows', rows, number),
+        ('2k elements', elements, number),
+    ]
+
+    def per_call(function, values):
+        # every call gets its own freshly parsed value, as in WebDriver.execute
+        values = list(values)
+        started = time.perf_counter()
+        for value in values:
+            function(value)
+        return (time.perf_counter() - started) / len(values) * 1e6
+
+    print('%-12s %14s %14s %14s %14s' % ('', 'unwrap old', 'unwrap new', 'wrap old', 'wrap new'))
+    for name, value, count in cases:
+        raw = json.dumps(value)
+        if isinstance(value, str):
+            # immutable, one parsed copy can be shared
+            parsed = [json.loads(raw)] * count
+            old_unwrap = per_call(legacy_unwrap, parsed)
+            new_unwrap = per_call(lambda v: unwrap_value(v, Element), parsed)
+        else:
+            old_unwrap = per_call(legacy_unwrap, (json.loads(raw) for _ in range(count)))
+            new_unwrap = per_call(lambda v: unwrap_value(v, Element), (json.loads(raw) for _ in range(count)))
+        params = {'script': 'return arguments', 'args': [legacy_unwrap(copy.deepcopy(value))]}
+        old_wrap = per_call(legacy_wrap, [params] * count)
+        new_wrap = per_call(lambda v: wrap_value(v, Element), [params] * count)
+        print('%-12s %12.1fus %12.1fus %12.1fus %12.1fus' % (name, old_unwrap, new_unwrap, old_wrap, new_wrap))
+
+
+if __name__ == '__main__':
+    _benchmark()
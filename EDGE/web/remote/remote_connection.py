@@ -15,9 +15,13 @@
 # specific language governing permissions and limitations
 # under the License.
 
+import binascii
+import contextvars
+import http.client
 import logging
 import socket
 import string
+import time
 
 import os
 import certifi
@@ -31,12 +35,24 @@ try:
 except ImportError:  # above is available in py3+, below is py2.7
     import urlparse as parse
 from EDGE import __version__
+from EDGE.common.exceptions import DriverUnreachableException
 from .command import Command
 from .errorhandler import ErrorCode
 from . import utils
+from .command_stats import CommandStats, GLOBAL_STATS
+from . import local_transport
 
 LOGGER = logging.getLogger(__name__)
 
+# (status, body size) of the last response, set by _request and read by execute for the stats;
+# a context variable so concurrent commands on one connection (threads or asyncio tasks) do not mix
+LAST_RESPONSE = contextvars.ContextVar('last_response', default=None)
+
+# failures of the connection itself, as opposed to error responses from the driver
+CONNECTION_ERRORS = (ConnectionError, socket.timeout, http.client.HTTPException, urllib3.exceptions.HTTPError)
+# a command that ran into the read timeout means the driver hangs
+TIMEOUT_ERRORS = (socket.timeout, urllib3.exceptions.TimeoutError)
+
 
 class RemoteConnection(object):
     """A connection with the Remote WebDriver server.
@@ -44,7 +60,20 @@ class RemoteConnection(object):
 
     browser_name = None
     _timeout = socket._GLOBAL_DEFAULT_TIMEOUT
+    # used for each request while no timeout is set with set_timeout, so a hung driver
+    # fails the command (and counts towards the breaker) instead of blocking forever
+    read_timeout = 60.0
     _ca_certs = certifi.where()
+    # use the lean http.client transport for keep-alive connections to loopback services
+    use_local_transport = True
+    # read size for responses decoded while streaming, see execute_to
+    _stream_chunk_size = 256 * 1024
+    # circuit breaker: after this many consecutive connection failures, or as soon as the
+    # service process is known to be gone, commands fail at once with DriverUnreachableException
+    breaker_threshold = 3
+    # seconds until an open breaker lets a single probe request through
+    breaker_reset = 5.0
+    timeout_errors = TIMEOUT_ERRORS
 
     @classmethod
     def get_timeout(cls):
@@ -71,6 +100,15 @@ class RemoteConnection(object):
         """
         cls._timeout = socket._GLOBAL_DEFAULT_TIMEOUT
 
+    @classmethod
+    def request_timeout(cls):
+        """
+        :Returns:
+            The timeout in seconds applied to each request: the one set with
+            ``set_timeout``, otherwise ``read_timeout``
+        """
+        return cls.read_timeout if cls._timeout == socket._GLOBAL_DEFAULT_TIMEOUT else cls._timeout
+
     @classmethod
     def get_certificate_bundle_path(cls):
         """
@@ -131,7 +169,9 @@ class RemoteConnection(object):
 
     def _get_connection_manager(self):
         pool_manager_init_args = {
-            'timeout': self._timeout
+            'timeout': self.request_timeout(),
+            # a read timeout is not retried, the breaker decides what happens next
+            'retries': urllib3.Retry(3, read=0)
         }
         if self._ca_certs:
             pool_manager_init_args['cert_reqs'] = 'CERT_REQUIRED'
@@ -150,7 +190,21 @@ class RemoteConnection(object):
         self._url = remote_server_addr
         self._proxy_url = self._get_proxy_url() if not ignore_proxy else None
         if keep_alive:
-            self._conn = self._get_connection_manager()
+            if self.use_local_transport and local_transport.is_loopback_url(self._url):
+                # a proxy cannot reach the client's loopback service, so none is looked up
+                self._conn = local_transport.LocalConnectionPool(self._url, timeout=self.request_timeout())
+            else:
+                self._conn = self._get_connection_manager()
+        self._headers = self.get_remote_connection_headers(parse.urlparse(self._url), keep_alive)
+        self._routes = {}
+        self.stats = CommandStats(parent=GLOBAL_STATS)
+        self._failures = 0
+        self._breaker_opened = None
+        self._half_open = False
+        # set by the owner: service_alive() -> bool for a local service process,
+        # on_unreachable(connection) is called once each time the breaker opens
+        self.service_alive = None
+        self.on_unreachable = None
 
         self._commands = {
             Command.STATUS: ('GET', '/status'),
@@ -386,14 +440,130 @@ class RemoteConnection(object):
          - params - A dictionary of named parameters to send with the command as
            its JSON payload.
         """
+        method, url, data = self._prepare(command, params)
+        self._check_breaker(command)
+        LAST_RESPONSE.set(None)
+        started = time.perf_counter()
+        try:
+            response = self._request(method, url, body=data)
+        except CONNECTION_ERRORS as e:
+            raise self._connection_failed(command, e) from e
+        finally:
+            self._record(command, started, data)
+        self._connection_ok()
+        return response
+
+    def _record(self, command, started, data):
+        status, size = LAST_RESPONSE.get() or (0, 0)
+        self.stats.record(command, time.perf_counter() - started, len(data), size,
+                          error=not 199 < status < 300)
+
+    def execute_to(self, command, params, out):
+        """
+        Send a command whose result is a base64 string and decode it into ``out``
+        while the response is being received.
+
+        :Args:
+         - command - A string specifying the command to execute.
+         - params - A dictionary of named parameters, as for ``execute``.
+         - out - An object with ``write(bytes)``.
+
+        :Returns:
+          The response dictionary. On success ``value`` is the number of bytes written;
+          error responses are returned unchanged for the ``ErrorHandler``.
+        """
+        method, url, data = self._prepare(command, params)
+        self._check_breaker(command)
+        LAST_RESPONSE.set(None)
+        started = time.perf_counter()
+        try:
+            response = self._request_to(method, url, data, out)
+        except CONNECTION_ERRORS as e:
+            raise self._connection_failed(command, e) from e
+        finally:
+            self._record(command, started, data)
+        self._connection_ok()
+        return response
+
+    @property
+    def breaker_open(self):
+        return self._breaker_opened is not None
+
+    def _check_breaker(self, command):
+        if self._breaker_opened is None:
+            return
+        if time.monotonic() - self._breaker_opened < self.breaker_reset or \
+                (self.service_alive is not None and not self.service_alive()):
+            raise DriverUnreachableException(
+                'Driver at {} is unreachable, {} not sent'.format(self._url, command))
+        # half open: this request probes the service, a failure opens the breaker again
+        self._breaker_opened = None
+        self._half_open = True
+
+    def _connection_failed(self, command, error):
+        self._failures += 1
+        dead = self.service_alive is not None and not self.service_alive()
+        # each further command would wait the full timeout again, so a hung driver opens the breaker at once
+        hung = isinstance(error, self.timeout_errors) or \
+            isinstance(getattr(error, 'reason', None), self.timeout_errors)
+        if self._breaker_opened is None and (dead or hung or self._half_open or
+                                             self._failures >= self.breaker_threshold):
+            self._breaker_opened = time.monotonic()
+            LOGGER.warning("Driver at %s unreachable after %d failures, breaker opened", self._url, self._failures)
+            if self.on_unreachable is not None:
+                try:
+                    self.on_unreachable(self)
+                except Exception:
+                    LOGGER.exception("on_unreachable callback failed")
+        self._half_open = False
+        return DriverUnreachableException('{} failed: {!r}'.format(command, error))
+
+    def _connection_ok(self):
+        self._failures = 0
+        self._half_open = False
+
+    def _prepare(self, command, params):
+        """
+        Resolve a command into ``(method, url, body)``.
+
+        ``sessionId`` is removed from ``params`` once it has been substituted into the url.
+        """
         command_info = self._commands[command]
         assert command_info is not None, 'Unrecognised command %s' % command
-        path = string.Template(command_info[1]).substitute(params)
+        route = self._routes.get(command)
+        if route is None or route[0] is not command_info:
+            route = self._routes[command] = self._compile_route(command_info)
+        url = route[2].format_map(params) if route[3] else route[2]
         if isinstance(params, dict) and 'sessionId' in params:
             del params['sessionId']
-        data = utils.dump_json(params)
-        url = f"{self._url}{path}"
-        return self._request(command_info[0], url, body=data)
+        return route[1], url, utils.dump_json_bytes(params)
+
+    def _compile_route(self, command_info):
+        """
+        Compile a ``$name`` route template into a ``str.format`` pattern for the full url.
+
+        The compiled route is cached per command and keyed on the identity of the
+        ``(method, path)`` tuple, so entries replaced in ``_commands`` are recompiled.
+        """
+        method, path = command_info
+        parts = [self._url.replace('{', '{{').replace('}', '}}')]
+        placeholders = False
+        pos = 0
+        for match in string.Template.pattern.finditer(path):
+            parts.append(path[pos:match.start()].replace('{', '{{').replace('}', '}}'))
+            name = match.group('named') or match.group('braced')
+            if name:
+                parts.append('{%s}' % name)
+                placeholders = True
+            elif match.group('escaped') is not None:
+                parts.append('$')
+            else:
+                parts.append(match.group(0))
+            pos = match.end()
+        parts.append(path[pos:].replace('{', '{{').replace('}', '}}'))
+        url = ''.join(parts)
+        # routes without placeholders are used as is, so their braces are unescaped here
+        return command_info, method, url if placeholders else url.format(), placeholders
 
     def _request(self, method, url, body=None):
         """
@@ -402,14 +572,16 @@ class RemoteConnection(object):
         :Args:
          - method - A string for the HTTP method to send the request with.
          - url - A string for the URL to send the request to.
-         - body - A string for request body. Ignored unless method is POST or PUT.
+         - body - A string or bytes for request body. Ignored unless method is POST or PUT.
 
         :Returns:
           A dictionary with the server's parsed JSON response.
         """
         LOGGER.debug(f"{method} {url} {body}")
-        parsed_url = parse.urlparse(url)
-        headers = self.get_remote_connection_headers(parsed_url, self.keep_alive)
+        if url.startswith(self._url + '/'):
+            headers = self._headers
+        else:
+            headers = self.get_remote_connection_headers(parse.urlparse(url), self.keep_alive)
         resp = None
         if body and method != 'POST' and method != 'PUT':
             body = None
@@ -429,38 +601,101 @@ class RemoteConnection(object):
                 elif hasattr(resp.headers, 'get'):
                     resp.getheader = lambda x: resp.headers.get(x)
 
-        data = resp.data.decode('UTF-8')
+        LAST_RESPONSE.set((statuscode, len(resp.data)))
         try:
             if 300 <= statuscode < 304:
                 return self._request('GET', resp.getheader('location'))
-            if 399 < statuscode <= 500:
-                return {'status': statuscode, 'value': data}
-            content_type = []
-            if resp.getheader('Content-Type'):
-                content_type = resp.getheader('Content-Type').split(';')
-            if not any([x.startswith('image/png') for x in content_type]):
-
-                try:
-                    data = utils.load_json(data.strip())
-                except ValueError:
-                    if 199 < statuscode < 300:
-                        status = ErrorCode.SUCCESS
-                    else:
-                        status = ErrorCode.UNKNOWN_ERROR
-                    return {'status': status, 'value': data.strip()}
-
-                # Some of the drivers incorrectly return a response
-                # with no 'value' field when they should return null.
-                if 'value' not in data:
-                    data['value'] = None
-                return data
-            else:
-                data = {'status': 0, 'value': data}
-                return data
+            return self._parse_response(statuscode, resp.getheader('Content-Type'), resp.data)
         finally:
             LOGGER.debug("Finished Request")
             resp.close()
 
+    def _request_to(self, method, url, body, out):
+        LOGGER.debug(f"{method} {url} (streamed)")
+        if url.startswith(self._url + '/'):
+            headers = self._headers
+        else:
+            headers = self.get_remote_connection_headers(parse.urlparse(url), self.keep_alive)
+        if body and method != 'POST' and method != 'PUT':
+            body = None
+
+        manager = None
+        if self.keep_alive:
+            resp = self._conn.request(method, url, body=body, headers=headers, preload_content=False)
+        else:
+            manager = self._get_connection_manager()
+            resp = manager.request(method, url, body=body, headers=headers, preload_content=False)
+        statuscode = resp.status
+        size = 0
+        try:
+            if 300 <= statuscode < 304:
+                return self._request_to('GET', resp.headers.get('location'), None, out)
+            decoder = utils.Base64ValueDecoder(out)
+            if statuscode == 200:
+                for chunk in resp.stream(self._stream_chunk_size):
+                    size += len(chunk)
+                    if not decoder.feed(chunk):
+                        break
+            if decoder.complete:
+                return {'status': ErrorCode.SUCCESS, 'value': decoder.written}
+            if decoder.state == 'string':
+                return {'status': ErrorCode.UNKNOWN_ERROR,
+                        'value': 'Response ended inside the base64 value after %d bytes' % size}
+            # not streamable (an error response, or a shape the decoder gave up on): parse the whole body
+            rest = resp.read()
+            size += len(rest)
+            response = self._parse_response(statuscode, resp.headers.get('Content-Type'), decoder.head + rest)
+            if statuscode != 200 or response.get('status', ErrorCode.SUCCESS) != ErrorCode.SUCCESS:
+                return response
+            if not isinstance(response['value'], str):
+                return {'status': ErrorCode.UNKNOWN_ERROR,
+                        'value': 'Response value is not a base64 string: {!r}'.format(response['value'])[:200]}
+            try:
+                return {'status': ErrorCode.SUCCESS, 'value': decoder.write_all(response['value'])}
+            except binascii.Error as e:
+                return {'status': ErrorCode.UNKNOWN_ERROR, 'value': 'Invalid base64 value: {}'.format(e)}
+        finally:
+            if LAST_RESPONSE.get() is None:
+                LAST_RESPONSE.set((statuscode, size))
+            LOGGER.debug("Finished Request")
+            resp.release_conn()
+            if manager is not None:
+                manager.clear()
+
+    @staticmethod
+    def _parse_response(statuscode, content_type, data):
+        """
+        Turn a non-redirect response into the dictionary returned by ``execute``.
+
+        :Args:
+         - statuscode - The HTTP status code.
+         - content_type - The Content-Type header, or None.
+         - data - The response body as bytes.
+        """
+        if 399 < statuscode <= 500:
+            return {'status': statuscode, 'value': data.decode('UTF-8')}
+        content_type = content_type.split(';') if content_type else []
+        if not any([x.startswith('image/png') for x in content_type]):
+
+            try:
+                # decode straight from the response bytes, no intermediate str
+                data = utils.load_json(data)
+            except ValueError:
+                if 199 < statuscode < 300:
+                    status = ErrorCode.SUCCESS
+                else:
+                    status = ErrorCode.UNKNOWN_ERROR
+                return {'status': status, 'value': data.decode('UTF-8').strip()}
+
+            # Some of the drivers incorrectly return a response
+            # with no 'value' field when they should return null.
+            if 'value' not in data:
+                data['value'] = None
+            return data
+        else:
+            data = {'status': 0, 'value': data.decode('UTF-8')}
+            return data
+
     def close(self):
         """
         Clean up resources when finished with the remote_connection
@@ -15,13 +15,215 @@
 # specific language governing permissions and limitations
 # under the License.
 
+import binascii
 import json
+import re
 from typing import Any, Union
 
+# Use a faster codec for the wire format when one is installed. orjson works on
+# bytes directly, which avoids an intermediate str copy of large responses
+# (screenshots, print_page PDFs, page sources).
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+JSON_CODEC = 'orjson' if orjson else 'json'
+
 
 def dump_json(json_struct: Any) -> str:
     return json.dumps(json_struct)
 
 
+def dump_json_bytes(json_struct: Any) -> bytes:
+    """
+    Serialize to UTF-8 encoded JSON, ready to be used as a request body.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(json_struct, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+    return json.dumps(json_struct).encode('utf-8')
+
+
 def load_json(s: Union[str, bytes]) -> Any:
+    if orjson is not None:
+        return orjson.loads(s)
     return json.loads(s)
+
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_JSON_DECODER = json.JSONDecoder()
+# give up streaming if the "value" string does not start within this many bytes
+_HEAD_MAX = 4096
+
+
+def _find_value_string(head):
+    """
+    Scan the start of a JSON object for the ``"value"`` member, skipping the members
+    before it (``sessionId``, ``status``...).
+
+    :Returns:
+      The offset just after the opening quote of a string value, None while more data
+      is needed, or -1 when the body is not an object with a string ``value``.
+    """
+    # latin-1 keeps offsets equal to byte offsets; JSON syntax is plain ascii
+    text = head.decode('latin-1')
+    pos = _WHITESPACE.match(text).end()
+    if pos == len(text):
+        return None
+    if text[pos] != '{':
+        return -1
+    pos += 1
+    while True:
+        pos = _WHITESPACE.match(text, pos).end()
+        if pos == len(text):
+            return None
+        if text[pos] != '"':
+            return -1
+        try:
+            key, pos = json.decoder.scanstring(text, pos + 1)
+        except ValueError:
+            return None
+        pos = _WHITESPACE.match(text, pos).end()
+        if pos == len(text):
+            return None
+        if text[pos] != ':':
+            return -1
+        pos = _WHITESPACE.match(text, pos + 1).end()
+        if pos == len(text):
+            return None
+        if key == 'value':
+            return pos + 1 if text[pos] == '"' else -1
+        try:
+            _, pos = _JSON_DECODER.raw_decode(text, pos)
+        except ValueError:
+            return None
+        # a number at the end of the data may continue in the next chunk
+        pos = _WHITESPACE.match(text, pos).end()
+        if pos == len(text):
+            return None
+        if text[pos] != ',':
+            return -1
+        pos += 1
+
+
+class Base64ValueDecoder(object):
+    """
+    Incrementally decode the base64 string ``value`` of a response body such as
+    ``{"value": "<base64>"}`` or ``{"sessionId": "...", "status": 0, "value": "<base64>"}``
+    into ``out``.
+
+    Feed the raw body chunk by chunk. Only a few bytes of the encoded string are
+    held back between chunks, so the decoded data is never in memory as a whole.
+    ``feed`` returns False once the body turns out not to have that shape (an
+    error response, a non-string value, members before ``value`` longer than
+    ``_HEAD_MAX``); ``head`` then holds everything fed so far and the caller
+    parses the complete body as usual.
+    """
+
+    def __init__(self, out):
+        self.out = out
+        self.head = b''
+        self.written = 0
+        # 'head' -> 'string' -> 'tail', or 'head' -> 'fallback'
+        self.state = 'head'
+        self._pending = b''
+
+    @property
+    def complete(self):
+        return self.state == 'tail'
+
+    def feed(self, chunk):
+        if self.state == 'head':
+            self.head += chunk
+            start = _find_value_string(self.head)
+            if start is None:
+                if len(self.head) < _HEAD_MAX:
+                    return True
+                start = -1
+            if start < 0:
+                self.state = 'fallback'
+                return False
+            chunk = self.head[start:]
+            self.head = b''
+            self.state = 'string'
+        if self.state == 'string':
+            end = chunk.find(b'"')
+            if end >= 0:
+                self._decode(chunk[:end], final=True)
+                self.state = 'tail'
+            else:
+                self._decode(chunk, final=False)
+        return True
+
+    def write_all(self, value):
+        """
+        Decode a complete base64 string, for a body that could not be streamed.
+        """
+        decoded = binascii.a2b_base64(value)
+        self.out.write(decoded)
+        self.written += len(decoded)
+        return self.written
+
+    def _decode(self, data, final):
+        data = self._pending + data
+        self._pending = b''
+        if not final and data.endswith(b'\\'):
+            # JSON may escape '/' as '\/'; wait for the character after the backslash
+            data, self._pending = data[:-1], b'\\'
+        if b'\\' in data:
+            data = data.replace(b'\\/', b'/')
+        if not final:
+            # decode whole 4 character groups only
+            cut = len(data) - len(data) % 4
+            data, self._pending = data[:cut], data[cut:] + self._pending
+        if data:
+            decoded = binascii.a2b_base64(data)
+            self.out.write(decoded)
+            self.written += len(decoded)
+
+
+class BufferWriter(object):
+    """
+    File-like ``write`` into a preallocated writable buffer (``bytearray``, ``memoryview``, ``mmap``).
+    """
+
+    def __init__(self, buffer):
+        self.view = memoryview(buffer).cast('B')
+        self.written = 0
+
+    def write(self, data):
+        end = self.written + len(data)
+        if end > len(self.view):
+            raise ValueError('buffer too small: need more than %d bytes' % len(self.view))
+        self.view[self.written:end] = data
+        self.written = end
+        return len(data)
+
+
+def _benchmark(number=20):
+    """
+    Compare the active codec against the stdlib on a typical command response
+    and on a large ``print_page`` style base64 payload.
+
+    Run with ``python -m EDGE.web.remote.utils``.
+    """
+    import base64
+    import os
+    import timeit
+
+    typical = {'value': {'element-6066-11e4-a52e-4f735466cecf': 'a' * 36, 'rect': [1, 2, 3, 4]}}
+    large = {'value': base64.b64encode(os.urandom(12 * 1024 * 1024)).decode('ascii')}
+    print('codec: %s' % JSON_CODEC)
+    for name, payload, count in (('typical', typical, number * 1000), ('large', large, number)):
+        raw = json.dumps(payload).encode('utf-8')
+        stdlib = timeit.timeit(lambda: json.loads(raw.decode('UTF-8').strip()), number=count) / count
+        active = timeit.timeit(lambda: load_json(raw), number=count) / count
+        print('%-8s %9d bytes  stdlib %10.1fus  %s %10.1fus' % (
+            name, len(raw), stdlib * 1e6, JSON_CODEC, active * 1e6))
+
+
+if __name__ == '__main__':
+    _benchmark()
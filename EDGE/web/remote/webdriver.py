@@ -19,6 +19,8 @@
 
 import copy
 from importlib import import_module
+import json
+import os
 
 import pkgutil
 
@@ -26,6 +28,7 @@ import sys
 from typing import Dict, List, Optional, Union
 
 import warnings
+import weakref
 
 from abc import ABCMeta
 from base64 import b64decode
@@ -33,6 +36,7 @@ from contextlib import asynccontextmanager, contextmanager
 
 from .bidi_connection import BidiConnection
 from .command import Command
+from . import marshalling
 from .errorhandler import ErrorHandler
 from .file_detector import FileDetector, LocalFileDetector
 from .mobile import Mobile
@@ -72,6 +76,62 @@ _OSS_W3C_CONVERSION = {
     'platform': 'platformName'
 }
 
+_QUERY_FIELDS = frozenset(('text', 'tag_name', 'rect'))
+
+_QUERY_ELEMENTS_JS = """
+var elements = arguments[0], fields = arguments[1], result = {};
+for (var f = 0; f < fields.length; f++) {
+  var field = fields[f], colon = field.indexOf(':');
+  var kind = colon < 0 ? field : field.slice(0, colon), name = field.slice(colon + 1), column = [];
+  for (var i = 0; i < elements.length; i++) {
+    var e = elements[i], value;
+    if (kind === 'text') {
+      value = e.innerText === undefined ? e.textContent : e.innerText;
+    } else if (kind === 'tag_name') {
+      value = e.tagName.toLowerCase();
+    } else if (kind === 'rect') {
+      var r = e.getBoundingClientRect();
+      value = {x: r.left + window.pageXOffset, y: r.top + window.pageYOffset,
+               width: r.width, height: r.height};
+    } else if (kind === 'attribute') {
+      value = e.getAttribute(name);
+    } else {
+      value = e[name];
+    }
+    column.push(value === undefined ? null : value);
+  }
+  result[field] = column;
+}
+return result;
+"""
+
+# page global holding functions installed by _execute_installed, and what the short
+# call returns when the current document does not have the function yet
+# (kept short: the call is sent on every use, e.g. each poll of a pinned probe)
+_INSTALLED_KEY = '__edge'
+_INSTALLED_MISSING = '__edge?'
+
+_CALL_INSTALLED_JS = 'var f=(window.%s||0)[%%s];return f?f.apply(0,arguments):"%s"' % (
+    _INSTALLED_KEY, _INSTALLED_MISSING)
+
+_INSTALL_JS = ('var ns = window.%s;'
+               'if (!ns) {ns = {}; Object.defineProperty(window, "%s", {value: ns});}'
+               'ns[%%s] = (%%s);' % (_INSTALLED_KEY, _INSTALLED_KEY))
+
+
+def _pinned_name(script_id):
+    return 'p:%s' % script_id
+
+
+def _worth_installing(name, script):
+    # a script no longer than the call by name is cheaper to send as it is
+    return len(script) > len(_CALL_INSTALLED_JS % json.dumps(name))
+
+
+def _pinned_source(script):
+    # the newline keeps a trailing line comment from swallowing the closing brace
+    return 'function(){%s\n}' % script
+
 
 cdp = None
 
@@ -204,16 +264,36 @@ class WebDriver(BaseWebDriver):
             self.command_executor = get_remote_connection(capabilities, command_executor=command_executor,
                                                           keep_alive=keep_alive,
                                                           ignore_local_proxy=_ignore_local_proxy)
+        self._setup(file_detector)
+        self.start_session(capabilities, browser_profile)
+
+    def _setup(self, file_detector=None):
         self._is_remote = True
         self.session_id = None
         self.caps = {}
         self.pinned_scripts = {}
+        # element id -> WebElement of the current session, so repeated references share one handle
+        self._elements = weakref.WeakValueDictionary()
+        # name -> CDP identifier (or None) of pinned scripts registered for new documents this session
+        self._installed = {}
         self.error_handler = ErrorHandler()
         self._switch_to = SwitchTo(self)
         self._mobile = Mobile(self)
         self.file_detector = file_detector or LocalFileDetector()
         self.start_client()
-        self.start_session(capabilities, browser_profile)
+
+    @classmethod
+    def _attached(cls, command_executor, session_id, caps, file_detector=None):
+        """
+        A driver for an existing session: the same set up as ``__init__`` without
+        sending ``NEW_SESSION``.
+        """
+        driver = cls.__new__(cls)
+        driver.command_executor = command_executor
+        driver._setup(file_detector)
+        driver.session_id = session_id
+        driver.caps = caps
+        return driver
 
     def __repr__(self):
         return '<{0.__module__}.{0.__name__} (session="{1}")>'.format(
@@ -242,6 +322,13 @@ class WebDriver(BaseWebDriver):
     def mobile(self):
         return self._mobile
 
+    @property
+    def command_stats(self):
+        """
+        Per command counts, errors, latency and payload sizes of this driver's connection.
+        """
+        return self.command_executor.stats
+
     @property
     def name(self) -> str:
         
@@ -275,6 +362,8 @@ class WebDriver(BaseWebDriver):
             response = response['value']
         self.session_id = response['sessionId']
         self.caps = response.get('value')
+        self._elements.clear()
+        self._installed = {}
 
         # if capabilities is none we are probably speaking to
         # a W3C endpoint
@@ -282,34 +371,17 @@ class WebDriver(BaseWebDriver):
             self.caps = response.get('capabilities')
 
     def _wrap_value(self, value):
-        if isinstance(value, dict):
-            converted = {}
-            for key, val in value.items():
-                converted[key] = self._wrap_value(val)
-            return converted
-        elif isinstance(value, self._web_element_cls):
-            return {'element-6066-11e4-a52e-4f735466cecf': value.id}
-        elif isinstance(value, list):
-            return list(self._wrap_value(item) for item in value)
-        else:
-            return value
+        return marshalling.wrap_value(value, self._web_element_cls)
 
     def create_web_element(self, element_id: str) -> WebElement:
         
-        return self._web_element_cls(self, element_id)
+        element = self._elements.get(element_id)
+        if element is None:
+            element = self._elements[element_id] = self._web_element_cls(self, element_id)
+        return element
 
     def _unwrap_value(self, value):
-        if isinstance(value, dict):
-            if 'element-6066-11e4-a52e-4f735466cecf' in value:
-                return self.create_web_element(value['element-6066-11e4-a52e-4f735466cecf'])
-            else:
-                for key, val in value.items():
-                    value[key] = self._unwrap_value(val)
-                return value
-        elif isinstance(value, list):
-            return list(self._unwrap_value(item) for item in value)
-        else:
-            return value
+        return marshalling.unwrap_value(value, self.create_web_element)
 
     def execute(self, driver_command: str, params: dict = None) -> dict:
         
@@ -330,6 +402,48 @@ class WebDriver(BaseWebDriver):
         # a success
         return {'success': 0, 'value': None, 'sessionId': self.session_id}
 
+    def execute_to_file(self, driver_command: str, params: dict = None, out=None) -> int:
+        """
+        Execute a command whose result is base64 data (screenshots, ``print_page``) and
+        decode it into ``out`` while the response is received, so neither the encoded
+        nor the decoded data is ever held in memory as a whole.
+
+        :Args:
+         - driver_command - The command to execute.
+         - params - Parameters of the command.
+         - out - A file name, or an object with ``write(bytes)`` such as an open file
+           or ``utils.BufferWriter`` over a preallocated buffer.
+
+        :Returns:
+          The number of bytes written. A file name is written through a temporary file
+          next to it, so on error an existing file is left as it was.
+        """
+        if isinstance(out, (str, bytes, os.PathLike)):
+            path = os.fsdecode(out)
+            tmp_path = path + '.tmp'
+            try:
+                with open(tmp_path, 'wb') as f:
+                    written = self.execute_to_file(driver_command, params, f)
+                os.replace(tmp_path, path)
+            except BaseException:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                raise
+            return written
+
+        if self.session_id:
+            if not params:
+                params = {'sessionId': self.session_id}
+            elif 'sessionId' not in params:
+                params['sessionId'] = self.session_id
+
+        params = self._wrap_value(params)
+        response = self.command_executor.execute_to(driver_command, params, out)
+        self.error_handler.check_response(response)
+        return response['value']
+
     def get(self, url: str) -> None:
         
         self.execute(Command.GET, {'url': url})
@@ -483,17 +597,40 @@ class WebDriver(BaseWebDriver):
         return self.find_elements(by=By.CSS_SELECTOR, value=css_selector)
 
     def pin_script(self, script, script_key=None) -> ScriptKey:
-        
+        """
+        Register ``script`` (a script body, as for ``execute_script``) in the browser,
+        to be run later with ``execute_script(script_key, *args)``. Only the first run
+        in each document sends the body; with CDP it is registered for new documents
+        right away and survives navigations. A script no longer than the call by name
+        is not installed and is always sent as it is.
+        """
         if not script_key:
             _script_key = ScriptKey()
         else:
             _script_key = ScriptKey(script_key)
-        self.pinned_scripts[_script_key.id] = script
+        # keyed by str(id): ids may be UUIDs, and the keys must survive save_state / attach
+        if str(_script_key.id) in self.pinned_scripts:
+            self.unpin(_script_key)
+        self.pinned_scripts[str(_script_key.id)] = script
+        name = _pinned_name(_script_key.id)
+        if self.session_id and _worth_installing(name, script):
+            self._installed[name] = self._register_on_new_document(
+                _INSTALL_JS % (json.dumps(name), _pinned_source(script)))
         return _script_key
 
     def unpin(self, script_key) -> None:
-        
-        self.pinned_scripts.pop(script_key.id)
+        script = self.pinned_scripts.pop(str(script_key.id))
+        name = _pinned_name(script_key.id)
+        identifier = self._installed.pop(name, None)
+        if not self.session_id or not _worth_installing(name, script):
+            return
+        try:
+            if identifier is not None:
+                self.execute_cdp_cmd('Page.removeScriptToEvaluateOnNewDocument', {'identifier': identifier})
+            self.execute_script('var ns = window.%s; if (ns) delete ns[%s];' % (_INSTALLED_KEY, json.dumps(name)))
+        except WebDriverException:
+            # the page or session is gone, nothing left to remove
+            pass
 
     def get_pinned_scripts(self) -> List[str]:
         
@@ -502,9 +639,14 @@ class WebDriver(BaseWebDriver):
     def execute_script(self, script, *args):
         if isinstance(script, ScriptKey):
             try:
-                script = self.pinned_scripts[script.id]
+                source = self.pinned_scripts[str(script.id)]
             except KeyError:
                 raise JavascriptException("Pinned script could not be found")
+            name = _pinned_name(script.id)
+            if not _worth_installing(name, source):
+                script = source
+            else:
+                return self._execute_installed(name, _pinned_source(source), *args, register=True)
 
         converted_args = list(args)
         command = Command.W3C_EXECUTE_SCRIPT
@@ -513,6 +655,62 @@ class WebDriver(BaseWebDriver):
             'script': script,
             'args': converted_args})['value']
 
+    def _execute_installed(self, name: str, source: str, *args, register=False):
+        """
+        Call the JavaScript function expression ``source`` with ``args``, sending its
+        source only once per document. Later calls send a short call by ``name``;
+        when the document does not know ``name`` yet (first use, navigation, another
+        frame) the function is installed and called in the same command.
+
+        With ``register`` drivers with ``execute_cdp_cmd`` also register the function
+        for every new document through ``Page.addScriptToEvaluateOnNewDocument``, so
+        navigations do not cost a reinstall. Only pinned scripts ask for it: a
+        registered script is evaluated in every document and frame the browser loads,
+        used or not.
+        """
+        key = json.dumps(name)
+        result = self.execute_script(_CALL_INSTALLED_JS % key, *args)
+        if result != _INSTALLED_MISSING:
+            return result
+        install = _INSTALL_JS % (key, source)
+        if register and name not in self._installed:
+            self._installed[name] = self._register_on_new_document(install)
+        return self.execute_script('%s return ns[%s].apply(null, arguments);' % (install, key), *args)
+
+    def _register_on_new_document(self, install: str):
+        execute_cdp_cmd = getattr(self, 'execute_cdp_cmd', None)
+        if execute_cdp_cmd is None:
+            return None
+        try:
+            return execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument',
+                                   {'source': '(function(){%s})();' % install})['identifier']
+        except (WebDriverException, KeyError, TypeError):
+            # remote ends without CDP: the lazy install above still works
+            return None
+
+    def query_elements(self, elements, fields) -> Dict[str, list]:
+        """
+        Read several fields of several elements in one script execution, instead of
+        one command per element and field.
+
+        :Args:
+         - elements - The WebElements to read.
+         - fields - Any of ``'text'`` (``innerText``), ``'tag_name'``, ``'rect'``,
+           ``'attribute:<name>'`` (like ``get_dom_attribute``) and
+           ``'property:<name>'`` (like ``get_property``).
+
+        :Returns:
+          ``{field: [value for each element, in order]}``
+        """
+        fields = list(fields)
+        for field in fields:
+            if field not in _QUERY_FIELDS and not field.startswith(('attribute:', 'property:')):
+                raise InvalidArgumentException("Unknown query field: %r" % field)
+        elements = list(elements)
+        if not elements or not fields:
+            return {field: [] for field in fields}
+        return self.execute_script(_QUERY_ELEMENTS_JS, elements, fields)
+
     def execute_async_script(self, script: str, *args):
         converted_args = list(args)
         command = Command.W3C_EXECUTE_SCRIPT_ASYNC
@@ -575,6 +773,17 @@ class WebDriver(BaseWebDriver):
 
         return self.execute(Command.PRINT_PAGE, options)['value']
 
+    def print_page_to_file(self, filename, print_options: Optional[PrintOptions] = None) -> int:
+        """
+        Print the page as PDF straight into ``filename`` (or a writable object),
+        returning the number of bytes written.
+        """
+        options = {}
+        if print_options:
+            options = print_options.to_dict()
+
+        return self.execute_to_file(Command.PRINT_PAGE, options, filename)
+
     @property
     def switch_to(self) -> SwitchTo:
         return self._switch_to
@@ -710,14 +919,10 @@ class WebDriver(BaseWebDriver):
         if not filename.lower().endswith('.png'):
             warnings.warn("name used for saved screenshot does not match file "
                           "type. It should end with a `.png` extension", UserWarning)
-        png = self.get_screenshot_as_png()
         try:
-            with open(filename, 'wb') as f:
-                f.write(png)
+            self.execute_to_file(Command.SCREENSHOT, None, filename)
         except IOError:
             return False
-        finally:
-            del png
         return True
 
     def save_screenshot(self, filename) -> bool:
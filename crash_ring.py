@@ -0,0 +1,190 @@
+# -*- coding:utf-8 -*-
+__author__ = 'kk'
+
+# 崩溃现场环形缓冲：固定大小的内存映射文件，最近的日志行和任务状态变化直接写入映射内存（无系统调用），
+# 进程被强杀或卡死后，下次启动时把上次未正常关闭的记录解码成时间线文件
+# 单独运行可查看：python crash_ring.py [./log_file/crash.ring]
+
+import itertools
+import mmap
+import os
+import struct
+import sys
+import time
+
+__ring_file__ = './log_file/crash.ring'
+__slot_size__ = 256
+__slot_count__ = 4096
+__magic__ = b'DRCR'
+__version__ = 2
+# 崩溃时间线文件最多保留的个数，更早的删除
+__crash_keep__ = 10
+
+KIND_LOG = 1
+KIND_JOB = 2
+KIND_NAMES = {KIND_LOG: 'log', KIND_JOB: 'job'}
+
+# 第0个槽位为文件头：magic, version, slot_size, slot_count, pid, 启动时间, 是否正常关闭
+_header = struct.Struct('<4sIIIIdB')
+_clean_offset = _header.size - 1
+# 每个槽位：序号, 时间, 类型, 长度, 分片序号, 分片总数, 首个分片的序号, 内容；序号最后写入，为0表示正在写或未使用
+# 超长记录按字符边界拆成多个分片，各分片记下首个分片的序号，解码时据此拼回，缺片（已被覆盖）的整条丢弃
+_slot = struct.Struct('<QdBHBBQ')
+_seq = struct.Struct('<Q')
+_payload_max = __slot_size__ - _slot.size
+_max_slots_per_record = 4
+
+
+def split_utf8(data, size, max_parts):
+    # 按不超过 size 字节切分，切点退到 utf-8 字符边界；超出 max_parts 的部分截掉
+    chunks = []
+    start = 0
+    while start < len(data) and len(chunks) < max_parts:
+        end = min(start + size, len(data))
+        if end < len(data):
+            while end > start and data[end] & 0xC0 == 0x80:
+                end -= 1
+        chunks.append(data[start:end])
+        start = end
+    return chunks or [b'']
+
+
+class CrashRing(object):
+    def __init__(self, path=__ring_file__, slot_count=__slot_count__):
+        self.path = path
+        self.slot_count = slot_count
+        size = (slot_count + 1) * __slot_size__
+        self.file = open(path, 'r+b' if os.path.exists(path) else 'w+b')
+        self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+        self.map[:] = bytes(size)
+        _header.pack_into(self.map, 0, __magic__, __version__, __slot_size__, slot_count,
+                          os.getpid(), time.time(), 0)
+        # itertools.count 的 next 在 CPython 中是原子的，多线程写入无需加锁
+        self.counter = itertools.count(1)
+
+    def record(self, kind, text):
+        chunks = split_utf8(text.encode('utf-8', 'replace'), _payload_max, _max_slots_per_record)
+        now = time.time()
+        first = 0
+        for part, chunk in enumerate(chunks):
+            seq = next(self.counter)
+            first = first or seq
+            offset = (seq % self.slot_count + 1) * __slot_size__
+            _slot.pack_into(self.map, offset, 0, now, kind, len(chunk), part, len(chunks), first)
+            self.map[offset + _slot.size:offset + _slot.size + len(chunk)] = chunk
+            _seq.pack_into(self.map, offset, seq)
+
+    def mark_clean(self):
+        self.map[_clean_offset] = 1
+
+    def close(self):
+        if self.map is None:
+            return
+        self.mark_clean()
+        self.map.flush()
+        self.map.close()
+        self.file.close()
+        self.map = None
+
+
+def decode(buf):
+    """ 返回 (头信息, [(序号, 时间, 类型, 内容), ...])，记录按写入顺序排列"""
+    magic, version, slot_size, slot_count, pid, start_time, clean = _header.unpack_from(buf, 0)
+    if magic != __magic__:
+        raise ValueError('not a crash ring file')
+    header = {'version': version, 'pid': pid, 'start_time': start_time, 'clean': bool(clean)}
+    payload_max = slot_size - _slot.size
+    pieces = {}
+    for index in range(1, slot_count + 1):
+        offset = index * slot_size
+        seq, ts, kind, length, part, parts, first = _slot.unpack_from(buf, offset)
+        if seq == 0 or length > payload_max or part >= parts:
+            continue
+        data = bytes(buf[offset + _slot.size:offset + _slot.size + length])
+        pieces.setdefault(first, (ts, kind, parts, {}))[3][part] = data
+    records = []
+    for first, (ts, kind, parts, chunks) in sorted(pieces.items()):
+        if len(chunks) != parts:
+            # 前面的分片已被环形覆盖
+            continue
+        data = b''.join(chunks[part] for part in range(parts))
+        records.append((first, ts, kind, data.decode('utf-8', 'replace')))
+    return header, records
+
+
+def format_timeline(header, records):
+    lines = ['pid=%d start=%s clean=%s' % (header['pid'], format_time(header['start_time']), header['clean'])]
+    for seq, ts, kind, text in records:
+        lines.append('%s [%s] %s' % (format_time(ts), KIND_NAMES.get(kind, kind), text))
+    return '\n'.join(lines) + '\n'
+
+
+def format_time(ts):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts)) + '.%03d' % int((ts % 1) * 1000)
+
+
+def dump_unclean(path=__ring_file__):
+    # 上次运行未正常关闭时，把环形缓冲解码为可读的时间线，返回生成的文件路径
+    try:
+        with open(path, 'rb') as f:
+            buf = f.read()
+        header, records = decode(buf)
+    except (OSError, ValueError, struct.error):
+        return None
+    if header['clean'] or len(records) == 0:
+        return None
+    out = os.path.join(os.path.dirname(path), 'crash_%s.txt' % time.strftime(
+        '%Y%m%d_%H%M%S', time.localtime(header['start_time'])))
+    with open(out, 'w', encoding='utf-8') as f:
+        f.write(format_timeline(header, records))
+    prune_dumps(os.path.dirname(path), __crash_keep__)
+    return out
+
+
+def prune_dumps(path, keep=__crash_keep__):
+    # 时间线文件不参与日志预算淘汰，这里只保留最近的 keep 个
+    try:
+        names = sorted(name for name in os.listdir(path or '.')
+                       if name.startswith('crash_') and name.endswith('.txt'))
+    except OSError:
+        return
+    for name in names[:-keep] if keep > 0 else names:
+        try:
+            os.remove(os.path.join(path, name))
+        except OSError:
+            pass
+
+
+ring = None
+
+
+def open_ring(path=__ring_file__):
+    global ring
+    if ring is not None:
+        return ring
+    dumped = dump_unclean(path)
+    if dumped is not None:
+        print('检测到上次异常退出，现场记录已保存：', dumped)
+    try:
+        ring = CrashRing(path)
+    except (OSError, ValueError) as e:
+        print('崩溃记录文件创建失败：', e)
+    return ring
+
+
+def record(kind, text):
+    if ring is not None:
+        ring.record(kind, text)
+
+
+def close_ring():
+    global ring
+    if ring is not None:
+        ring.close()
+        ring = None
+
+
+if __name__ == '__main__':
+    with open(sys.argv[1] if len(sys.argv) > 1 else __ring_file__, 'rb') as ring_file:
+        print(format_timeline(*decode(ring_file.read())), end='')
@@ -0,0 +1,174 @@
+# -*- coding:utf-8 -*-
+__author__ = 'kk'
+
+# 通过现有 websocket 回传日志：
+#   infoOrder#//logs                     列出可用的日志分段
+#   infoOrder#//logs_get_{"date":"20210901","id":1}
+#   infoOrder#//logs_get_{"from":"20210901","to":"20210903","id":1}
+#                                        按日期（或日期区间，含首尾）回传日志，加 "jobs":1 回传任务日志
+# 日志内容按块 zlib 压缩后以二进制帧发送，帧头为 magic(2) + version(u8) + id(u32) + seq(u32) + flags(u8)，
+# 最后一块 flags=1。上传在后台线程进行并限速，打印任务进行时暂停，不影响打印结果和心跳的发送
+
+import gzip
+import json
+import os
+import re
+import struct
+import threading
+import time
+import zipfile
+import zlib
+
+import websocket
+
+import logger
+
+__chunk_size__ = 32 * 1024
+__upload_rate__ = 256 * 1024
+__frame_magic__ = b'DL'
+__frame_version__ = 1
+
+_frame_header = struct.Struct('<2sBIIB')
+_date_pattern = re.compile(r'^\d{8}$')
+_segment_pattern = re.compile(r'^(?:jobs_)?(\d{8})(?:_(\d+))?\.(?:log|jsonl)(?:\.gz|\.zip)?$|^(\d{8})\.zip$')
+
+__logs_list_base__ = 'return#//logs_%s'
+__logs_begin_base__ = 'return#//logs_begin_%s'
+__logs_end_base__ = 'return#//logs_end_%s'
+
+
+def list_segments():
+    segments = []
+    for name in logger.log_inventory.names():
+        match = _segment_pattern.match(name)
+        if match is None:
+            continue
+        try:
+            size = os.path.getsize(logger.__log_file_path__ + name)
+        except OSError:
+            continue
+        segments.append({'name': name, 'date': match.group(1) or match.group(3), 'size': size})
+    segments.sort(key=lambda item: logger.log_sort_key(item['name']) or (item['date'], 0, item['name']))
+    return segments
+
+
+def open_segment(name):
+    full = logger.__log_file_path__ + name
+    if name.endswith(logger.__compress_postfix__):
+        return gzip.open(full, 'rb')
+    if name.endswith('.zip'):
+        # 旧版本按天打包的 zip 日志
+        archive = zipfile.ZipFile(full)
+        return archive.open(archive.namelist()[0])
+    return open(full, 'rb')
+
+
+def read_lines(names):
+    for name in names:
+        with open_segment(name) as f:
+            for line in f:
+                yield line
+
+
+def parse_request(request):
+    """ 校验 logs_get 请求，返回 (id, 起始日期, 结束日期, 是否任务日志)，格式错误时返回 None"""
+    if not isinstance(request, dict):
+        return None
+    try:
+        upload_id = int(request.get('id', 0))
+    except (TypeError, ValueError):
+        return None
+    date_s = str(request.get('date', logger.get_cur_time()))
+    date_from = str(request.get('from', date_s))
+    date_to = str(request.get('to', date_from))
+    if _date_pattern.match(date_from) is None or _date_pattern.match(date_to) is None:
+        return None
+    return upload_id, date_from, date_to, bool(request.get('jobs'))
+
+
+class LogUploader(object):
+    def __init__(self, busy=None, rate=__upload_rate__):
+        # busy 为打印任务进行中的标志，置位时暂停上传
+        self.busy = busy
+        self.rate = rate
+        self.thread = None
+        self.cancelled = threading.Event()
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def send_list(self, ws):
+        ws.send(__logs_list_base__ % json.dumps({'segments': list_segments()}, separators=(',', ':')))
+
+    def start(self, ws, request):
+        parsed = parse_request(request)
+        if parsed is None:
+            print('日志请求格式错误:', request)
+            ws.send(__logs_end_base__ % json.dumps({'id': 0, 'error': 'bad request'}))
+            return False
+        if self.running:
+            ws.send(__logs_end_base__ % json.dumps({'id': parsed[0], 'error': 'busy'}))
+            return False
+        self.cancelled.clear()
+        self.thread = threading.Thread(target=self.upload, args=(ws,) + parsed, name='log-upload', daemon=True)
+        self.thread.start()
+        return True
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def wait_turn(self, ws, sent_bytes, started):
+        # 打印任务优先；同时按速率限制发送，给同一连接上的其他消息留出空隙
+        while self.busy is not None and self.busy.is_set() and not self.cancelled.is_set():
+            time.sleep(0.5)
+        delay = sent_bytes / self.rate - (time.time() - started)
+        if delay > 0:
+            self.cancelled.wait(delay)
+        return not self.cancelled.is_set() and ws.sock is not None and ws.sock.connected
+
+    def upload(self, ws, upload_id, date_from, date_to, jobs):
+        names = [item['name'] for item in list_segments()
+                 if date_from <= item['date'] <= date_to and
+                 item['name'].startswith(logger.__job_log_prefix__) == jobs]
+        # 当天的日志可能还在缓冲中
+        logger.flush_log()
+        try:
+            ws.send(__logs_begin_base__ % json.dumps({'id': upload_id, 'segments': names}, separators=(',', ':')))
+            seq = 0
+            sent_bytes = 0
+            raw_bytes = 0
+            started = time.time()
+            pending = []
+            pending_size = 0
+            lines = read_lines(names)
+            while True:
+                line = next(lines, None)
+                if line is not None:
+                    pending.append(line)
+                    pending_size += len(line)
+                    if pending_size < __chunk_size__:
+                        continue
+                last = line is None
+                if not self.wait_turn(ws, sent_bytes, started):
+                    print('日志上传已中止：', upload_id)
+                    return
+                raw = b''.join(pending)
+                data = zlib.compress(raw, 6)
+                ws.send(_frame_header.pack(__frame_magic__, __frame_version__, upload_id, seq, 1 if last else 0) + data,
+                        opcode=websocket.ABNF.OPCODE_BINARY)
+                seq += 1
+                sent_bytes += len(data)
+                raw_bytes += len(raw)
+                pending = []
+                pending_size = 0
+                if last:
+                    break
+            ws.send(__logs_end_base__ % json.dumps({'id': upload_id, 'chunks': seq, 'bytes': sent_bytes,
+                                                    'raw_bytes': raw_bytes}, separators=(',', ':')))
+        except Exception as e:
+            print('日志上传失败：', e)
+            try:
+                ws.send(__logs_end_base__ % json.dumps({'id': upload_id, 'error': str(e)}, ensure_ascii=False))
+            except Exception:
+                pass
@@ -4,21 +4,79 @@ __author__ = 'kk'
 import sys
 import os
 import time
-import zipfile
+import threading
+import atexit
+import gzip
+import queue
+import json
+import re
+import crash_ring
 
 stdout_tmp = None
 __log_file_path__ = './log_file/'
 __log_postfix__ = '.log'
 
+# 日志先写入内存缓冲，由后台线程按大小或时间批量落盘
+__flush_interval__ = 0.5
+__flush_size__ = 64 * 1024
+
+# 连续重复的日志合并输出，持续重复时每隔一段时间输出一次汇总
+__repeat_summary_interval__ = 10
+
+# 换日后的旧日志交给后台低优先级线程流式gzip压缩
+__compress_postfix__ = '.gz'
+__compress_chunk__ = 256 * 1024
+compress_queue = queue.Queue()
+compress_thread = None
+
+# 结构化打印任务日志：每天一个 jsonl 分段，jobs.idx 记录 sendId 所在分段和偏移
+__job_log_prefix__ = 'jobs_'
+__job_log_postfix__ = '.jsonl'
+__job_index_file__ = 'jobs.idx'
+
+# 单个日志文件超过上限后切分为 日期_序号.log；目录总量超过预算后从最旧的日志开始删除
+__log_max_size__ = 50 * 1024 * 1024
+__log_budget__ = 1024 * 1024 * 1024
+# 只匹配日志本身（含压缩后的 .gz 与旧版本按天打包的 .zip），压缩中的 .tmp、崩溃报告等不参与淘汰
+__log_name_pattern__ = re.compile(r'^(?:jobs_)?(\d{8})(?:_(\d+))?(?:\.log(?:\.gz)?|\.jsonl(?:\.gz)?|\.zip)$')
+
 def start_log():
     global stdout_tmp
     stdout_tmp = sys.stdout
     sys.stdout = Logger()
+    install_crash_flush(sys.stdout)
+    crash_ring.open_ring(__log_file_path__ + 'crash.ring')
 
 
 def stop_log():
     global stdout_tmp
+    log = sys.stdout
     sys.stdout = stdout_tmp
+    if isinstance(log, Logger):
+        log.close()
+
+
+def flush_log():
+    if isinstance(sys.stdout, Logger):
+        sys.stdout.flush()
+
+
+def install_crash_flush(log):
+    # 未捕获异常退出前先把缓冲写完，保证崩溃前的日志不丢
+    sys_hook = sys.excepthook
+    thread_hook = threading.excepthook
+
+    def excepthook(*args):
+        log.flush()
+        sys_hook(*args)
+
+    def thread_excepthook(args):
+        log.flush()
+        thread_hook(args)
+
+    sys.excepthook = excepthook
+    threading.excepthook = thread_excepthook
+    atexit.register(log.close)
 
 def create_dir_not_exist(path):
     if not os.path.exists(path):
@@ -29,40 +87,519 @@ def get_cur_time():
     return time.strftime('%Y%m%d', time.localtime(time.time()))
 
 
-def packet_log(date_s):
-    file_name = date_s + __log_postfix__
-    log_f_full = __log_file_path__+date_s+__log_postfix__
+def log_name(date_s, part=0):
+    if part == 0:
+        return date_s + __log_postfix__
+    return '%s_%d%s' % (date_s, part, __log_postfix__)
+
+
+def log_sort_key(name):
+    # 按日期、分段排序；其他文件（索引、临时文件等）不参与淘汰
+    match = __log_name_pattern__.match(name)
+    if match is None:
+        return None
+    return match.group(1), int(match.group(2) or 0), name
+
+
+class LogPolicy(object):
+    """ 热点调用处声明的日志采样策略：令牌桶限速（每秒 rate 条，最多突发 burst 条），
+    every 大于1时每 every 条只取一条；被丢弃的条数附在下一条输出的日志后面"""
+    def __init__(self, rate=1.0, burst=5, every=1):
+        self.rate = rate
+        self.burst = burst
+        self.every = every
+        self.tokens = burst
+        self.last_time = time.monotonic()
+        self.count = 0
+        self.suppressed = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last_time) * self.rate)
+            self.last_time = now
+            self.count += 1
+            if (self.count - 1) % self.every != 0 or self.tokens < 1:
+                self.suppressed += 1
+                return False, 0
+            self.tokens -= 1
+            suppressed, self.suppressed = self.suppressed, 0
+            return True, suppressed
+
+    def print(self, *args, **kwargs):
+        allowed, suppressed = self.allow()
+        if not allowed:
+            return
+        if suppressed > 0:
+            args = args + ('（已抑制 %d 条）' % suppressed,)
+        print(*args, **kwargs)
+
+    def reset(self):
+        with self.lock:
+            self.tokens = self.burst
+            self.count = 0
+            self.suppressed = 0
+
+
+class LogInventory(object):
+    """ 日志目录清单：启动时完整扫描一次，之后由本模块增量维护，
+    只有目录被外部修改（mtime 变化）时才重新扫描"""
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.files = None
+        self.dir_mtime = None
+
+    def scan(self):
+        files = {}
+        try:
+            with os.scandir(self.path) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        files[entry.name] = entry.stat().st_size
+            self.dir_mtime = os.stat(self.path).st_mtime
+        except OSError:
+            pass
+        self.files = files
+
+    def ensure(self):
+        if self.files is None:
+            self.scan()
+            return
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return
+        if mtime != self.dir_mtime:
+            self.scan()
+
+    def touch_dir(self):
+        # 本模块自己增删文件后同步目录mtime，避免下次误判为外部修改
+        try:
+            self.dir_mtime = os.stat(self.path).st_mtime
+        except OSError:
+            pass
+
+    def refresh(self, *names):
+        with self.lock:
+            if self.files is None:
+                return
+            for name in names:
+                try:
+                    self.files[name] = os.path.getsize(self.path + name)
+                except OSError:
+                    self.files.pop(name, None)
+            self.touch_dir()
+
+    def names(self):
+        with self.lock:
+            self.ensure()
+            return list(self.files)
+
+    def total(self):
+        with self.lock:
+            self.ensure()
+            return sum(self.files.values())
+
+    def enforce(self, budget, active=()):
+        with self.lock:
+            self.ensure()
+            # 正在写的文件大小变化不会改变目录mtime，单独取一次
+            for name in active:
+                try:
+                    self.files[name] = os.path.getsize(self.path + name)
+                except OSError:
+                    pass
+            total = sum(self.files.values())
+            removed = []
+            if total <= budget:
+                return removed
+            candidates = sorted((key, name) for key, name in
+                                ((log_sort_key(name), name) for name in self.files)
+                                if key is not None and name not in active)
+            for key, name in candidates:
+                if total <= budget:
+                    break
+                try:
+                    os.remove(self.path + name)
+                except OSError as e:
+                    print('删除旧日志失败：', name, e)
+                    continue
+                total -= self.files.pop(name)
+                removed.append(name)
+                print('日志超出磁盘预算，已删除：', name)
+            self.touch_dir()
+            return removed
+
+
+log_inventory = LogInventory(__log_file_path__)
+active_logs = set()
+
+
+def enforce_log_budget():
+    removed = log_inventory.enforce(__log_budget__, tuple(active_logs))
+    segments = [name for name in removed if name.startswith(__job_log_prefix__)]
+    if segments:
+        job_log.prune(segments)
+
+
+def lower_thread_priority():
     try:
-        if os.path.exists(log_f_full):
-            log_z = zipfile.ZipFile(__log_file_path__ + date_s + ".zip",'w')
-            log_z.write(log_f_full, file_name)
-            log_z.close()
-            os.remove(log_f_full)
+        if sys.platform == 'win32':
+            import ctypes
+            THREAD_PRIORITY_LOWEST = -2
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_PRIORITY_LOWEST)
+        elif hasattr(os, 'setpriority'):
+            # linux 下 PRIO_PROCESS 传入线程id即只影响当前线程
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+    except Exception:
+        pass
+
+
+def compress_worker():
+    lower_thread_priority()
+    while True:
+        log_f_full = compress_queue.get()
+        compress_log(log_f_full)
+        compress_queue.task_done()
+
+
+def compress_log(log_f_full):
+    gz_full = log_f_full + __compress_postfix__
+    tmp_full = gz_full + '.tmp'
+    try:
+        if not os.path.exists(log_f_full):
+            return
+        with open(log_f_full, 'rb') as f_in, gzip.open(tmp_full, 'wb') as f_out:
+            while True:
+                chunk = f_in.read(__compress_chunk__)
+                if not chunk:
+                    break
+                f_out.write(chunk)
+                # 每块之间让出CPU，避免与打印任务争抢
+                time.sleep(0)
+        os.replace(tmp_full, gz_full)
+        os.remove(log_f_full)
+        log_inventory.refresh(os.path.basename(log_f_full), os.path.basename(gz_full))
+        enforce_log_budget()
     except Exception as e:
         print(e)
         print('压缩日志失败：', log_f_full)
 
 
+def schedule_compress(log_f_full):
+    global compress_thread
+    if compress_thread is None:
+        compress_thread = threading.Thread(target=compress_worker, name='log-compress', daemon=True)
+        compress_thread.start()
+    compress_queue.put(log_f_full)
+
+
+def packet_stale_logs(current):
+    # 上次运行未来得及压缩的旧日志（如跨日期间被强制关闭），current 为正在使用的文件
+    for name in log_inventory.names():
+        if name.endswith((__log_postfix__, __job_log_postfix__)) and name not in current:
+            schedule_compress(__log_file_path__ + name)
+
+
+def current_log_part(date_s):
+    # 续写今天最后一个分段；该分段已压缩或已写满时新开一个
+    part = -1
+    for name in log_inventory.names():
+        if name.startswith(date_s):
+            key = log_sort_key(name)
+            if key is not None and key[0] == date_s:
+                part = max(part, key[1])
+    if part < 0:
+        return 0
+    name = log_name(date_s, part)
+    try:
+        if os.path.getsize(__log_file_path__ + name) < __log_max_size__:
+            return part
+    except OSError:
+        pass
+    return part + 1
+
+
+def read_lines_at(path, name, offsets):
+    # 分段可能已被压缩，偏移始终是未压缩内容中的位置；
+    # gzip 不能随机访问，seek 会从头解压到偏移处，因此同一分段按偏移升序只打开、解压一次
+    full = path + name
+    lines = {}
+    try:
+        if os.path.exists(full):
+            f = open(full, 'rb')
+        elif os.path.exists(full + __compress_postfix__):
+            f = gzip.open(full + __compress_postfix__, 'rb')
+        else:
+            return lines
+        with f:
+            for offset in sorted(set(offsets)):
+                f.seek(offset)
+                lines[offset] = f.readline()
+    except (OSError, EOFError) as e:
+        print('读取任务日志失败：', full, e)
+    return lines
+
+
+class JobLog(object):
+    """ 打印任务的结构化日志，与 stdout 日志并存，按 sendId 快速查找"""
+    def __init__(self, path=__log_file_path__):
+        self.path = path
+        self.lock = threading.Lock()
+        self.date_str = None
+        self.log = None
+        self.index_log = None
+        self.index = None
+        self.index_pos = 0
+
+    @staticmethod
+    def segment_name(date_s):
+        return __job_log_prefix__ + date_s + __job_log_postfix__
+
+    def open_segment(self):
+        date_s = get_cur_time()
+        if date_s == self.date_str:
+            return
+        create_dir_not_exist(self.path)
+        if self.log is not None:
+            self.log.close()
+            active_logs.discard(self.segment_name(self.date_str))
+            schedule_compress(self.path + self.segment_name(self.date_str))
+        self.date_str = date_s
+        self.log = open(self.path + self.segment_name(date_s), 'ab')
+        active_logs.add(self.segment_name(date_s))
+        log_inventory.refresh(self.segment_name(date_s))
+        if self.index_log is None:
+            self.index_log = open(self.path + __job_index_file__, 'ab')
+
+    def record(self, send_id, **fields):
+        job = {'sendId': str(send_id), 'time': int(round(time.time() * 1000))}
+        job.update(fields)
+        line = json.dumps(job, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8') + b'\n'
+        try:
+            with self.lock:
+                self.open_segment()
+                offset = self.log.tell()
+                self.log.write(line)
+                self.log.flush()
+                self.index_log.write(('%s\t%s\t%d\n' % (job['sendId'], self.segment_name(self.date_str),
+                                                         offset)).encode('utf-8'))
+                self.index_log.flush()
+        except OSError as e:
+            print('写入任务日志失败：', e)
+
+    def load_index(self):
+        # 只读取上次之后新追加的索引行
+        if self.index is None:
+            self.index = {}
+            self.index_pos = 0
+        try:
+            with open(self.path + __job_index_file__, 'rb') as f:
+                f.seek(self.index_pos)
+                data = f.read()
+        except OSError:
+            return
+        end = data.rfind(b'\n') + 1
+        self.index_pos += end
+        for line in data[:end].splitlines():
+            parts = line.decode('utf-8').split('\t')
+            if len(parts) == 3:
+                self.index.setdefault(parts[0], []).append((parts[1], int(parts[2])))
+
+    def prune(self, segments):
+        # 分段被预算淘汰后，从 jobs.idx 中去掉指向它的条目
+        segments = set(name[:-len(__compress_postfix__)] if name.endswith(__compress_postfix__) else name
+                       for name in segments)
+        index_full = self.path + __job_index_file__
+        with self.lock:
+            try:
+                with open(index_full, 'rb') as f:
+                    data = f.read()
+            except OSError:
+                return
+            kept = []
+            for line in data.splitlines(True):
+                parts = line.split(b'\t')
+                if len(parts) == 3 and parts[1].decode('utf-8') in segments:
+                    continue
+                kept.append(line)
+            if self.index_log is not None:
+                self.index_log.close()
+            try:
+                with open(index_full + '.tmp', 'wb') as f:
+                    f.writelines(kept)
+                os.replace(index_full + '.tmp', index_full)
+            except OSError as e:
+                print('清理任务索引失败：', e)
+            if self.index_log is not None:
+                self.index_log = open(index_full, 'ab')
+            self.index = None
+        log_inventory.refresh(__job_index_file__)
+
+    def find(self, send_id):
+        with self.lock:
+            self.load_index()
+            entries = list(self.index.get(str(send_id), ()))
+        segments = {}
+        for name, offset in entries:
+            segments.setdefault(name, []).append(offset)
+        lines = {name: read_lines_at(self.path, name, offsets) for name, offsets in segments.items()}
+        records = []
+        for name, offset in entries:
+            line = lines[name].get(offset)
+            if line:
+                records.append(json.loads(line.decode('utf-8')))
+        return records
+
+
+job_log = JobLog()
+
+
 class Logger(object):
     def __init__(self):
         create_dir_not_exist(__log_file_path__)
         self.terminal = sys.stdout
         self.date_str = get_cur_time()
-        self.log = open(__log_file_path__+self.date_str+__log_postfix__, "a")
+        self.part = current_log_part(self.date_str)
+        self.log_name = log_name(self.date_str, self.part)
+        self.log = open(__log_file_path__+self.log_name, "a")
+        self.size = self.log.tell()
+        active_logs.add(self.log_name)
+        packet_stale_logs((self.log_name, JobLog.segment_name(self.date_str)))
+        self.lock = threading.Lock()
+        self.io_lock = threading.Lock()
+        self.buffer = []
+        self.buffer_size = 0
+        self.partial = ''
+        self.last_line = None
+        self.repeat_count = 0
+        self.repeat_since = 0
+        self.closed = False
+        self.wakeup = threading.Event()
+        self.writer = threading.Thread(target=self.write_loop, name='logger', daemon=True)
+        self.writer.start()
 
     def write(self, message):
-        if self.date_str != get_cur_time():
-            self.log.close()
-            packet_log(self.date_str)
-            self.date_str = get_cur_time()
-            self.log = open(__log_file_path__ + self.date_str + __log_postfix__, "a")
+        # 调用方只追加到内存，不做任何系统调用
+        if self.closed:
+            self.terminal.write(message)
+            return
+        with self.lock:
+            text = self.partial + message
+            if '\n' in text:
+                lines = text.split('\n')
+                self.partial = lines.pop()
+            elif len(text) >= __flush_size__:
+                # 超长且没有换行的内容不再等待，直接作为一行输出
+                lines = [text]
+                self.partial = ''
+            else:
+                self.partial = text
+                return
+            for line in lines:
+                self.append_line(line)
+            full = self.buffer_size >= __flush_size__
+        if full:
+            self.wakeup.set()
+
+    def append_line(self, line):
+        # 连续重复的行只计数，换成其他内容（或间隔较久）时输出一条汇总
+        if line == self.last_line and line != '':
+            if self.repeat_count == 0:
+                self.repeat_since = time.time()
+            self.repeat_count += 1
+            return
+        self.flush_repeat()
+        self.last_line = line
+        self.buffer.append(line + '\n')
+        self.buffer_size += len(line) + 1
+        if crash_ring.ring is not None:
+            crash_ring.record(crash_ring.KIND_LOG, line)
+
+    def flush_repeat(self):
+        if self.repeat_count == 0:
+            return
+        summary = '（上一条日志重复 %d 次）' % self.repeat_count
+        self.repeat_count = 0
+        self.buffer.append(summary + '\n')
+        self.buffer_size += len(summary) + 1
+        if crash_ring.ring is not None:
+            crash_ring.record(crash_ring.KIND_LOG, summary)
+
+    def write_loop(self):
+        while not self.closed:
+            self.wakeup.wait(__flush_interval__)
+            self.wakeup.clear()
+            try:
+                self.drain()
+            except Exception:
+                pass
+
+    def drain(self):
+        with self.io_lock:
+            with self.lock:
+                if self.repeat_count > 0 and time.time() - self.repeat_since >= __repeat_summary_interval__:
+                    self.flush_repeat()
+                if len(self.buffer) == 0:
+                    return
+                messages = self.buffer
+                self.buffer = []
+                self.buffer_size = 0
+            data = ''.join(messages)
+
+            date_s = get_cur_time()
+            if self.date_str != date_s:
+                self.rotate(date_s, 0)
+            elif self.size >= __log_max_size__:
+                self.rotate(date_s, self.part + 1)
+
+            self.terminal.write(data)
+            self.terminal.flush()
+            self.log.write(data)
+            self.log.flush()
+            self.size = self.log.tell()
 
-        self.terminal.write(message)
-        self.log.write(message)
-        self.flush()
+    def rotate(self, date_s, part):
+        # 只切换文件，压缩与预算检查交给后台线程
+        self.log.close()
+        active_logs.discard(self.log_name)
+        schedule_compress(__log_file_path__ + self.log_name)
+        self.date_str = date_s
+        self.part = part
+        self.log_name = log_name(date_s, part)
+        self.log = open(__log_file_path__ + self.log_name, "a")
+        self.size = self.log.tell()
+        active_logs.add(self.log_name)
+        log_inventory.refresh(self.log_name)
 
     def flush(self):
-        self.log.flush()
+        # 显式 flush（含崩溃前的 excepthook）时，尚未换行的内容也一并输出
+        with self.lock:
+            if self.partial:
+                self.append_line(self.partial)
+                self.partial = ''
+        self.drain()
 
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.wakeup.set()
+        with self.lock:
+            if self.partial:
+                self.append_line(self.partial)
+                self.partial = ''
+            self.flush_repeat()
+        self.drain()
+        self.log.close()
+        crash_ring.close_ring()
 
 
+if __name__ == '__main__':
+    # 按 sendId 查询打印任务：python logger.py 2119
+    for send_id in sys.argv[1:]:
+        for job in job_log.find(send_id):
+            print(json.dumps(job, ensure_ascii=False))
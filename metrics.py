@@ -0,0 +1,233 @@
+# -*- coding:utf-8 -*-
+__author__ = 'kk'
+
+# 本地 OpenMetrics 指标，仅监听回环地址，供运维直接抓取打印机客户端状态
+# 抓取时只读取已聚合好的数值，不做任何阻塞采样
+
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+__metrics_host__ = '127.0.0.1'
+__metrics_port__ = 9108
+__content_type__ = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+__default_buckets__ = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+
+
+def format_labels(labelnames, key):
+    if len(labelnames) == 0:
+        return ''
+    pairs = []
+    for name, value in zip(labelnames, key):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append('%s="%s"' % (name, value))
+    return '{' + ','.join(pairs) + '}'
+
+
+def format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric(object):
+    type_name = 'unknown'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def header(self):
+        return ['# TYPE %s %s' % (self.name, self.type_name),
+                '# HELP %s %s' % (self.name, self.documentation)]
+
+    def render(self):
+        lines = self.header()
+        with self.lock:
+            items = list(self.values.items())
+        for key, value in items:
+            lines.append('%s%s %s' % (self.name, format_labels(self.labelnames, key), format_value(value)))
+        return lines
+
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        Metric.__init__(self, name, documentation, labelnames)
+        if len(self.labelnames) == 0:
+            self.values[()] = 0
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = self.header()
+        with self.lock:
+            items = list(self.values.items())
+        for key, value in items:
+            lines.append('%s_total%s %s' % (self.name, format_labels(self.labelnames, key), format_value(value)))
+        return lines
+
+
+class Gauge(Metric):
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        Metric.__init__(self, name, documentation, labelnames)
+        if len(self.labelnames) == 0:
+            self.values[()] = 0
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=__default_buckets__):
+        Metric.__init__(self, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                # 每个桶只记自身计数，输出时再累加
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = self.header()
+        with self.lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self.values.items()]
+        labelnames = self.labelnames + ('le',)
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                le = bound if bound == '+Inf' else format_value(float(bound))
+                lines.append('%s_bucket%s %d' % (self.name, format_labels(labelnames, key + (le,)), cumulative))
+            base = format_labels(self.labelnames, key)
+            lines.append('%s_count%s %d' % (self.name, base, count))
+            lines.append('%s_sum%s %s' % (self.name, base, format_value(total)))
+        return lines
+
+
+class Registry(object):
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        # collector() 返回 [(name, type, help, [(labels_dict, value), ...]), ...]
+        # 计数器、直方图的样本名带后缀，样本写作 (suffix, labels_dict, value)
+        self.collectors.append(collector)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=__default_buckets__):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                print('指标收集失败：', e)
+                continue
+            for name, type_name, documentation, samples in families:
+                lines.append('# TYPE %s %s' % (name, type_name))
+                lines.append('# HELP %s %s' % (name, documentation))
+                for sample in samples:
+                    suffix, labels, value = sample if len(sample) == 3 else ('',) + tuple(sample)
+                    keys = tuple(labels)
+                    lines.append('%s%s%s %s' % (name, suffix, format_labels(keys, tuple(labels[k] for k in keys)),
+                                                format_value(value)))
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+print_jobs = REGISTRY.counter('drims_print_jobs', '打印任务数', ('result',))
+print_job_seconds = REGISTRY.histogram('drims_print_job_seconds', '打印任务耗时（秒）', ('result',))
+ws_reconnects = REGISTRY.counter('drims_ws_reconnects', 'websocket 重连次数')
+browsers_active = REGISTRY.gauge('drims_browsers_active', '当前占用的浏览器实例数')
+driver_unreachable = REGISTRY.counter('drims_driver_unreachable', '浏览器驱动失去响应次数')
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', __content_type__)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 抓取很频繁，不写入日志
+        pass
+
+
+server = None
+
+
+def start_server(port=__metrics_port__, host=__metrics_host__):
+    global server
+    if server is not None:
+        return server
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        print('指标服务启动失败：', e)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    print('指标服务已启动：http://%s:%d/metrics' % (host, port))
+    return server
+
+
+def stop_server():
+    global server
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+        server = None
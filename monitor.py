@@ -5,6 +5,10 @@ import psutil
 import time
 # import pynvml
 import platform
+import json
+import os
+import threading
+import heapq
 # from publisher import Publisher
 # import json
 # import threading
@@ -13,6 +17,215 @@ import platform
 __publish_report_interval_default__ = 3
 __publish_report_interval_max__ = 20
 
+# 主机静态信息（WMI查询较慢）缓存，超过刷新间隔后在后台线程重新采集
+__base_info_cache_file__ = './pcinfo_cache.json'
+__base_info_refresh__ = 24 * 3600
+__host_info_keys__ = ('user', 'cpu_name', 'sys_caption', 'sys_path', 'sys_serial', 'disk_caption', 'fan_status')
+
+# 后台采样间隔（秒）与EWMA平滑系数，系数越大越贴近最新一次采样
+__sample_interval__ = 1
+__ewma_alpha__ = 0.3
+
+
+class IORateEngine:
+    """ 按磁盘/网卡分别统计速率并做EWMA平滑，速度单位为 bytes/s，iops 单位为 次/s"""
+    disk_fields = ('read_speed', 'write_speed', 'read_iops', 'write_iops')
+    nic_fields = ('sent_speed', 'recv_speed', 'sent_pps', 'recv_pps')
+
+    def __init__(self, alpha=__ewma_alpha__):
+        self.alpha = alpha
+        self.lock = threading.Lock()
+        self.last_time = None
+        self.last_disk = {}
+        self.last_nic = {}
+        self.disk_rates = {}
+        self.nic_rates = {}
+
+    @staticmethod
+    def read_disk():
+        try:
+            infos = psutil.disk_io_counters(perdisk=True) or {}
+        except Exception:
+            # 部分虚拟机/容器没有磁盘计数器
+            return {}
+        return {name: (c.read_bytes, c.write_bytes, c.read_count, c.write_count) for name, c in infos.items()}
+
+    @staticmethod
+    def read_nic():
+        infos = psutil.net_io_counters(pernic=True) or {}
+        return {name: (c.bytes_sent, c.bytes_recv, c.packets_sent, c.packets_recv) for name, c in infos.items()}
+
+    def update(self, rates, last, current, elapsed):
+        alpha = self.alpha
+        for name, counters in current.items():
+            prev = last.get(name)
+            if prev is None:
+                continue
+            # 计数器回绕或设备重置时差值为负，按0处理
+            values = [max(c - p, 0) / elapsed for c, p in zip(counters, prev)]
+            smoothed = rates.get(name)
+            if smoothed is None:
+                rates[name] = values
+            else:
+                for i, v in enumerate(values):
+                    smoothed[i] += alpha * (v - smoothed[i])
+        for name in [name for name in rates if name not in current]:
+            del rates[name]
+
+    def sample(self):
+        now = time.monotonic()
+        disk = self.read_disk()
+        nic = self.read_nic()
+        with self.lock:
+            if self.last_time is not None:
+                elapsed = now - self.last_time
+                if elapsed > 0:
+                    self.update(self.disk_rates, self.last_disk, disk, elapsed)
+                    self.update(self.nic_rates, self.last_nic, nic, elapsed)
+            self.last_time = now
+            self.last_disk = disk
+            self.last_nic = nic
+
+    @property
+    def ready(self):
+        return len(self.disk_rates) > 0 or len(self.nic_rates) > 0
+
+    @staticmethod
+    def top(rates, fields, name_key, k, key):
+        # k 为 None 时返回全部设备
+        if k is None:
+            items = sorted(rates.items(), key=key, reverse=True)
+        else:
+            items = heapq.nlargest(k, rates.items(), key=key)
+        results = []
+        for name, values in items:
+            item = {name_key: name}
+            item.update(zip(fields, values))
+            results.append(item)
+        return results
+
+    def top_disks(self, k=1, by='throughput'):
+        # by: throughput 按读写字节数，iops 按读写次数
+        if by == 'iops':
+            key = lambda item: item[1][2] + item[1][3]
+        else:
+            key = lambda item: item[1][0] + item[1][1]
+        with self.lock:
+            return self.top(self.disk_rates, self.disk_fields, 'device_name', k, key)
+
+    def top_nics(self, k=1, by='throughput'):
+        if by == 'pps':
+            key = lambda item: item[1][2] + item[1][3]
+        else:
+            key = lambda item: item[1][0] + item[1][1]
+        with self.lock:
+            return self.top(self.nic_rates, self.nic_fields, 'nic_name', k, key)
+
+    def nic_total(self):
+        with self.lock:
+            return {'sent_speed': sum(v[0] for v in self.nic_rates.values()),
+                    'recv_speed': sum(v[1] for v in self.nic_rates.values())}
+
+# 告警默认配置：CPU持续高占用、可用内存过低、磁盘剩余空间下降过快、指标突变（z-score）
+__alert_default__ = {'cpu_high': 90,
+                     'cpu_sustain': 60,
+                     'mem_low_mb': 300,
+                     'mem_sustain': 10,
+                     'disk_fill_mb_per_min': 200,
+                     'disk_sustain': 30,
+                     'zscore': 4,
+                     'zscore_warmup': 120,
+                     'cooldown': 300}
+
+
+class RunningStats:
+    """ 指数加权的均值/方差，每次采样 O(1) 更新"""
+    def __init__(self, alpha=0.05):
+        self.alpha = alpha
+        self.mean = None
+        self.var = 0.0
+        self.count = 0
+
+    def zscore(self, value):
+        if self.mean is None or self.var <= 0:
+            return 0.0
+        return (value - self.mean) / (self.var ** 0.5)
+
+    def update(self, value):
+        self.count += 1
+        if self.mean is None:
+            self.mean = value
+            return
+        diff = value - self.mean
+        incr = self.alpha * diff
+        self.mean += incr
+        self.var = (1 - self.alpha) * (self.var + diff * incr)
+
+
+class AlertEvaluator:
+    """ 每次采样增量判断告警规则，条件持续满足 sustain 秒后触发，恢复后发送解除"""
+    def __init__(self, on_alert, config=None):
+        self.on_alert = on_alert
+        self.config = dict(__alert_default__)
+        if config:
+            self.config.update(config)
+        self.pending = {}
+        self.active = {}
+        self.last_fired = {}
+        self.last_disk_free = None
+        self.last_time = None
+        self.disk_fill_rate = None
+        self.stats = {'cpu_average': RunningStats(), 'memory_percent': RunningStats()}
+
+    def evaluate(self, snapshot):
+        now = snapshot['time']
+        cfg = self.config
+        mb = 1024 * 1024
+
+        if self.last_time is not None and now > self.last_time:
+            # 剩余空间每分钟减少的字节数，做平滑避免单次写盘抖动
+            rate = (self.last_disk_free - snapshot['disk_free']) / (now - self.last_time) * 60
+            self.disk_fill_rate = rate if self.disk_fill_rate is None else \
+                self.disk_fill_rate + 0.2 * (rate - self.disk_fill_rate)
+        self.last_time = now
+        self.last_disk_free = snapshot['disk_free']
+
+        self.check('cpu_high', snapshot['cpu_average'] > cfg['cpu_high'],
+                   snapshot['cpu_average'], cfg['cpu_sustain'], now)
+        self.check('mem_low', snapshot['memory_available'] < cfg['mem_low_mb'] * mb,
+                   snapshot['memory_available'], cfg['mem_sustain'], now)
+        if self.disk_fill_rate is not None:
+            self.check('disk_fill', self.disk_fill_rate > cfg['disk_fill_mb_per_min'] * mb,
+                       self.disk_fill_rate, cfg['disk_sustain'], now)
+
+        for key, stats in self.stats.items():
+            value = snapshot[key]
+            z = stats.zscore(value)
+            warm = stats.count >= cfg['zscore_warmup']
+            self.check(key + '_anomaly', warm and abs(z) > cfg['zscore'], round(z, 2), 0, now)
+            stats.update(value)
+
+    def check(self, name, matched, value, sustain, now):
+        if not matched:
+            self.pending.pop(name, None)
+            if self.active.pop(name, None) is not None:
+                self.on_alert(name, 'resolved', value)
+            return
+        if name in self.active:
+            return
+        since = self.pending.setdefault(name, now)
+        if now - since < sustain:
+            return
+        if name in self.last_fired and now - self.last_fired[name] < self.config['cooldown']:
+            return
+        self.active[name] = now
+        self.last_fired[name] = now
+        self.on_alert(name, 'firing', value)
+
+    def is_active(self, name):
+        return name in self.active
+
+
 class Monitor:
     """ 速度单位为 bytes/s"""
     def __init__(self, worker=None, interval=1):
@@ -24,26 +237,22 @@ class Monitor:
         self.platform = platform.platform()
         self.architecture = platform.architecture()
         self.memory_total = psutil.virtual_memory().total
-        self.user = psutil.users()[0].name
-        self.cpu_name = None
-        self.sys_caption = None
-        self.sys_path = None
-        self.sys_serial = None
-        self.disk_caption = None
-        self.fan_status = None
-        if self.system == 'Windows':
-            try:
-                import wmi
-                w = wmi.WMI()
-                self.user = w.Win32_ComputerSystem()[0].UserName
-                self.cpu_name = w.Win32_Processor()[0].Name
-                self.sys_caption = w.Win32_OperatingSystem()[0].Caption
-                self.sys_path = w.Win32_OperatingSystem()[0].WindowsDirectory
-                self.sys_serial = w.Win32_OperatingSystem()[0].SerialNumber
-                self.disk_caption = w.Win32_DiskDrive()[0].Caption
-                self.fan_status = w.Win32_Fan()[0].status
-            except Exception as e:
-                print(e)
+        self.io_rate = IORateEngine()
+        self.sample_thread = None
+        self.sample_stop = threading.Event()
+        self.snapshot = None
+        self.alert = None
+        # 静态信息（user/cpu_name/...）整体替换，读取方不会看到采集到一半的记录
+        self.host_info = {}
+        # 静态信息不在启动路径上采集：优先读取缓存，过期则交给后台线程
+        self.base_info_ready = threading.Event()
+        self.base_info_thread = None
+        self.base_info_lock = threading.Lock()
+        self.base_info_waiters = []
+        self.base_info_time = None
+        if self.load_base_info_cache() is not None:
+            self.base_info_ready.set()
+        self.refresh_base_info_if_stale()
 
         # if self.worker is None:
         #     self.worker = self.user
@@ -51,6 +260,179 @@ class Monitor:
         # self.publish_timer = None
 
 
+    def refresh_base_info(self):
+        # 后台刷新静态信息，已有线程在跑时不重复启动
+        if self.base_info_thread is not None and self.base_info_thread.is_alive():
+            return
+        self.base_info_thread = threading.Thread(target=self.collect_base_info, name='pcinfo', daemon=True)
+        self.base_info_thread.start()
+
+    def refresh_base_info_if_stale(self):
+        # 缓存缺失或超过刷新周期时在后台重新采集，由 get_base_info 和采样线程调用
+        base_info_time = self.base_info_time
+        if base_info_time is None or time.time() - base_info_time > __base_info_refresh__:
+            self.refresh_base_info()
+
+    def collect_base_info(self):
+        # 先在局部采集完整，再一次性发布
+        info = dict.fromkeys(__host_info_keys__)
+        try:
+            users = psutil.users()
+            if len(users) > 0:
+                info['user'] = users[0].name
+        except Exception as e:
+            print(e)
+        if self.system == 'Windows':
+            Monitor.collect_wmi_info(info)
+        with self.base_info_lock:
+            self.host_info = info
+            self.base_info_time = time.time()
+            self.base_info_ready.set()
+            waiters, self.base_info_waiters = self.base_info_waiters, []
+        self.save_base_info_cache()
+        for callback in waiters:
+            try:
+                callback()
+            except Exception as e:
+                print('主机信息回调失败：', e)
+
+    @staticmethod
+    def collect_wmi_info(info):
+        try:
+            # 非主线程中使用WMI需要先初始化COM，用完释放
+            import pythoncom
+        except ImportError:
+            pythoncom = None
+        if pythoncom is not None:
+            pythoncom.CoInitialize()
+        try:
+            import wmi
+            w = wmi.WMI()
+            os_info = w.Win32_OperatingSystem()[0]
+            info['user'] = w.Win32_ComputerSystem()[0].UserName
+            info['cpu_name'] = w.Win32_Processor()[0].Name
+            info['sys_caption'] = os_info.Caption
+            info['sys_path'] = os_info.WindowsDirectory
+            info['sys_serial'] = os_info.SerialNumber
+            info['disk_caption'] = w.Win32_DiskDrive()[0].Caption
+            fans = w.Win32_Fan()
+            info['fan_status'] = fans[0].status if len(fans) > 0 else None
+        except Exception as e:
+            print(e)
+        finally:
+            if pythoncom is not None:
+                pythoncom.CoUninitialize()
+
+    def when_base_info_ready(self, callback):
+        # 静态信息已就绪返回False；否则登记回调，采集完成后调用
+        with self.base_info_lock:
+            if self.base_info_ready.is_set():
+                return False
+            self.base_info_waiters.append(callback)
+            return True
+
+    def load_base_info_cache(self):
+        # 返回缓存的年龄（秒），缓存不存在或不可用时返回None
+        try:
+            with open(__base_info_cache_file__, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+            if cache.get('platform') != self.platform:
+                return None
+            cache_time = cache.get('time', 0)
+            cache_age = time.time() - cache_time
+            self.host_info = {key: cache.get(key) for key in __host_info_keys__}
+            self.base_info_time = cache_time
+            return cache_age
+        except (OSError, ValueError, TypeError, AttributeError):
+            return None
+
+    def save_base_info_cache(self):
+        cache = {'time': self.base_info_time,
+                 'platform': self.platform}
+        cache.update(self.host_info)
+        try:
+            tmp_file = __base_info_cache_file__ + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(cache, f)
+            os.replace(tmp_file, __base_info_cache_file__)
+        except OSError as e:
+            print('保存主机信息缓存失败：', e)
+
+    def start_sampling(self, interval=__sample_interval__):
+        # 后台定时采样，get_report 可直接读取平滑后的结果而不必阻塞等待
+        if self.sample_thread is not None and self.sample_thread.is_alive():
+            return
+        self.sample_stop.clear()
+        self.sample_thread = threading.Thread(target=self.sample_loop, args=(interval,),
+                                              name='monitor', daemon=True)
+        self.sample_thread.start()
+
+    def stop_sampling(self):
+        self.sample_stop.set()
+
+    def sample_loop(self, interval):
+        while not self.sample_stop.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                print('监控采样失败：', e)
+            self.refresh_base_info_if_stale()
+            self.sample_stop.wait(interval)
+
+    def sample(self):
+        self.io_rate.sample()
+        cpu_per = psutil.cpu_percent(None, True)
+        vm = psutil.virtual_memory()
+        sm = psutil.swap_memory()
+        du = psutil.disk_usage('/')
+        self.snapshot = {'time': time.time(),
+                         'cpu_average': sum(cpu_per) / max(len(cpu_per), 1),
+                         'memory_available': vm.available,
+                         'memory_percent': vm.percent,
+                         'swap_percent': sm.percent,
+                         'disk_free': du.free,
+                         'disk_percent': du.percent}
+        if self.alert is not None:
+            try:
+                self.alert.evaluate(self.snapshot)
+            except Exception as e:
+                print('告警判断失败：', e)
+
+    def set_alert(self, on_alert, config=None):
+        self.alert = AlertEvaluator(on_alert, config)
+        return self.alert
+
+    def collect_metrics(self):
+        # 只读取后台采样的结果，供指标服务调用
+        families = [('drims_memory_total_bytes', 'gauge', '物理内存总量', [({}, self.memory_total)]),
+                    ('drims_cpu_cores', 'gauge', 'CPU核数', [({}, self.cpu_count)])]
+        snapshot = self.snapshot
+        if snapshot is not None:
+            families.extend([
+                ('drims_cpu_percent', 'gauge', 'CPU平均占用率', [({}, snapshot['cpu_average'])]),
+                ('drims_memory_available_bytes', 'gauge', '可用内存', [({}, snapshot['memory_available'])]),
+                ('drims_memory_percent', 'gauge', '内存占用率', [({}, snapshot['memory_percent'])]),
+                ('drims_swap_percent', 'gauge', '交换区占用率', [({}, snapshot['swap_percent'])]),
+                ('drims_disk_free_bytes', 'gauge', '项目盘剩余空间', [({}, snapshot['disk_free'])]),
+                ('drims_disk_percent', 'gauge', '项目盘占用率', [({}, snapshot['disk_percent'])]),
+                ('drims_monitor_sample_timestamp_seconds', 'gauge', '最近一次采样时间', [({}, snapshot['time'])]),
+            ])
+        disks = self.io_rate.top_disks(None)
+        families.append(('drims_disk_read_bytes_per_second', 'gauge', '磁盘读速度（EWMA）',
+                         [({'device': d['device_name']}, d['read_speed']) for d in disks]))
+        families.append(('drims_disk_write_bytes_per_second', 'gauge', '磁盘写速度（EWMA）',
+                         [({'device': d['device_name']}, d['write_speed']) for d in disks]))
+        nics = self.io_rate.top_nics(None)
+        families.append(('drims_net_sent_bytes_per_second', 'gauge', '网卡发送速度（EWMA）',
+                          [({'nic': n['nic_name']}, n['sent_speed']) for n in nics]))
+        families.append(('drims_net_recv_bytes_per_second', 'gauge', '网卡接收速度（EWMA）',
+                          [({'nic': n['nic_name']}, n['recv_speed']) for n in nics]))
+        return families
+
+    @property
+    def sampling(self):
+        return self.sample_thread is not None and self.sample_thread.is_alive()
+
     @staticmethod
     def get_cpu_count():
         return psutil.cpu_count()
@@ -81,15 +463,20 @@ class Monitor:
 
     def get_disk_io(self, device_all=False):
         # device_all 为 false 时，返回最大的读写速度
-        def get_io():
-            infos = psutil.disk_io_counters(1).items()
-            return [(item[0], item[1].read_bytes, item[1].write_bytes) for item in infos]
+        if self.sampling and self.io_rate.ready:
+            results = self.io_rate.top_disks(None if device_all else 1)
+            if device_all:
+                return results
+            if len(results) == 0:
+                return {'read_speed': 0, 'write_speed': 0}
+            return {'read_speed': results[0]['read_speed'], 'write_speed': results[0]['write_speed']}
 
-        start = get_io()
+        start = IORateEngine.read_disk()
         time.sleep(self.interval)
-        end = get_io()
-        results = [{'device_name': item[0], 'read_speed': (item[1] - start[index][1]) / self.interval,
-                    'write_speed': (item[2] - start[index][2]) / self.interval} for index, item in enumerate(end)]
+        end = IORateEngine.read_disk()
+        results = [{'device_name': name, 'read_speed': (item[0] - start[name][0]) / self.interval,
+                    'write_speed': (item[1] - start[name][1]) / self.interval}
+                   for name, item in end.items() if name in start]
         if device_all:
             return results
         else:
@@ -97,12 +484,17 @@ class Monitor:
             for index, item in enumerate(results):
                 speed = item['read_speed'] + item['write_speed']
                 if speed > speed_max:
-                    index_max = index
+                    speed_max, index_max = speed, index
+            if len(results) == 0:
+                return {'read_speed': 0, 'write_speed': 0}
             results_filted = results[index_max]
             del results_filted['device_name']
             return results_filted
 
     def get_net_io(self):
+        if self.sampling and self.io_rate.ready:
+            return self.io_rate.nic_total()
+
         def get_io():
             infos = psutil.net_io_counters()
             return infos.bytes_sent, infos.bytes_recv
@@ -138,20 +530,17 @@ class Monitor:
                 }
 
     def get_base_info(self):
+        # 不等待后台采集：未就绪时只返回基础部分，可用when_base_info_ready补发
+        self.refresh_base_info_if_stale()
+        host_info = self.host_info
         infos = {'system': self.system,
                  'platform': self.platform,
                  'architecture': self.architecture,
                  'cpu_cores': self.cpu_count,
                  'memory_total': self.memory_total,
                  }
-        if self.system == 'Windows' and (self.cpu_name is not None):
-            infos['user'] = self.user
-            infos['cpu_name'] = self.cpu_name
-            infos['sys_caption'] = self.sys_caption
-            infos['sys_path'] = self.sys_path
-            infos['sys_serial'] = self.sys_serial
-            infos['disk_caption'] = self.disk_caption
-            infos['fan_status'] = self.fan_status
+        if self.system == 'Windows' and (host_info.get('cpu_name') is not None):
+            infos.update(host_info)
         return infos
 
     # def publish_report_start(self):
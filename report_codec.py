@@ -0,0 +1,234 @@
+# -*- coding:utf-8 -*-
+__author__ = 'kk'
+
+# report / pcinfo 的紧凑二进制编码，服务端通过 infoOrder#//encoding_bin 协商启用
+# 格式：magic(2) + version(u8) + kind(u8) + 若干 [field_id(u8) + 长度(u16) + value]
+# 百分比为定点数（*100 存 u16），字节数为 u64，速度为 u32（bytes/s），字符串为 utf8
+# 每个字段都带长度，解码端跳过不认识的 field_id：新增字段只需追加新的 field_id，
+# 旧版本解码端仍可读取新版本客户端的数据；旧字段的 id 与类型不可修改
+
+import struct
+
+__magic__ = b'DR'
+__version__ = 2
+
+KIND_REPORT = 1
+KIND_PCINFO = 2
+
+_header = struct.Struct('<2sBB')
+_field = struct.Struct('<BH')
+_u16 = struct.Struct('<H')
+_u32 = struct.Struct('<I')
+_u64 = struct.Struct('<Q')
+
+_u32_max = 0xFFFFFFFF
+_u64_max = 0xFFFFFFFFFFFFFFFF
+
+# (field_id, 字典路径, 类型)
+REPORT_SCHEMA = (
+    (1, ('time',), 'u64'),
+    (2, ('cpu', 'average'), 'pct'),
+    (3, ('cpu', 'per'), 'pct_list'),
+    (4, ('memory', 'virtual', 'total'), 'u64'),
+    (5, ('memory', 'virtual', 'available'), 'u64'),
+    (6, ('memory', 'virtual', 'percent'), 'pct'),
+    (7, ('memory', 'virtual', 'used'), 'u64'),
+    (8, ('memory', 'virtual', 'free'), 'u64'),
+    (9, ('memory', 'swap', 'total'), 'u64'),
+    (10, ('memory', 'swap', 'used'), 'u64'),
+    (11, ('memory', 'swap', 'free'), 'u64'),
+    (12, ('memory', 'swap', 'percent'), 'pct'),
+    (13, ('disk_used', 'total'), 'u64'),
+    (14, ('disk_used', 'used'), 'u64'),
+    (15, ('disk_used', 'free'), 'u64'),
+    (16, ('disk_used', 'percent'), 'pct'),
+    (17, ('disk_io', 'read_speed'), 'u32'),
+    (18, ('disk_io', 'write_speed'), 'u32'),
+    (19, ('net_io', 'sent_speed'), 'u32'),
+    (20, ('net_io', 'recv_speed'), 'u32'),
+    # psutil 按平台提供的其余内存字段
+    (21, ('memory', 'virtual', 'active'), 'u64'),
+    (22, ('memory', 'virtual', 'inactive'), 'u64'),
+    (23, ('memory', 'virtual', 'buffers'), 'u64'),
+    (24, ('memory', 'virtual', 'cached'), 'u64'),
+    (25, ('memory', 'virtual', 'shared'), 'u64'),
+    (26, ('memory', 'virtual', 'slab'), 'u64'),
+    (27, ('memory', 'virtual', 'wired'), 'u64'),
+    (28, ('memory', 'swap', 'sin'), 'u64'),
+    (29, ('memory', 'swap', 'sout'), 'u64'),
+)
+
+PCINFO_SCHEMA = (
+    (1, ('system',), 'str'),
+    (2, ('platform',), 'str'),
+    (3, ('architecture',), 'str_list'),
+    (4, ('cpu_cores',), 'u32'),
+    (5, ('memory_total',), 'u64'),
+    (6, ('user',), 'str'),
+    (7, ('cpu_name',), 'str'),
+    (8, ('sys_caption',), 'str'),
+    (9, ('sys_path',), 'str'),
+    (10, ('sys_serial',), 'str'),
+    (11, ('disk_caption',), 'str'),
+    (12, ('fan_status',), 'str'),
+)
+
+SCHEMAS = {KIND_REPORT: REPORT_SCHEMA, KIND_PCINFO: PCINFO_SCHEMA}
+
+
+def _clamp(value, max_value):
+    value = int(round(value))
+    return 0 if value < 0 else (max_value if value > max_value else value)
+
+
+def _pack_str(value):
+    return str(value).encode('utf-8')[:0xFFFF]
+
+
+def _pack_value(kind, value):
+    if kind == 'u64':
+        return _u64.pack(_clamp(value, _u64_max))
+    if kind == 'u32':
+        return _u32.pack(_clamp(value, _u32_max))
+    if kind == 'pct':
+        return _u16.pack(_clamp(value * 100, 0xFFFF))
+    if kind == 'pct_list':
+        return struct.pack('<%dH' % len(value), *[_clamp(v * 100, 0xFFFF) for v in value])
+    if kind == 'str':
+        return _pack_str(value)
+    if kind == 'str_list':
+        parts = []
+        for item in value:
+            data = _pack_str(item)
+            parts.append(_u16.pack(len(data)))
+            parts.append(data)
+        return b''.join(parts)
+    raise ValueError('unknown field kind: %s' % kind)
+
+
+def _lookup(data, path):
+    for key in path:
+        if not isinstance(data, dict) or key not in data:
+            return None
+        data = data[key]
+    return data
+
+
+_formats = {'u64': 'Q', 'u32': 'I', 'pct': 'H'}
+_sizes = {'u64': 8, 'u32': 4, 'pct': 2}
+_struct_cache = {}
+
+
+def _encode_numeric(kind, data):
+    # 纯数值的 schema（report）按字段布局缓存整体 Struct，一次 pack 完成
+    layout = []
+    values = []
+    for field_id, path, field_kind in SCHEMAS[kind]:
+        value = _lookup(data, path)
+        if value is None:
+            continue
+        if field_kind == 'pct_list':
+            layout.append((field_id, len(value)))
+            values.append(field_id)
+            values.append(len(value) * 2)
+            values.extend([_clamp(v * 100, 0xFFFF) for v in value])
+        else:
+            layout.append(field_id)
+            values.append(field_id)
+            values.append(_sizes[field_kind])
+            if field_kind == 'pct':
+                values.append(_clamp(value * 100, 0xFFFF))
+            else:
+                values.append(_clamp(value, _u64_max if field_kind == 'u64' else _u32_max))
+    key = (kind, tuple(layout))
+    packer = _struct_cache.get(key)
+    if packer is None:
+        fmt = ['<2sBB']
+        kinds = {field_id: field_kind for field_id, path, field_kind in SCHEMAS[kind]}
+        for item in layout:
+            if isinstance(item, tuple):
+                fmt.append('BH%dH' % item[1])
+            else:
+                fmt.append('BH' + _formats[kinds[item]])
+        packer = _struct_cache[key] = struct.Struct(''.join(fmt))
+    return packer.pack(__magic__, __version__, kind, *values)
+
+
+def encode(kind, data):
+    if kind == KIND_REPORT:
+        return _encode_numeric(kind, data)
+    parts = [_header.pack(__magic__, __version__, kind)]
+    for field_id, path, field_kind in SCHEMAS[kind]:
+        value = _lookup(data, path)
+        if value is None:
+            # 缺失字段直接跳过，解码端按缺省处理
+            continue
+        packed = _pack_value(field_kind, value)
+        parts.append(_field.pack(field_id, len(packed)))
+        parts.append(packed)
+    return b''.join(parts)
+
+
+def encode_report(report):
+    return encode(KIND_REPORT, report)
+
+
+def encode_pcinfo(infos):
+    return encode(KIND_PCINFO, infos)
+
+
+def _unpack_str(buf, offset):
+    (length,) = _u16.unpack_from(buf, offset)
+    offset += _u16.size
+    return bytes(buf[offset:offset + length]).decode('utf-8'), offset + length
+
+
+def _unpack_value(buf, offset, kind, length):
+    # length 为字段字节数
+    if kind == 'u64':
+        return _u64.unpack_from(buf, offset)[0], offset + _u64.size
+    if kind == 'u32':
+        return _u32.unpack_from(buf, offset)[0], offset + _u32.size
+    if kind == 'pct':
+        return _u16.unpack_from(buf, offset)[0] / 100, offset + _u16.size
+    if kind == 'pct_list':
+        count = length // _u16.size
+        values = struct.unpack_from('<%dH' % count, buf, offset)
+        return [v / 100 for v in values], offset + count * _u16.size
+    if kind == 'str':
+        return bytes(buf[offset:offset + length]).decode('utf-8'), offset + length
+    if kind == 'str_list':
+        values = []
+        end = offset + length
+        while offset < end:
+            value, offset = _unpack_str(buf, offset)
+            values.append(value)
+        return values, offset
+    raise ValueError('unknown field kind: %s' % kind)
+
+
+def decode(buf):
+    """ 解码为与 json 版本相同结构的字典，返回 (kind, data)；不认识的字段跳过"""
+    magic, version, kind = _header.unpack_from(buf, 0)
+    if magic != __magic__:
+        raise ValueError('bad magic')
+    if version != __version__:
+        raise ValueError('unsupported version: %d' % version)
+    fields = {field_id: (path, field_kind) for field_id, path, field_kind in SCHEMAS.get(kind, ())}
+    data = {}
+    offset = _header.size
+    while offset < len(buf):
+        field_id, length = _field.unpack_from(buf, offset)
+        offset += _field.size
+        if offset + length > len(buf):
+            raise ValueError('truncated field: %d' % field_id)
+        if field_id not in fields:
+            offset += length
+            continue
+        path, field_kind = fields[field_id]
+        value, offset = _unpack_value(buf, offset, field_kind, length)
+        target = data
+        for key in path[:-1]:
+            target = target.setdefault(key, {})
+        target[path[-1]] = value
+    return kind, data
@@ -0,0 +1,56 @@
+import monitor
+
+MB = 1024 * 1024
+
+
+def snapshot(now, cpu=10.0, memory_available=4096 * MB, disk_free=100000 * MB, memory_percent=40.0):
+    return {'time': now, 'cpu_average': cpu, 'memory_available': memory_available,
+            'memory_percent': memory_percent, 'disk_free': disk_free}
+
+
+def make_evaluator(**config):
+    events = []
+    evaluator = monitor.AlertEvaluator(lambda name, state, value: events.append((name, state)), config)
+    return evaluator, events
+
+
+def test_cpu_high_fires_only_after_sustain_and_resolves():
+    evaluator, events = make_evaluator(cpu_high=80, cpu_sustain=10)
+    evaluator.evaluate(snapshot(0, cpu=95))
+    evaluator.evaluate(snapshot(5, cpu=95))
+    assert events == []
+    evaluator.evaluate(snapshot(10, cpu=95))
+    assert events == [('cpu_high', 'firing')]
+    assert evaluator.is_active('cpu_high')
+    evaluator.evaluate(snapshot(11, cpu=95))
+    assert events == [('cpu_high', 'firing')]
+    evaluator.evaluate(snapshot(12, cpu=20))
+    assert events[-1] == ('cpu_high', 'resolved')
+    assert not evaluator.is_active('cpu_high')
+
+
+def test_interrupted_condition_restarts_sustain():
+    evaluator, events = make_evaluator(cpu_high=80, cpu_sustain=10)
+    evaluator.evaluate(snapshot(0, cpu=95))
+    evaluator.evaluate(snapshot(8, cpu=20))
+    evaluator.evaluate(snapshot(12, cpu=95))
+    evaluator.evaluate(snapshot(18, cpu=95))
+    assert events == []
+
+
+def test_cooldown_suppresses_refiring():
+    evaluator, events = make_evaluator(mem_low_mb=300, mem_sustain=0, cooldown=300)
+    evaluator.evaluate(snapshot(0, memory_available=100 * MB))
+    evaluator.evaluate(snapshot(1))
+    evaluator.evaluate(snapshot(2, memory_available=100 * MB))
+    assert events == [('mem_low', 'firing'), ('mem_low', 'resolved')]
+    evaluator.evaluate(snapshot(400, memory_available=100 * MB))
+    assert events[-1] == ('mem_low', 'firing')
+
+
+def test_disk_fill_rate():
+    evaluator, events = make_evaluator(disk_fill_mb_per_min=100, disk_sustain=0)
+    evaluator.evaluate(snapshot(0, disk_free=10000 * MB))
+    # 1000MB in 60s is far above 100MB/min
+    evaluator.evaluate(snapshot(60, disk_free=9000 * MB))
+    assert ('disk_fill', 'firing') in events
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from EDGE.common.exceptions import DriverUnreachableException, NoSuchElementException
+from EDGE.web.remote.async_webdriver import AsyncWebDriver, AsyncWebElement
+from EDGE.web.remote.marshalling import ELEMENT_KEY
+
+
+class FakeDriverService(object):
+    """
+    A driver service on the running loop speaking just enough HTTP/1.1 and W3C:
+    ``execute/sync`` sleeps ``arguments[0]`` seconds and echoes its arguments.
+    """
+    def __init__(self):
+        self.requests = []
+        self.connections = 0
+        self.sessions = 0
+        self.drop_next = False
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        return 'http://127.0.0.1:%d' % self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                params = json.loads(body) if body else {}
+                self.requests.append((method, path, params))
+                if self.drop_next:
+                    self.drop_next = False
+                    return
+                status, value = await self.respond(method, path, params)
+                data = json.dumps({'value': value}).encode('utf-8')
+                writer.write(b'HTTP/1.1 %d OK\r\nContent-Type: application/json\r\n'
+                             b'Content-Length: %d\r\n\r\n%s' % (status, len(data), data))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def respond(self, method, path, params):
+        if path == '/session':
+            self.sessions += 1
+            return 200, {'sessionId': 's%d' % self.sessions, 'capabilities': {'browserName': 'fake'}}
+        session, _, command = path[len('/session/'):].partition('/')
+        if command == 'execute/sync':
+            await asyncio.sleep(params['args'][0])
+            return 200, [session] + params['args']
+        if command == 'element':
+            if params['value'] == '#missing':
+                return 404, {'error': 'no such element', 'message': 'no element ' + params['value'],
+                             'stacktrace': ''}
+            return 200, {ELEMENT_KEY: 'e-' + params['value']}
+        if command == 'title':
+            return 200, 'title of ' + session
+        if method == 'DELETE' and command == '':
+            return 200, None
+        return 404, {'error': 'unknown command', 'message': path, 'stacktrace': ''}
+
+
+def run(test):
+    async def main():
+        service = FakeDriverService()
+        url = await service.start()
+        try:
+            await test(service, url)
+        finally:
+            await service.stop()
+    asyncio.run(main())
+
+
+def test_session_commands_and_element_round_trip():
+    async def test(service, url):
+        async with AsyncWebDriver(url) as driver:
+            assert driver.session_id == 's1'
+            assert await driver.title() == 'title of s1'
+            element = await driver.find_element('css selector', '#ok')
+            assert isinstance(element, AsyncWebElement) and element.id == 'e-#ok'
+            # elements are sent back as references
+            assert await driver.execute_script('echo', 0, element) == ['s1', 0, element]
+            assert service.requests[-1][2]['args'] == [0, {ELEMENT_KEY: 'e-#ok'}]
+        assert driver.session_id is None
+        assert service.requests[-1][:2] == ('DELETE', '/session/s1')
+        assert service.connections == 1
+    run(test)
+
+
+def test_concurrent_commands_on_one_driver_get_their_own_responses():
+    async def test(service, url):
+        async with AsyncWebDriver(url) as driver:
+            # the slower command is sent first, responses must not be swapped
+            results = await asyncio.gather(*(driver.execute_script('echo', delay, i)
+                                             for i, delay in enumerate([0.05, 0, 0.02, 0])))
+            assert results == [['s1', delay, i] for i, delay in enumerate([0.05, 0, 0.02, 0])]
+        assert service.connections == 1
+    run(test)
+
+
+def test_drivers_on_one_loop_run_in_parallel():
+    async def test(service, url):
+        drivers = await asyncio.gather(*(AsyncWebDriver.create(url) for _ in range(4)))
+        try:
+            started = time.monotonic()
+            results = await asyncio.gather(*(driver.execute_script('echo', 0.3) for driver in drivers))
+            assert time.monotonic() - started < 1
+            assert sorted(result[0] for result in results) == ['s1', 's2', 's3', 's4']
+        finally:
+            await asyncio.gather(*(driver.quit() for driver in drivers))
+    run(test)
+
+
+def test_error_responses_raise_and_the_connection_stays_usable():
+    async def test(service, url):
+        async with AsyncWebDriver(url) as driver:
+            with pytest.raises(NoSuchElementException) as info:
+                await driver.find_element('css selector', '#missing')
+            assert 'no element #missing' in info.value.msg
+            results = await asyncio.gather(driver.find_element('css selector', '#missing'),
+                                           driver.title(), return_exceptions=True)
+            assert isinstance(results[0], NoSuchElementException)
+            assert results[1] == 'title of s1'
+        assert service.connections == 1
+    run(test)
+
+
+def test_dropped_post_is_not_sent_again():
+    async def test(service, url):
+        async with AsyncWebDriver(url) as driver:
+            sent = len(service.requests)
+            service.drop_next = True
+            with pytest.raises(DriverUnreachableException):
+                await driver.execute_script('echo', 0)
+            assert len(service.requests) == sent + 1
+            # the next command opens a new connection
+            assert await driver.title() == 'title of s1'
+        assert service.connections == 2
+    run(test)
+
+
+def test_dropped_idempotent_request_is_retried_on_a_new_connection():
+    async def test(service, url):
+        async with AsyncWebDriver(url) as driver:
+            sent = len(service.requests)
+            service.drop_next = True
+            assert await driver.title() == 'title of s1'
+            assert [request[:2] for request in service.requests[sent:]] == [('GET', '/session/s1/title')] * 2
+    run(test)
@@ -0,0 +1,161 @@
+import base64
+import io
+import json
+import os
+
+import pytest
+
+from EDGE.web.remote import utils
+from EDGE.web.remote.errorhandler import ErrorCode
+from EDGE.web.remote.remote_connection import RemoteConnection
+from EDGE.web.remote.webdriver import WebDriver
+
+PAYLOAD = os.urandom(10000)
+ENCODED = base64.b64encode(PAYLOAD).decode('ascii')
+
+BODIES = [
+    json.dumps({'value': ENCODED}),
+    json.dumps({'sessionId': 'abc', 'status': 0, 'value': ENCODED}),
+    json.dumps({'status': 0, 'extra': {'nested': [1, '"}', None]}, 'value': ENCODED, 'tail': 1}),
+    '{ "sessionId" : "a\\"b" ,\n "value" : "%s" }' % ENCODED.replace('/', '\\/'),
+]
+
+
+def _feed(body, size):
+    out = io.BytesIO()
+    decoder = utils.Base64ValueDecoder(out)
+    for i in range(0, len(body), size):
+        if not decoder.feed(body[i:i + size]):
+            break
+    return decoder, out.getvalue()
+
+
+@pytest.mark.parametrize('body', BODIES)
+@pytest.mark.parametrize('size', [1, 3, 7, 64, 4096, 1 << 20])
+def test_decodes_value_in_any_key_order(body, size):
+    decoder, data = _feed(body.encode('utf-8'), size)
+    assert decoder.complete
+    assert decoder.written == len(PAYLOAD)
+    assert data == PAYLOAD
+
+
+@pytest.mark.parametrize('body', [
+    '{"value": null}',
+    '{"value": {"error": "no such window", "message": "x"}}',
+    '[1, 2]',
+    '{"status": 13}',
+    'not json',
+])
+@pytest.mark.parametrize('size', [1, 5, 1024])
+def test_other_bodies_fall_back(body, size):
+    decoder, data = _feed(body.encode('utf-8'), size)
+    assert not decoder.complete
+    assert data == b''
+    if decoder.state == 'fallback':
+        assert body.encode('utf-8').startswith(decoder.head)
+
+
+class FakeStreamResponse(object):
+    def __init__(self, body, status=200):
+        self.status = status
+        self.headers = {'Content-Type': 'application/json; charset=utf-8'}
+        self._body = io.BytesIO(body)
+
+    def stream(self, amt):
+        while True:
+            data = self._body.read(amt)
+            if not data:
+                break
+            yield data
+
+    def read(self):
+        return self._body.read()
+
+    def release_conn(self):
+        pass
+
+
+class FakePool(object):
+    def __init__(self, body, status=200):
+        self.body = body
+        self.status = status
+
+    def request(self, method, url, body=None, headers=None, preload_content=True):
+        return FakeStreamResponse(self.body, self.status)
+
+
+def _execute_to(body, status=200):
+    conn = RemoteConnection('http://127.0.0.1:9515', keep_alive=True)
+    conn._conn = FakePool(body, status)
+    conn._stream_chunk_size = 1000
+    out = io.BytesIO()
+    response = conn._request_to('GET', 'http://127.0.0.1:9515/session/1/screenshot', None, out)
+    return response, out.getvalue()
+
+
+def test_request_to_streams_value_after_other_keys():
+    response, data = _execute_to(BODIES[1].encode('utf-8'))
+    assert response == {'status': ErrorCode.SUCCESS, 'value': len(PAYLOAD)}
+    assert data == PAYLOAD
+
+
+def test_request_to_fallback_still_writes_value(monkeypatch):
+    # members before "value" longer than the decoder looks ahead: parsed as a whole, then decoded
+    monkeypatch.setattr(utils, '_HEAD_MAX', 16)
+    response, data = _execute_to(BODIES[2].encode('utf-8'))
+    assert response == {'status': ErrorCode.SUCCESS, 'value': len(PAYLOAD)}
+    assert data == PAYLOAD
+
+
+def test_request_to_non_string_value_is_an_error():
+    response, data = _execute_to(b'{"value": null}')
+    assert response['status'] == ErrorCode.UNKNOWN_ERROR
+    assert data == b''
+
+
+def test_request_to_error_response_is_returned():
+    body = json.dumps({'value': {'error': 'no such window', 'message': 'gone'}}).encode('utf-8')
+    response, data = _execute_to(body, status=404)
+    assert response['status'] == 404
+    assert data == b''
+
+
+class FileExecutor(object):
+    """ Writes half of PAYLOAD, then either the rest or ``error``."""
+    def __init__(self, error=None):
+        self.error = error
+
+    def execute_to(self, command, params, out):
+        out.write(PAYLOAD[:100])
+        if self.error is not None:
+            raise self.error
+        out.write(PAYLOAD[100:])
+        return {'status': ErrorCode.SUCCESS, 'value': len(PAYLOAD)}
+
+
+def _file_driver(error=None):
+    return WebDriver._attached(FileExecutor(error), 'session', {})
+
+
+def test_execute_to_file_replaces_target_on_success(tmp_path):
+    target = tmp_path / 'page.pdf'
+    target.write_bytes(b'old')
+    assert _file_driver().execute_to_file('printPage', {}, str(target)) == len(PAYLOAD)
+    assert target.read_bytes() == PAYLOAD
+    assert os.listdir(tmp_path) == ['page.pdf']
+
+
+def test_execute_to_file_keeps_existing_file_on_error(tmp_path):
+    target = tmp_path / 'page.pdf'
+    target.write_bytes(b'old')
+    with pytest.raises(ConnectionResetError):
+        _file_driver(ConnectionResetError('dropped')).execute_to_file('printPage', {}, target)
+    assert target.read_bytes() == b'old'
+    assert os.listdir(tmp_path) == ['page.pdf']
+
+
+def test_execute_to_file_leaves_nothing_behind_on_error(tmp_path):
+    target = tmp_path / 'shot.png'
+    with pytest.raises(ConnectionResetError):
+        _file_driver(ConnectionResetError('dropped')).execute_to_file('screenshot', {}, bytes(target))
+    assert os.listdir(tmp_path) == []
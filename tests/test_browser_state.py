@@ -0,0 +1,37 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from EDGE.web.chromium.webdriver import ChromiumDriver
+from EDGE.web.common.service import pid_alive, process_started
+
+psutil = pytest.importorskip('psutil')
+
+
+def test_stop_saved_kills_recorded_processes_only(tmp_path):
+    path = str(tmp_path / 'browser_state.json')
+    proc = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])
+    bystander = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])
+    try:
+        started = process_started(proc.pid)
+        # the second entry is a reused pid: its start time does not match
+        with open(path, 'w') as f:
+            json.dump({'pids': [[proc.pid, started], [bystander.pid, started - 100]]}, f)
+        assert ChromiumDriver.stop_saved(path) == 1
+        proc.wait(5)
+        assert not pid_alive(proc.pid, started)
+        assert bystander.poll() is None
+        assert not (tmp_path / 'browser_state.json').exists()
+    finally:
+        for p in (proc, bystander):
+            p.kill()
+            p.wait()
+
+
+def test_stop_saved_removes_broken_state(tmp_path):
+    path = tmp_path / 'browser_state.json'
+    path.write_text('{not json')
+    assert ChromiumDriver.stop_saved(str(path)) == 0
+    assert not path.exists()
@@ -0,0 +1,76 @@
+import os
+
+import crash_ring
+
+
+def _ring(tmp_path, slot_count=16):
+    return crash_ring.CrashRing(str(tmp_path / 'crash.ring'), slot_count=slot_count)
+
+
+def _decode(ring):
+    return crash_ring.decode(ring.map)
+
+
+def test_roundtrip(tmp_path):
+    ring = _ring(tmp_path)
+    ring.record(crash_ring.KIND_LOG, 'hello')
+    ring.record(crash_ring.KIND_JOB, 'start sendId=1')
+    ring.record(crash_ring.KIND_LOG, '')
+    header, records = _decode(ring)
+    assert header['pid'] == os.getpid()
+    assert not header['clean']
+    assert [(kind, text) for seq, ts, kind, text in records] == \
+        [(crash_ring.KIND_LOG, 'hello'), (crash_ring.KIND_JOB, 'start sendId=1'), (crash_ring.KIND_LOG, '')]
+    ring.close()
+    with open(str(tmp_path / 'crash.ring'), 'rb') as f:
+        assert crash_ring.decode(f.read())[0]['clean']
+
+
+def test_multi_slot_cjk_record_is_rejoined(tmp_path):
+    ring = _ring(tmp_path)
+    text = 'msg: ' + '打印地址访问失败：' * 12
+    ring.record(crash_ring.KIND_LOG, text)
+    ring.record(crash_ring.KIND_LOG, 'next')
+    header, records = _decode(ring)
+    assert [r[3] for r in records] == [text, 'next']
+    timeline = crash_ring.format_timeline(header, records)
+    assert '�' not in timeline
+    assert len(timeline.splitlines()) == 3
+
+
+def test_overlong_record_is_cut_on_a_character_boundary(tmp_path):
+    ring = _ring(tmp_path)
+    ring.record(crash_ring.KIND_LOG, '失' * 1000)
+    text = _decode(ring)[1][0][3]
+    assert text == '失' * len(text)
+    assert 0 < len(text.encode('utf-8')) <= crash_ring._payload_max * crash_ring._max_slots_per_record
+
+
+def test_wraparound_drops_orphaned_continuations(tmp_path):
+    ring = _ring(tmp_path, slot_count=8)
+    long_text = '打印' * 100
+    ring.record(crash_ring.KIND_LOG, long_text)
+    pieces = len(crash_ring.split_utf8(long_text.encode('utf-8'), crash_ring._payload_max, 4))
+    assert pieces > 1
+    # overwrite the first slot of the long record only
+    for i in range(8 - pieces + 1):
+        ring.record(crash_ring.KIND_LOG, 'line %d' % i)
+    records = _decode(ring)[1]
+    texts = [r[3] for r in records]
+    assert long_text not in texts
+    assert texts == ['line %d' % i for i in range(8 - pieces + 1)]
+    assert [r[0] for r in records] == sorted(r[0] for r in records)
+
+
+def test_dump_unclean_keeps_a_limited_number_of_timelines(tmp_path, monkeypatch):
+    for i in range(5):
+        (tmp_path / ('crash_2021090%d_120000.txt' % i)).write_text('old')
+    monkeypatch.setattr(crash_ring, '__crash_keep__', 3)
+    ring = _ring(tmp_path)
+    ring.record(crash_ring.KIND_LOG, 'before crash')
+    ring.map.flush()
+    out = crash_ring.dump_unclean(str(tmp_path / 'crash.ring'))
+    ring.close()
+    names = sorted(name for name in os.listdir(str(tmp_path)) if name.startswith('crash_'))
+    assert os.path.basename(out) in names
+    assert len(names) == 3
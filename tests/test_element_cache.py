@@ -0,0 +1,71 @@
+import gc
+
+from EDGE.web.remote.command import Command
+from EDGE.web.remote.marshalling import ELEMENT_KEY
+from EDGE.web.remote.webdriver import WebDriver
+
+
+class ElementExecutor(object):
+    """ Returns the element references queued in ``results``, and a session for NEW_SESSION."""
+    def __init__(self):
+        self.results = []
+        self.sessions = 0
+
+    def execute(self, command, params):
+        if command == Command.NEW_SESSION:
+            self.sessions += 1
+            return {'value': {'sessionId': 'session-%d' % self.sessions, 'capabilities': {}}}
+        return {'value': self.results.pop(0)}
+
+
+def _driver():
+    executor = ElementExecutor()
+    return WebDriver._attached(executor, 'session', {}), executor
+
+
+def _ref(id_):
+    return {ELEMENT_KEY: id_}
+
+
+def test_same_id_returns_the_same_element():
+    driver, executor = _driver()
+    executor.results = [[_ref('a'), _ref('b'), _ref('a')], _ref('b')]
+    first, second, again = driver.execute_script('return [];')
+    assert first is again
+    assert first is not second
+    assert driver.execute_script('return 0;') is second
+    assert driver.create_web_element('a') is first
+
+
+def test_elements_are_held_weakly():
+    driver, executor = _driver()
+    element = driver.create_web_element('a')
+    assert 'a' in driver._elements
+    del element
+    gc.collect()
+    assert 'a' not in driver._elements
+
+
+def test_start_session_clears_the_table():
+    driver, executor = _driver()
+    old = driver.create_web_element('a')
+    driver.start_session({})
+    assert driver.session_id == 'session-1'
+    assert len(driver._elements) == 0
+    new = driver.create_web_element('a')
+    assert new is not old
+    assert new.parent is driver
+
+
+def test_eq_and_hash_agree_across_sessions():
+    driver, executor = _driver()
+    old = driver.create_web_element('a')
+    driver.start_session({})
+    new = driver.create_web_element('a')
+    other = driver.create_web_element('b')
+    assert old == new and not old != new
+    assert hash(old) == hash(new)
+    assert old != other
+    assert len({old, new, other}) == 2
+    assert {old: 1}[new] == 1
+    assert old != 'a'
@@ -0,0 +1,102 @@
+import json
+import re
+
+from EDGE.web.remote.command import Command
+from EDGE.web.remote.webdriver import WebDriver, _INSTALLED_MISSING
+
+_CALL = re.compile(r'^var f=\(window\.__edge\|\|0\)\[("[^"]*")\];')
+_INSTALL = re.compile(r'ns\[("[^"]*")\] = \(')
+
+
+LONG_SCRIPT = ('var rows = document.querySelectorAll("table.report tr"), out = [];'
+               'for (var i = 0; i < rows.length; i++) { out.push([rows[i].id, rows[i].cells.length]); }'
+               'return out;')
+
+
+class FakePage(object):
+    """ Emulates the page global used by _execute_installed and CDP new-document scripts."""
+    def __init__(self):
+        self.functions = set()
+        self.on_new_document = {}
+        self.commands = []
+
+    def navigate(self):
+        self.functions = set()
+        for source in self.on_new_document.values():
+            self.functions.update(json.loads(name) for name in _INSTALL.findall(source))
+
+    def execute(self, command, params):
+        assert command == Command.W3C_EXECUTE_SCRIPT
+        script = params['script']
+        self.commands.append(script)
+        match = _CALL.match(script)
+        if match is not None:
+            name = json.loads(match.group(1))
+            return {'value': 'called:' + name if name in self.functions else _INSTALLED_MISSING}
+        match = _INSTALL.search(script)
+        if match is not None and 'return ns[' in script:
+            name = json.loads(match.group(1))
+            self.functions.add(name)
+            return {'value': 'called:' + name}
+        return {'value': None}
+
+    def execute_cdp_cmd(self, cmd, params):
+        if cmd == 'Page.removeScriptToEvaluateOnNewDocument':
+            del self.on_new_document[params['identifier']]
+            return {}
+        assert cmd == 'Page.addScriptToEvaluateOnNewDocument'
+        identifier = str(len(self.on_new_document) + 1)
+        self.on_new_document[identifier] = params['source']
+        return {'identifier': identifier}
+
+
+def _driver():
+    page = FakePage()
+    driver = WebDriver._attached(page, 'session', {})
+    driver.execute_cdp_cmd = page.execute_cdp_cmd
+    return driver, page
+
+
+def test_atoms_are_installed_lazily_without_cdp():
+    driver, page = _driver()
+    assert driver._execute_installed('isDisplayed', 'function(){return 1}') == 'called:isDisplayed'
+    assert driver._execute_installed('isDisplayed', 'function(){return 1}') == 'called:isDisplayed'
+    assert page.on_new_document == {}
+    # the source was sent once, the second call was the short one
+    assert sum('function(){return 1}' in script for script in page.commands) == 1
+    page.navigate()
+    assert driver._execute_installed('isDisplayed', 'function(){return 1}') == 'called:isDisplayed'
+    assert page.on_new_document == {}
+
+
+def test_pinned_scripts_survive_navigation_through_cdp():
+    driver, page = _driver()
+    key = driver.pin_script(LONG_SCRIPT)
+    assert len(page.on_new_document) == 1
+    page.navigate()
+    sent = len(page.commands)
+    driver.execute_script(key)
+    assert len(page.commands) == sent + 1
+    assert LONG_SCRIPT not in page.commands[-1]
+
+
+def test_short_pinned_scripts_are_sent_inline():
+    driver, page = _driver()
+    key = driver.pin_script('return document.getElementById(arguments[0])?false:true')
+    assert page.on_new_document == {}
+    driver.execute_script(key, 'complete')
+    driver.execute_script(key, 'complete')
+    assert page.commands == ['return document.getElementById(arguments[0])?false:true'] * 2
+    driver.unpin(key)
+    assert len(page.commands) == 2
+
+
+def test_pinned_uuid_keys_survive_a_state_roundtrip():
+    driver, page = _driver()
+    key = driver.pin_script(LONG_SCRIPT)
+    restored, page = _driver()
+    restored.pinned_scripts = json.loads(json.dumps(driver.pinned_scripts))
+    assert restored.execute_script(key) == 'called:p:%s' % key.id
+    restored.unpin(key)
+    assert restored.pinned_scripts == {}
+    assert page.on_new_document == {}
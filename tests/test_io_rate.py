@@ -0,0 +1,112 @@
+import pytest
+
+import monitor
+
+
+class Counters:
+    # 用合成的计数器快照驱动 IORateEngine.sample
+    def __init__(self, monkeypatch):
+        self.now = 0.0
+        self.disk = {}
+        self.nic = {}
+        monkeypatch.setattr(monitor.time, 'monotonic', lambda: self.now)
+        monkeypatch.setattr(monitor.IORateEngine, 'read_disk', staticmethod(lambda: dict(self.disk)))
+        monkeypatch.setattr(monitor.IORateEngine, 'read_nic', staticmethod(lambda: dict(self.nic)))
+
+    def step(self, engine, seconds=1.0, **disk):
+        self.now += seconds
+        self.disk.update(disk)
+        engine.sample()
+
+
+@pytest.fixture
+def counters(monkeypatch):
+    return Counters(monkeypatch)
+
+
+def test_first_sample_only_records_baseline(counters):
+    engine = monitor.IORateEngine(alpha=0.5)
+    counters.step(engine, sda=(1000, 2000, 10, 20))
+    assert not engine.ready
+    assert engine.top_disks() == []
+    assert engine.nic_total() == {'sent_speed': 0, 'recv_speed': 0}
+
+
+def test_second_sample_gives_raw_rate_per_second(counters):
+    engine = monitor.IORateEngine(alpha=0.5)
+    counters.step(engine, sda=(0, 0, 0, 0))
+    counters.step(engine, seconds=2, sda=(4000, 2000, 40, 20))
+    assert engine.ready
+    assert engine.top_disks() == [{'device_name': 'sda', 'read_speed': 2000, 'write_speed': 1000,
+                                   'read_iops': 20, 'write_iops': 10}]
+
+
+def test_ewma_smoothing(counters):
+    engine = monitor.IORateEngine(alpha=0.25)
+    counters.step(engine, sda=(0, 0, 0, 0))
+    counters.step(engine, sda=(800, 0, 0, 0))
+    counters.step(engine, sda=(800, 0, 0, 0))
+    # 800 + 0.25 * (0 - 800)
+    assert engine.top_disks()[0]['read_speed'] == 600
+    counters.step(engine, sda=(2400, 0, 0, 0))
+    # 600 + 0.25 * (1600 - 600)
+    assert engine.top_disks()[0]['read_speed'] == 850
+
+
+def test_counter_wrap_counts_as_zero(counters):
+    engine = monitor.IORateEngine(alpha=1)
+    counters.step(engine, sda=(2 ** 32 - 100, 500, 10, 10))
+    counters.step(engine, sda=(50, 1500, 10, 20))
+    rates = engine.top_disks()[0]
+    assert rates['read_speed'] == 0
+    assert rates['write_speed'] == 1000
+    assert rates['write_iops'] == 10
+    counters.step(engine, sda=(150, 1500, 10, 20))
+    assert engine.top_disks()[0]['read_speed'] == 100
+
+
+def test_disk_that_disappears_is_dropped_and_restarts_from_baseline(counters):
+    engine = monitor.IORateEngine(alpha=1)
+    counters.step(engine, sda=(0, 0, 0, 0), sdb=(0, 0, 0, 0))
+    counters.step(engine, sda=(100, 0, 0, 0), sdb=(900, 0, 0, 0))
+    assert [d['device_name'] for d in engine.top_disks(None)] == ['sdb', 'sda']
+
+    del counters.disk['sdb']
+    counters.step(engine, sda=(200, 0, 0, 0))
+    assert [d['device_name'] for d in engine.top_disks(None)] == ['sda']
+
+    # 重新出现的磁盘计数器可能已重置，先只记录基线
+    counters.step(engine, sda=(300, 0, 0, 0), sdb=(5, 0, 0, 0))
+    assert [d['device_name'] for d in engine.top_disks(None)] == ['sda']
+    counters.step(engine, sda=(400, 0, 0, 0), sdb=(505, 0, 0, 0))
+    assert engine.top_disks()[0] == {'device_name': 'sdb', 'read_speed': 500, 'write_speed': 0,
+                                     'read_iops': 0, 'write_iops': 0}
+
+
+def test_zero_elapsed_sample_is_skipped(counters):
+    engine = monitor.IORateEngine(alpha=1)
+    counters.step(engine, sda=(0, 0, 0, 0))
+    counters.step(engine, seconds=0, sda=(100, 0, 0, 0))
+    assert not engine.ready
+
+
+def test_top_k_by_throughput_and_iops(counters):
+    engine = monitor.IORateEngine(alpha=1)
+    counters.step(engine, sda=(0, 0, 0, 0), sdb=(0, 0, 0, 0), sdc=(0, 0, 0, 0))
+    counters.step(engine, sda=(100, 100, 90, 0), sdb=(500, 0, 1, 1), sdc=(300, 0, 5, 5))
+    assert [d['device_name'] for d in engine.top_disks(2)] == ['sdb', 'sdc']
+    assert [d['device_name'] for d in engine.top_disks(1, by='iops')] == ['sda']
+    assert [d['device_name'] for d in engine.top_disks(None, by='iops')] == ['sda', 'sdc', 'sdb']
+    assert len(engine.top_disks(10)) == 3
+
+
+def test_nics_top_and_total(counters):
+    engine = monitor.IORateEngine(alpha=1)
+    counters.nic = {'eth0': (0, 0, 0, 0), 'wlan0': (0, 0, 0, 0)}
+    counters.step(engine)
+    counters.nic = {'eth0': (1000, 3000, 1, 1), 'wlan0': (500, 0, 50, 50)}
+    counters.step(engine)
+    assert engine.nic_total() == {'sent_speed': 1500, 'recv_speed': 3000}
+    assert engine.top_nics()[0]['nic_name'] == 'eth0'
+    assert engine.top_nics(by='pps')[0] == {'nic_name': 'wlan0', 'sent_speed': 500, 'recv_speed': 0,
+                                            'sent_pps': 50, 'recv_pps': 50}
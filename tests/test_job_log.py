@@ -0,0 +1,51 @@
+import gzip
+import os
+import shutil
+
+import logger
+
+
+def _job_log(tmp_path):
+    path = str(tmp_path) + os.sep
+    return logger.JobLog(path), path
+
+
+def test_find_reads_plain_and_compressed_segments(tmp_path, monkeypatch):
+    job_log, path = _job_log(tmp_path)
+    monkeypatch.setattr(logger, 'get_cur_time', lambda: '20210901')
+    monkeypatch.setattr(logger, 'schedule_compress', lambda full: None)
+    job_log.record(1, result=0)
+    job_log.record(2, result=-1)
+    job_log.record(1, result=1)
+    assert [job['result'] for job in job_log.find(1)] == [0, 1]
+
+    job_log.log.close()
+    job_log.log = None
+    job_log.date_str = None
+    segment = path + logger.JobLog.segment_name('20210901')
+    with open(segment, 'rb') as f_in, gzip.open(segment + logger.__compress_postfix__, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(segment)
+    assert [job['result'] for job in job_log.find(1)] == [0, 1]
+    assert [job['result'] for job in job_log.find(2)] == [-1]
+    job_log.index_log.close()
+
+
+def test_prune_drops_index_entries_of_evicted_segment(tmp_path, monkeypatch):
+    job_log, path = _job_log(tmp_path)
+    monkeypatch.setattr(logger, 'schedule_compress', lambda full: None)
+    monkeypatch.setattr(logger, 'get_cur_time', lambda: '20210901')
+    job_log.record(1, result=0)
+    monkeypatch.setattr(logger, 'get_cur_time', lambda: '20210902')
+    job_log.record(1, result=1)
+    job_log.record(2, result=2)
+    assert len(job_log.find(1)) == 2
+
+    job_log.prune([logger.JobLog.segment_name('20210901') + logger.__compress_postfix__])
+    with open(path + logger.__job_index_file__, 'rb') as f:
+        assert b'20210901' not in f.read()
+    assert [job['result'] for job in job_log.find(1)] == [1]
+    job_log.record(3, result=3)
+    assert [job['result'] for job in job_log.find(3)] == [3]
+    job_log.log.close()
+    job_log.index_log.close()
@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+from EDGE.web.remote import utils
+
+PAYLOAD = {'script': 'return arguments[0];',
+           'args': ['打印机状态', {'x': 1.5, 'ok': True, 'none': None}],
+           'sessionId': 'abc'}
+
+
+@pytest.fixture
+def codec(request, monkeypatch):
+    if request.param == 'orjson':
+        pytest.importorskip('orjson')
+    else:
+        monkeypatch.setattr(utils, 'orjson', None)
+    return request.param
+
+
+@pytest.mark.parametrize('codec', ['orjson', 'json'], indirect=True)
+def test_dump_json_bytes_roundtrip(codec):
+    body = utils.dump_json_bytes(PAYLOAD)
+    assert isinstance(body, bytes)
+    assert json.loads(body.decode('utf-8')) == PAYLOAD
+    assert utils.load_json(body) == PAYLOAD
+    assert utils.load_json(body.decode('utf-8')) == PAYLOAD
+
+
+@pytest.mark.parametrize('codec', ['orjson', 'json'], indirect=True)
+def test_load_json_reads_utf8_bytes(codec):
+    assert utils.load_json('{"value": "已完成"}'.encode('utf-8')) == {'value': '已完成'}
+    assert utils.load_json(b'[1, 2.5, null]') == [1, 2.5, None]
+
+
+@pytest.mark.parametrize('codec', ['orjson', 'json'], indirect=True)
+def test_non_ascii_output_is_valid_utf8(codec):
+    body = utils.dump_json_bytes({'name': 'é中'})
+    if codec == 'orjson':
+        assert body == '{"name":"é中"}'.encode('utf-8')
+    else:
+        # the stdlib escapes non-ASCII, which is still valid UTF-8
+        assert body == b'{"name": "\\u00e9\\u4e2d"}'
+    assert json.loads(body.decode('utf-8')) == {'name': 'é中'}
+
+
+@pytest.mark.parametrize('codec', ['orjson', 'json'], indirect=True)
+def test_non_str_keys_are_stringified(codec):
+    assert json.loads(utils.dump_json_bytes({1: 'a'})) == {'1': 'a'}
+
+
+def test_orjson_type_error_falls_back_to_stdlib():
+    pytest.importorskip('orjson')
+    assert utils.orjson is not None
+    # orjson only handles 64 bit integers
+    value = {'big': 2 ** 70}
+    with pytest.raises(TypeError):
+        utils.orjson.dumps(value)
+    assert utils.dump_json_bytes(value) == json.dumps(value).encode('utf-8')
+
+
+@pytest.mark.parametrize('codec', ['orjson', 'json'], indirect=True)
+def test_unserializable_values_still_raise(codec):
+    with pytest.raises(TypeError):
+        utils.dump_json_bytes({'value': object()})
+
+
+@pytest.mark.parametrize('codec', ['orjson', 'json'], indirect=True)
+def test_invalid_input_raises_value_error(codec):
+    with pytest.raises(ValueError):
+        utils.load_json(b'{"value": ')
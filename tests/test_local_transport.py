@@ -0,0 +1,120 @@
+import socket
+import socketserver
+import threading
+import time
+
+import pytest
+
+from EDGE.web.remote import local_transport
+
+RESPONSE = b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\nContent-Type: application/json\r\n\r\n{}'
+
+
+class ScriptedServer(socketserver.ThreadingTCPServer):
+    """ Answers requests on each connection following ``actions``:
+    'ok' responds, 'drop' reads the request and closes, 'hang' never answers,
+    'close' responds and then closes the connection while idle."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, actions):
+        self.actions = list(actions)
+        self.received = []
+        self.release = threading.Event()
+        socketserver.ThreadingTCPServer.__init__(self, ('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True).start()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self.server_address[1]
+
+
+class Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        buf = b''
+        while True:
+            while b'\r\n\r\n' not in buf:
+                data = self.request.recv(65536)
+                if not data:
+                    return
+                buf += data
+            head, _, buf = buf.partition(b'\r\n\r\n')
+            length = 0
+            for line in head.split(b'\r\n')[1:]:
+                name, _, value = line.partition(b':')
+                if name.strip().lower() == b'content-length':
+                    length = int(value)
+            while len(buf) < length:
+                buf += self.request.recv(65536)
+            buf = buf[length:]
+            self.server.received.append(head.split(b' ')[0].decode())
+            action = self.server.actions.pop(0) if self.server.actions else 'ok'
+            if action == 'drop':
+                return
+            if action == 'hang':
+                self.server.release.wait(5)
+                return
+            self.request.sendall(RESPONSE)
+            if action == 'close':
+                return
+
+
+@pytest.fixture
+def server_factory():
+    servers = []
+
+    def make(actions):
+        server = ScriptedServer(actions)
+        servers.append(server)
+        return server
+    yield make
+    for server in servers:
+        server.release.set()
+        server.shutdown()
+        server.server_close()
+
+
+def _wait_closed(pool):
+    # give the service side close time to arrive before the next request
+    deadline = time.time() + 2
+    while time.time() < deadline and not all(local_transport.is_dropped(c) for c in pool._idle):
+        time.sleep(0.01)
+
+
+def test_stale_idle_connection_is_replaced(server_factory):
+    server = server_factory(['close', 'ok'])
+    pool = local_transport.LocalConnectionPool(server.url, timeout=5)
+    assert pool.request('POST', server.url + '/a', body=b'{}').status == 200
+    _wait_closed(pool)
+    assert pool.request('POST', server.url + '/b', body=b'{}').status == 200
+    assert server.received == ['POST', 'POST']
+    pool.clear()
+
+
+def test_post_is_not_resent_after_it_was_sent(server_factory):
+    server = server_factory(['ok', 'drop'])
+    pool = local_transport.LocalConnectionPool(server.url, timeout=5)
+    pool.request('POST', server.url + '/a', body=b'{}')
+    with pytest.raises(ConnectionError):
+        pool.request('POST', server.url + '/b', body=b'{}')
+    assert server.received == ['POST', 'POST']
+    pool.clear()
+
+
+def test_get_is_retried_once(server_factory):
+    server = server_factory(['ok', 'drop', 'ok'])
+    pool = local_transport.LocalConnectionPool(server.url, timeout=5)
+    pool.request('GET', server.url + '/a')
+    assert pool.request('GET', server.url + '/b').status == 200
+    assert server.received == ['GET', 'GET', 'GET']
+    pool.clear()
+
+
+def test_hung_service_times_out(server_factory):
+    server = server_factory(['hang'])
+    pool = local_transport.LocalConnectionPool(server.url, timeout=0.3)
+    started = time.time()
+    with pytest.raises(socket.timeout):
+        pool.request('POST', server.url + '/a', body=b'{}')
+    assert time.time() - started < 3
+    pool.clear()
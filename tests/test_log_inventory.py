@@ -0,0 +1,48 @@
+import os
+
+import logger
+
+
+def test_log_sort_key_only_matches_logs():
+    assert logger.log_sort_key('20210901.log') == ('20210901', 0, '20210901.log')
+    assert logger.log_sort_key('20210901_3.log.gz') == ('20210901', 3, '20210901_3.log.gz')
+    assert logger.log_sort_key('jobs_20210901.jsonl.gz')[:2] == ('20210901', 0)
+    assert logger.log_sort_key('20210901.zip')[:2] == ('20210901', 0)
+    for name in ('20210901.log.gz.tmp', 'jobs_20210901.jsonl.gz.tmp', 'crash_20210901_120000.txt',
+                 'jobs.idx', 'crash.ring', '20210901.log.bak'):
+        assert logger.log_sort_key(name) is None, name
+
+
+def test_log_sort_key_orders_parts_numerically():
+    names = ['20210902.log', '20210901_10.log', '20210901_2.log.gz', '20210901.log.gz']
+    assert sorted(names, key=logger.log_sort_key) == \
+        ['20210901.log.gz', '20210901_2.log.gz', '20210901_10.log', '20210902.log']
+
+
+def _write(path, name, size):
+    with open(os.path.join(path, name), 'wb') as f:
+        f.write(b'x' * size)
+
+
+def test_enforce_evicts_oldest_logs_only(tmp_path):
+    path = str(tmp_path) + os.sep
+    for name in ('20210901.log.gz', '20210902.log.gz', '20210903.log', '20210901.log.gz.tmp',
+                 'crash_20210901_120000.txt', 'jobs.idx'):
+        _write(path, name, 100)
+    inventory = logger.LogInventory(path)
+    removed = inventory.enforce(450, active=('20210903.log',))
+    assert removed == ['20210901.log.gz', '20210902.log.gz']
+    assert sorted(os.listdir(path)) == ['20210901.log.gz.tmp', '20210903.log',
+                                        'crash_20210901_120000.txt', 'jobs.idx']
+    assert inventory.total() == 400
+    assert inventory.enforce(450) == []
+
+
+def test_inventory_rescans_after_external_change(tmp_path):
+    path = str(tmp_path) + os.sep
+    _write(path, '20210901.log', 10)
+    inventory = logger.LogInventory(path)
+    assert inventory.names() == ['20210901.log']
+    _write(path, '20210902.log', 10)
+    inventory.dir_mtime = None
+    assert sorted(inventory.names()) == ['20210901.log', '20210902.log']
@@ -0,0 +1,30 @@
+import json
+
+import log_upload
+
+
+class FakeWs(object):
+    def __init__(self):
+        self.sent = []
+
+    def send(self, data, opcode=None):
+        self.sent.append(data)
+
+
+def test_parse_request():
+    assert log_upload.parse_request({'date': '20210901', 'id': 3}) == (3, '20210901', '20210901', False)
+    assert log_upload.parse_request({'from': '20210901', 'to': '20210903', 'jobs': 1}) == \
+        (0, '20210901', '20210903', True)
+    for request in (None, [], 'x', 5, {'id': 'abc'}, {'date': '2021-09-01'}, {'from': '20210901', 'to': 'x'}):
+        assert log_upload.parse_request(request) is None, request
+
+
+def test_start_rejects_bad_request():
+    ws = FakeWs()
+    uploader = log_upload.LogUploader()
+    assert uploader.start(ws, ['not', 'a', 'dict']) is False
+    assert not uploader.running
+    assert len(ws.sent) == 1
+    prefix = log_upload.__logs_end_base__ % ''
+    assert ws.sent[0].startswith(prefix)
+    assert json.loads(ws.sent[0][len(prefix):])['error'] == 'bad request'
@@ -0,0 +1,63 @@
+import io
+import os
+import sys
+
+import logger
+
+
+def _logger(tmp_path, monkeypatch):
+    path = str(tmp_path) + os.sep
+    monkeypatch.setattr(logger, '__log_file_path__', path)
+    monkeypatch.setattr(logger, 'log_inventory', logger.LogInventory(path))
+    monkeypatch.setattr(logger, 'active_logs', set())
+    monkeypatch.setattr(logger, 'schedule_compress', lambda full: None)
+    monkeypatch.setattr(sys, 'stdout', io.StringIO())
+    log = logger.Logger()
+    return log, path + log.log_name
+
+
+def _lines(full):
+    with open(full, encoding='utf-8') as f:
+        return f.read().splitlines()
+
+
+def test_repeated_lines_are_merged(tmp_path, monkeypatch):
+    log, full = _logger(tmp_path, monkeypatch)
+    for _ in range(5):
+        log.write('same\n')
+    log.write('other\n')
+    log.close()
+    assert _lines(full) == ['same', '（上一条日志重复 4 次）', 'other']
+
+
+def test_flush_emits_partial_line(tmp_path, monkeypatch):
+    log, full = _logger(tmp_path, monkeypatch)
+    log.write('first\nno newline yet')
+    log.flush()
+    assert _lines(full) == ['first', 'no newline yet']
+    log.write('tail')
+    log.close()
+    assert _lines(full) == ['first', 'no newline yet', 'tail']
+
+
+def test_close_flushes_pending_repeat_summary(tmp_path, monkeypatch):
+    log, full = _logger(tmp_path, monkeypatch)
+    log.write('again\nagain\nagain\n')
+    log.close()
+    assert _lines(full) == ['again', '（上一条日志重复 2 次）']
+
+
+def test_log_policy_rate_limits_and_reports_suppressed(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(logger.time, 'monotonic', lambda: now[0])
+    policy = logger.LogPolicy(rate=1.0, burst=2)
+    assert [policy.allow() for _ in range(4)] == [(True, 0), (True, 0), (False, 0), (False, 0)]
+    now[0] += 1
+    assert policy.allow() == (True, 2)
+
+
+def test_log_policy_every(monkeypatch):
+    monkeypatch.setattr(logger.time, 'monotonic', lambda: 100.0)
+    policy = logger.LogPolicy(rate=0, burst=100, every=3)
+    allowed = [policy.allow()[0] for _ in range(7)]
+    assert allowed == [True, False, False, True, False, False, True]
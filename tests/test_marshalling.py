@@ -0,0 +1,86 @@
+import copy
+import json
+
+from EDGE.web.remote import marshalling
+from EDGE.web.remote.marshalling import ELEMENT_KEY
+
+
+class Element(object):
+    def __init__(self, id_):
+        self.id = id_
+
+    def __eq__(self, other):
+        return isinstance(other, Element) and other.id == self.id
+
+    def __repr__(self):
+        return 'Element(%r)' % self.id
+
+
+def legacy_wrap(value):
+    # the recursive WebDriver._wrap_value the module replaced
+    if isinstance(value, dict):
+        return {key: legacy_wrap(val) for key, val in value.items()}
+    elif isinstance(value, Element):
+        return {ELEMENT_KEY: value.id}
+    elif isinstance(value, list):
+        return list(legacy_wrap(item) for item in value)
+    return value
+
+
+def legacy_unwrap(value):
+    if isinstance(value, dict):
+        if ELEMENT_KEY in value:
+            return Element(value[ELEMENT_KEY])
+        for key, val in value.items():
+            value[key] = legacy_unwrap(val)
+        return value
+    elif isinstance(value, list):
+        return list(legacy_unwrap(item) for item in value)
+    return value
+
+
+VALUES = [
+    None, True, 0, 1.5, 'text', b'bytes', [], {},
+    Element('a'),
+    {'sessionId': 's', 'args': [Element('a'), {'deep': [Element('b'), 1]}, 'x']},
+    [{'k': [1, 2, {'e': Element('c')}]}, [], {}],
+    {'script': 'return 1', 'args': [[1, [2, [3]]], {'a': {'b': None}}]},
+]
+
+RESPONSES = [
+    None, 'base64==', 3, [],
+    {ELEMENT_KEY: 'e1'},
+    [{ELEMENT_KEY: 'e1'}, {'nested': [{ELEMENT_KEY: 'e2'}, 5]}, 'x'],
+    {'rows': [{'cells': [1, 2, {ELEMENT_KEY: 'e3'}]}], 'empty': {}},
+]
+
+
+def test_wrap_matches_recursive_version_and_keeps_caller_params():
+    for value in VALUES:
+        before = copy.deepcopy(value)
+        assert marshalling.wrap_value(value, Element) == legacy_wrap(value)
+        assert value == before
+
+
+def test_wrap_copies_top_level_dict():
+    params = {'sessionId': 's', 'url': 'x'}
+    wrapped = marshalling.wrap_value(params, Element)
+    del wrapped['sessionId']
+    assert params == {'sessionId': 's', 'url': 'x'}
+
+
+def test_unwrap_matches_recursive_version():
+    for value in RESPONSES:
+        raw = json.dumps(value)
+        assert marshalling.unwrap_value(json.loads(raw), Element) == legacy_unwrap(json.loads(raw))
+
+
+def test_deep_nesting_does_not_recurse():
+    deep = 'leaf'
+    for _ in range(5000):
+        deep = {'child': [deep, {ELEMENT_KEY: 'e'}]}
+    unwrapped = marshalling.unwrap_value(deep, Element)
+    assert unwrapped['child'][1] == Element('e')
+    wrapped = marshalling.wrap_value(unwrapped, Element)
+    assert wrapped['child'][1] == {ELEMENT_KEY: 'e'}
+    assert wrapped['child'][0]['child'][1] == {ELEMENT_KEY: 'e'}
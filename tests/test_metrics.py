@@ -0,0 +1,52 @@
+import metrics
+
+
+def test_counter_and_gauge_render():
+    registry = metrics.Registry()
+    jobs = registry.counter('jobs', 'print jobs', ('result',))
+    active = registry.gauge('active', 'browsers')
+    jobs.inc(result='success')
+    jobs.inc(2, result='success')
+    jobs.inc(result='err"or')
+    active.inc()
+    active.inc()
+    active.dec()
+    text = registry.render()
+    assert text.endswith('# EOF\n')
+    lines = text.splitlines()
+    assert '# TYPE jobs counter' in lines
+    assert 'jobs_total{result="success"} 3' in lines
+    assert 'jobs_total{result="err\\"or"} 1' in lines
+    assert 'active 1' in lines
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = metrics.Registry()
+    seconds = registry.histogram('seconds', 'latency', buckets=(1, 5))
+    for value in (0.5, 1, 3, 10):
+        seconds.observe(value)
+    lines = registry.render().splitlines()
+    assert 'seconds_bucket{le="1"} 2' in lines
+    assert 'seconds_bucket{le="5"} 3' in lines
+    assert 'seconds_bucket{le="+Inf"} 4' in lines
+    assert 'seconds_count 4' in lines
+    assert 'seconds_sum 14.5' in lines
+
+
+def test_collector_samples_with_and_without_suffix():
+    registry = metrics.Registry()
+    registry.register_collector(lambda: [
+        ('cpu', 'gauge', 'cpu usage', [({}, 12.5)]),
+        ('cmds', 'counter', 'commands', [('_total', {'command': 'get'}, 3)]),
+    ])
+    registry.register_collector(lambda: 1 / 0)
+    lines = registry.render().splitlines()
+    assert 'cpu 12.5' in lines
+    assert 'cmds_total{command="get"} 3' in lines
+    assert lines[-1] == '# EOF'
+
+
+def test_format_value():
+    assert metrics.format_value(2.0) == '2'
+    assert metrics.format_value(0.25) == '0.25'
+    assert metrics.format_value(7) == '7'
@@ -0,0 +1,154 @@
+import json
+import threading
+import time
+
+import pytest
+
+import monitor
+
+
+class Calls(list):
+    pass
+
+
+@pytest.fixture
+def wmi(tmp_path, monkeypatch):
+    # WMI 只在 Windows 上可用：伪装系统并替换采集函数，统计调用次数
+    calls = Calls()
+    calls.gate = threading.Event()
+    calls.gate.set()
+
+    def collect_wmi_info(info):
+        calls.gate.wait(5)
+        calls.append(info)
+        info['cpu_name'] = 'Fake CPU %d' % len(calls)
+        info['sys_caption'] = 'Fake Windows'
+
+    monkeypatch.setattr(monitor, '__base_info_cache_file__', str(tmp_path / 'pcinfo_cache.json'))
+    monkeypatch.setattr(monitor.platform, 'system', lambda: 'Windows')
+    monkeypatch.setattr(monitor.psutil, 'users', lambda: [])
+    monkeypatch.setattr(monitor.Monitor, 'collect_wmi_info', staticmethod(collect_wmi_info))
+    return calls
+
+
+def wait_base_info(m):
+    m.base_info_thread.join(5)
+    assert not m.base_info_thread.is_alive()
+
+
+def write_cache(age, **fields):
+    cache = {'time': time.time() - age, 'platform': monitor.platform.platform()}
+    cache.update(fields)
+    with open(monitor.__base_info_cache_file__, 'w', encoding='utf-8') as f:
+        json.dump(cache, f)
+
+
+def test_collect_saves_cache_and_next_start_loads_it(wmi):
+    m = monitor.Monitor()
+    wait_base_info(m)
+    assert m.base_info_ready.is_set()
+    assert m.get_base_info()['cpu_name'] == 'Fake CPU 1'
+    with open(monitor.__base_info_cache_file__, encoding='utf-8') as f:
+        cache = json.load(f)
+    assert cache['platform'] == m.platform
+    assert cache['cpu_name'] == 'Fake CPU 1'
+
+    restarted = monitor.Monitor()
+    assert restarted.base_info_thread is None
+    assert restarted.base_info_ready.is_set()
+    assert restarted.get_base_info()['cpu_name'] == 'Fake CPU 1'
+    assert len(wmi) == 1
+
+
+def test_cache_from_another_platform_is_ignored(wmi):
+    write_cache(0, cpu_name='Other CPU')
+    with open(monitor.__base_info_cache_file__, encoding='utf-8') as f:
+        cache = json.load(f)
+    cache['platform'] = 'not-this-machine'
+    with open(monitor.__base_info_cache_file__, 'w', encoding='utf-8') as f:
+        json.dump(cache, f)
+    m = monitor.Monitor()
+    wait_base_info(m)
+    assert m.get_base_info()['cpu_name'] == 'Fake CPU 1'
+
+
+def test_broken_cache_is_ignored(wmi):
+    with open(monitor.__base_info_cache_file__, 'w', encoding='utf-8') as f:
+        f.write('{not json')
+    m = monitor.Monitor()
+    wait_base_info(m)
+    assert len(wmi) == 1
+
+
+def test_expired_cache_is_served_while_refreshing_in_background(wmi):
+    write_cache(monitor.__base_info_refresh__ + 60, cpu_name='Cached CPU')
+    wmi.gate.clear()
+    m = monitor.Monitor()
+    assert m.base_info_ready.is_set()
+    assert m.get_base_info()['cpu_name'] == 'Cached CPU'
+    wmi.gate.set()
+    wait_base_info(m)
+    assert m.get_base_info()['cpu_name'] == 'Fake CPU 1'
+
+
+def test_get_base_info_refreshes_once_cache_expires(wmi):
+    write_cache(0, cpu_name='Cached CPU')
+    m = monitor.Monitor()
+    assert m.base_info_thread is None
+    m.get_base_info()
+    assert m.base_info_thread is None
+
+    wmi.gate.clear()
+    m.base_info_time -= monitor.__base_info_refresh__ + 60
+    assert m.get_base_info()['cpu_name'] == 'Cached CPU'
+    wmi.gate.set()
+    wait_base_info(m)
+    assert m.get_base_info()['cpu_name'] == 'Fake CPU 1'
+    assert len(wmi) == 1
+
+
+def test_sample_loop_refreshes_once_cache_expires(wmi, monkeypatch):
+    write_cache(0, cpu_name='Cached CPU')
+    m = monitor.Monitor()
+    monkeypatch.setattr(m, 'sample', lambda: m.sample_stop.set())
+    m.base_info_time -= monitor.__base_info_refresh__ + 60
+    m.sample_loop(0)
+    wait_base_info(m)
+    assert m.host_info['cpu_name'] == 'Fake CPU 1'
+
+
+def test_refresh_does_not_start_a_second_thread(wmi):
+    wmi.gate.clear()
+    m = monitor.Monitor()
+    first = m.base_info_thread
+    m.base_info_time = None
+    m.get_base_info()
+    assert m.base_info_thread is first
+    wmi.gate.set()
+    wait_base_info(m)
+    assert len(wmi) == 1
+
+
+def test_when_base_info_ready_runs_callback_after_collect(wmi):
+    wmi.gate.clear()
+    m = monitor.Monitor()
+    assert 'cpu_name' not in m.get_base_info()
+    seen = []
+    assert m.when_base_info_ready(lambda: seen.append(m.get_base_info()['cpu_name']))
+    assert seen == []
+    wmi.gate.set()
+    wait_base_info(m)
+    assert seen == ['Fake CPU 1']
+    assert m.when_base_info_ready(lambda: seen.append('again')) is False
+    assert seen == ['Fake CPU 1']
+
+
+def test_failing_callback_does_not_block_the_others(wmi):
+    wmi.gate.clear()
+    m = monitor.Monitor()
+    seen = []
+    m.when_base_info_ready(lambda: 1 / 0)
+    m.when_base_info_ready(lambda: seen.append(True))
+    wmi.gate.set()
+    wait_base_info(m)
+    assert seen == [True]
@@ -0,0 +1,82 @@
+import types
+
+import pytest
+
+import metrics
+from EDGE import printer
+
+
+class FakeDriver(object):
+    def __init__(self, pin_error=None):
+        self.command_executor = types.SimpleNamespace(on_unreachable=None)
+        self.pin_error = pin_error
+        self.quit_calls = 0
+
+    def pin_script(self, script, key):
+        if self.pin_error is not None:
+            raise self.pin_error
+
+    def quit(self):
+        self.quit_calls += 1
+
+
+def test_setup_driver_counts_browser():
+    before = metrics.browsers_active.values[()]
+    driver = printer.setup_driver(FakeDriver())
+    assert metrics.browsers_active.values[()] == before + 1
+    assert driver.command_executor.on_unreachable is printer.on_driver_unreachable
+    metrics.browsers_active.dec()
+
+
+def test_setup_driver_quits_browser_when_pin_fails():
+    before = metrics.browsers_active.values[()]
+    driver = FakeDriver(pin_error=RuntimeError('no session'))
+    with pytest.raises(RuntimeError):
+        printer.setup_driver(driver)
+    assert driver.quit_calls == 1
+    assert metrics.browsers_active.values[()] == before
+
+
+def test_shutdown_quits_kept_browser(monkeypatch):
+    driver = FakeDriver()
+    metrics.browsers_active.inc()
+    before = metrics.browsers_active.values[()]
+    monkeypatch.setattr(printer, 'kept_driver', driver)
+    printer.shutdown()
+    assert driver.quit_calls == 1
+    assert printer.kept_driver is None
+    assert metrics.browsers_active.values[()] == before - 1
+    printer.shutdown()
+    assert driver.quit_calls == 1
+
+
+def test_printer_check_attaches_to_kept_browser(monkeypatch):
+    attached = FakeDriver()
+    attached.current_url = 'about:blank'
+    monkeypatch.setattr(printer, 'reuse_browser', True)
+    monkeypatch.setattr(printer, 'kept_driver', None)
+    monkeypatch.setattr(printer, 'attach_driver', lambda: attached)
+    monkeypatch.setattr(printer, 'new_driver', lambda: pytest.fail('started a new browser'))
+    assert printer.printer_check()
+    assert printer.kept_driver is attached
+    assert attached.quit_calls == 0
+
+
+def test_printer_check_starts_browser_without_saved_session(monkeypatch):
+    started = []
+
+    def new_driver():
+        driver = FakeDriver()
+        driver.maximize_window = driver.set_page_load_timeout = driver.set_script_timeout = \
+            driver.implicitly_wait = lambda *args: None
+        started.append(driver)
+        return driver
+    monkeypatch.setattr(printer, 'reuse_browser', True)
+    monkeypatch.setattr(printer, 'kept_driver', None)
+    monkeypatch.setattr(printer, 'attach_driver', lambda: None)
+    monkeypatch.setattr(printer, 'new_driver', new_driver)
+    monkeypatch.setattr(printer.web.EDGE, 'discard_state', staticmethod(lambda path: None))
+    metrics.browsers_active.inc()
+    assert printer.printer_check()
+    assert len(started) == 1 and started[0].quit_calls == 1
+    assert printer.kept_driver is None
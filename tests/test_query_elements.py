@@ -0,0 +1,78 @@
+import pytest
+
+from EDGE.common.exceptions import InvalidArgumentException
+from EDGE.web.remote.command import Command
+from EDGE.web.remote.marshalling import ELEMENT_KEY
+from EDGE.web.remote.webdriver import WebDriver, _QUERY_ELEMENTS_JS
+
+
+class QueryExecutor(object):
+    """ Answers the query script the way the page would: one column per field, one value per element."""
+    def __init__(self):
+        self.calls = []
+
+    def execute(self, command, params):
+        assert command == Command.W3C_EXECUTE_SCRIPT
+        self.calls.append(params)
+        elements, fields = params['args']
+        ids = [element[ELEMENT_KEY] for element in elements]
+        return {'value': {field: ['%s@%s' % (field, id_) for id_ in ids] for field in fields}}
+
+
+def _driver():
+    executor = QueryExecutor()
+    return WebDriver._attached(executor, 'session', {}), executor
+
+
+def test_query_elements_sends_one_script_with_elements_and_fields():
+    driver, executor = _driver()
+    first, second = driver.create_web_element('a'), driver.create_web_element('b')
+    result = driver.query_elements([first, second], ('text', 'attribute:href'))
+    assert len(executor.calls) == 1
+    assert executor.calls[0]['script'] == _QUERY_ELEMENTS_JS
+    assert executor.calls[0]['args'] == [[{ELEMENT_KEY: 'a'}, {ELEMENT_KEY: 'b'}],
+                                         ['text', 'attribute:href']]
+    # one column per field, values in the order of the elements
+    assert result == {'text': ['text@a', 'text@b'],
+                      'attribute:href': ['attribute:href@a', 'attribute:href@b']}
+
+
+def test_query_elements_accepts_generators():
+    driver, executor = _driver()
+    elements = (driver.create_web_element(id_) for id_ in 'xyz')
+    result = driver.query_elements(elements, iter(['tag_name', 'rect']))
+    assert result == {'tag_name': ['tag_name@x', 'tag_name@y', 'tag_name@z'],
+                      'rect': ['rect@x', 'rect@y', 'rect@z']}
+
+
+def test_query_elements_without_elements_or_fields_sends_nothing():
+    driver, executor = _driver()
+    assert driver.query_elements([], ['text', 'property:value']) == {'text': [], 'property:value': []}
+    assert driver.query_elements([driver.create_web_element('a')], []) == {}
+    assert executor.calls == []
+
+
+@pytest.mark.parametrize('field', ['innerText', 'attr:href', 'Text', ''])
+def test_query_elements_rejects_unknown_fields(field):
+    driver, executor = _driver()
+    with pytest.raises(InvalidArgumentException):
+        driver.query_elements([driver.create_web_element('a')], ['text', field])
+    # validated even when there is nothing to read
+    with pytest.raises(InvalidArgumentException):
+        driver.query_elements([], [field])
+    assert executor.calls == []
+
+
+def test_element_query_returns_one_value_per_field():
+    driver, executor = _driver()
+    element = driver.create_web_element('a')
+    assert element.query(['text', 'property:checked']) == {'text': 'text@a',
+                                                           'property:checked': 'property:checked@a'}
+    assert executor.calls[0]['args'] == [[{ELEMENT_KEY: 'a'}], ['text', 'property:checked']]
+
+
+def test_element_query_validates_fields():
+    driver, executor = _driver()
+    with pytest.raises(InvalidArgumentException):
+        driver.create_web_element('a').query(['value'])
+    assert executor.calls == []
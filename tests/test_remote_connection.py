@@ -0,0 +1,115 @@
+import asyncio
+import socket
+import string
+import threading
+import time
+
+import pytest
+
+from EDGE.common.exceptions import DriverUnreachableException
+from EDGE.web.remote.async_webdriver import AsyncRemoteConnection
+from EDGE.web.remote.command import Command
+from EDGE.web.remote.remote_connection import LAST_RESPONSE, RemoteConnection
+
+
+def _template_url(base, path, params):
+    # the per-command string.Template substitution the compiled routes replaced
+    return base + string.Template(path).substitute(params)
+
+
+def _names(path):
+    pattern = string.Template.pattern
+    return [m.group('named') or m.group('braced') for m in pattern.finditer(path)
+            if m.group('named') or m.group('braced')]
+
+
+def test_compiled_routes_match_string_template():
+    conn = RemoteConnection('http://127.0.0.1:9515', keep_alive=False)
+    assert len(conn._commands) > 100
+    for command, (method, path) in conn._commands.items():
+        params = {name: 'v-%s-{x}' % name for name in _names(path)}
+        params['sessionId'] = 'abc123'
+        params['extra'] = 1
+        expected = _template_url(conn._url, path, params)
+        got_method, url, body = conn._prepare(command, dict(params))
+        assert (got_method, url) == (method, expected), command
+        assert b'sessionId' not in body
+
+
+def test_route_recompiled_when_command_replaced():
+    conn = RemoteConnection('http://127.0.0.1:9515/{base}', keep_alive=False)
+    command = next(iter(conn._commands))
+    conn._commands[command] = ('POST', '/session/$sessionId/custom/${name}x')
+    method, url, body = conn._prepare(command, {'sessionId': 's', 'name': 'n'})
+    assert (method, url) == ('POST', 'http://127.0.0.1:9515/{base}/session/s/custom/nx')
+    conn._commands[command] = ('GET', '/other')
+    assert conn._prepare(command, {})[:2] == ('GET', 'http://127.0.0.1:9515/{base}/other')
+
+
+def _hung_service():
+    # accepts connections (the kernel completes the handshake) but never answers
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(8)
+    return sock, 'http://127.0.0.1:%d' % sock.getsockname()[1]
+
+
+@pytest.mark.parametrize('keep_alive', [True, False])
+def test_hung_driver_times_out_and_opens_breaker(monkeypatch, keep_alive):
+    monkeypatch.setattr(RemoteConnection, 'read_timeout', 0.3)
+    sock, url = _hung_service()
+    try:
+        conn = RemoteConnection(url, keep_alive=keep_alive)
+        started = time.time()
+        with pytest.raises(DriverUnreachableException):
+            conn.execute(Command.STATUS, {})
+        assert time.time() - started < 3
+        assert conn.breaker_open
+        started = time.time()
+        with pytest.raises(DriverUnreachableException):
+            conn.execute(Command.STATUS, {})
+        assert time.time() - started < 0.1
+    finally:
+        sock.close()
+
+
+def test_async_hung_driver_times_out_and_opens_breaker(monkeypatch):
+    monkeypatch.setattr(RemoteConnection, 'read_timeout', 0.3)
+    sock, url = _hung_service()
+
+    async def run():
+        conn = AsyncRemoteConnection(url)
+        try:
+            with pytest.raises(DriverUnreachableException):
+                await conn.execute(Command.STATUS, {})
+            assert conn.breaker_open
+        finally:
+            await conn.close()
+    try:
+        asyncio.run(run())
+    finally:
+        sock.close()
+
+
+def test_response_sizes_do_not_mix_between_threads():
+    sizes = {Command.STATUS: 10, Command.GET_ALL_SESSIONS: 20000}
+    release = threading.Barrier(2)
+
+    class SlowConnection(RemoteConnection):
+        def _request(self, method, url, body=None):
+            command = Command.STATUS if url.endswith('/status') else Command.GET_ALL_SESSIONS
+            LAST_RESPONSE.set((200, sizes[command]))
+            # both commands have a response before either is recorded
+            release.wait(2)
+            return {'status': 0, 'value': None}
+
+    conn = SlowConnection('http://127.0.0.1:9515', keep_alive=False)
+    recorded = []
+    conn.stats.record = lambda command, seconds, request_bytes, response_bytes, error: \
+        recorded.append((command, response_bytes))
+    threads = [threading.Thread(target=conn.execute, args=(command, {})) for command in sizes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(recorded) == sorted(sizes.items())
@@ -0,0 +1,86 @@
+import struct
+
+import report_codec
+
+
+REPORT = {
+    'time': 1700000000,
+    'cpu': {'average': 12.5, 'per': [10.0, 15.25, 0.0, 100.0]},
+    'memory': {
+        'virtual': {'total': 17179869184, 'available': 8589934592, 'percent': 50.0, 'used': 8589934592,
+                    'free': 4294967296, 'active': 123456789, 'inactive': 987654321, 'buffers': 1024,
+                    'cached': 2048, 'shared': 4096, 'slab': 8192},
+        'swap': {'total': 2147483648, 'used': 1073741824, 'free': 1073741824, 'percent': 50.0,
+                 'sin': 12345, 'sout': 67890},
+    },
+    'net_io': {'sent_speed': 1000, 'recv_speed': 2000},
+}
+
+PCINFO = {'system': 'Windows', 'architecture': ['64bit', 'WindowsPE'], 'cpu_cores': 8,
+          'user': 'kk', 'cpu_name': 'Intel(R) Core(TM) i5', 'disk_caption': '硬盘 512G'}
+
+
+def _subset(expected, actual):
+    for key, value in expected.items():
+        if isinstance(value, dict):
+            _subset(value, actual[key])
+        else:
+            assert actual[key] == value, key
+
+
+def _schema_subset(schema, data):
+    out = {}
+    for field_id, path, kind in schema:
+        value = report_codec._lookup(data, path)
+        if value is None:
+            continue
+        target = out
+        for key in path[:-1]:
+            target = target.setdefault(key, {})
+        target[path[-1]] = value
+    return out
+
+
+def test_report_roundtrip_keeps_platform_memory_fields():
+    kind, data = report_codec.decode(report_codec.encode_report(REPORT))
+    assert kind == report_codec.KIND_REPORT
+    _subset(_schema_subset(report_codec.REPORT_SCHEMA, REPORT), data)
+    assert data['memory']['swap']['sin'] == 12345
+    assert data['memory']['virtual']['cached'] == 2048
+
+
+def test_pcinfo_roundtrip():
+    kind, data = report_codec.decode(report_codec.encode_pcinfo(PCINFO))
+    assert kind == report_codec.KIND_PCINFO
+    _subset(_schema_subset(report_codec.PCINFO_SCHEMA, PCINFO), data)
+
+
+def test_unknown_fields_are_skipped():
+    buf = report_codec.encode_report(REPORT)
+    header = report_codec._header.size
+    extra = struct.pack('<BH', 250, 3) + b'xyz'
+    buf = buf[:header] + extra + buf[header:] + extra
+    kind, data = report_codec.decode(buf)
+    assert data['cpu']['average'] == 12.5
+    assert data['net_io']['recv_speed'] == 2000
+
+
+def test_truncated_field_raises():
+    buf = report_codec.encode_report(REPORT)
+    try:
+        report_codec.decode(buf[:-1])
+    except (ValueError, struct.error):
+        pass
+    else:
+        raise AssertionError('truncated buffer decoded')
+
+
+def test_other_versions_are_rejected():
+    buf = report_codec.encode_report(REPORT)
+    for version in (1, report_codec.__version__ + 1):
+        try:
+            report_codec.decode(buf[:2] + bytes([version]) + buf[3:])
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('version %d decoded' % version)